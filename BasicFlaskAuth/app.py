@@ -1,8 +1,9 @@
 from flask import Flask, request, abort
-import json
+import os
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+from fsnd_common.jwks import JWKSCache, jwks_source
+from fsnd_common.tokens import VerifiedTokenCache
 
 
 app = Flask(__name__)
@@ -11,6 +12,14 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# the signing keys, fetched once and refreshed in the background (see fsnd_common/jwks.py in projects/common).
+# JWKS_URL can point at a local file or a stub server for testing
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+jwks_cache = JWKSCache(jwks_source(JWKS_URL))
+# verified tokens, so the same bearer token isn't RS256 verified again on every request (see fsnd_common/tokens.py)
+token_cache = VerifiedTokenCache(
+    max_entries=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -52,25 +61,14 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_cache.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -109,10 +107,13 @@ def requires_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
-        try:
-            payload = verify_decode_jwt(token)
-        except:
-            abort(401)
+        verified = token_cache.get(token)
+        if verified is None:
+            try:
+                verified = token_cache.set(token, verify_decode_jwt(token))
+            except:
+                abort(401)
+        payload = verified[0]
         return f(payload, *args, **kwargs)
 
     return wrapper
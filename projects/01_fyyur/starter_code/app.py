@@ -3,17 +3,28 @@
 #----------------------------------------------------------------------------#
 
 import json
+import click
 import dateutil.parser
 import babel
+import babel.dates
+import functools
+import heapq
 from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, func, tuple_
+from sqlalchemy.exc import IntegrityError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from search import NgramIndex
+from cache import createCache
+from flask_sqlalchemy import SQLAlchemy
+from fsnd_common.dbpool import configure_pool, pool_metrics, pool_stats
+from fsnd_common.querystats import init_query_stats
+from fsnd_common.metrics import init_metrics
 from flask_migrate import Migrate
-from datetime import date
+from datetime import date, datetime
 import sys
 
 #----------------------------------------------------------------------------#
@@ -23,7 +34,13 @@ import sys
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+# the connection pool is set up from the DB_POOL_* settings, see fsnd_common/dbpool.py
+configure_pool(app)
 db = SQLAlchemy(app)
+# queries per request in the Server-Timing header, the slower than SLOW_QUERY_MS ones logged
+init_query_stats(app)
+# latency, status, db and template time per route at /metrics, in the prometheus text format
+metrics = init_metrics(app, series=lambda: pool_metrics(db.engine))
 migrate = Migrate(app, db)
 # TODO: connect to a local postgresql database
 
@@ -31,6 +48,33 @@ migrate = Migrate(app, db)
 # Models.
 #----------------------------------------------------------------------------#
 
+# many to many links between venues/artists and genres, the primary keys serve reading the genres of
+# one venue or artist and the (genre_id, ...) indexes serve filtering the listings by genre.
+# position is the place of the genre in the comma-joined genres column the link was migrated from
+# (see migrations/versions/c3a85f1e7d42), the links made by the app leave it empty.
+venue_genres = db.Table('venue_genres',
+                        db.Column('venue_id', db.Integer, db.ForeignKey(
+                            'venues.id'), primary_key=True),
+                        db.Column('genre_id', db.Integer, db.ForeignKey(
+                            'genres.id'), primary_key=True),
+                        db.Column('position', db.Integer),
+                        db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table('artist_genres',
+                         db.Column('artist_id', db.Integer, db.ForeignKey(
+                             'artists.id'), primary_key=True),
+                         db.Column('genre_id', db.Integer, db.ForeignKey(
+                             'genres.id'), primary_key=True),
+                         db.Column('position', db.Integer),
+                         db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'))
+
+
+class Genre(db.Model):
+    __tablename__ = 'genres'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
 
 class Venue(db.Model):
     __tablename__ = 'venues'
@@ -46,7 +90,8 @@ class Venue(db.Model):
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
-    genres = db.Column(db.String)
+    genres = db.relationship(
+        "Genre", secondary=venue_genres, lazy=True, order_by=Genre.name)
     website = db.Column(db.String)
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String)
@@ -55,6 +100,18 @@ class Venue(db.Model):
                             lazy=True, cascade="all, delete-orphan")
     # Show.venue() should return an artist object
 
+    # denormalized show counters so listings don't have to count the shows table, see adjustShowCounters.
+    # a show counts as upcoming while its start_time is after show_counts_at, the rollover-show-counters
+    # command moves shows that started since then to past_shows_count.
+    upcoming_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    # show_counts_at is always set from the app's clock (naive local time, like start_time and the rollover),
+    # the database's now() would be UTC on sqlite and in the session time zone on postgres.
+    show_counts_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.now)
+
 
 class Artist(db.Model):
     __tablename__ = 'artists'
@@ -64,7 +121,8 @@ class Artist(db.Model):
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.String(120), nullable=False)
+    genres = db.relationship(
+        "Genre", secondary=artist_genres, lazy=True, order_by=Genre.name)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
@@ -74,6 +132,14 @@ class Artist(db.Model):
     seeking_description = db.Column(db.String)
     shows = db.relationship("Show", backref="artist", lazy=True)
 
+    # same denormalized show counters as Venue
+    upcoming_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    show_counts_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.now)
+
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
@@ -88,22 +154,135 @@ class Show(db.Model):
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'))
     venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'))
 
+    # the shows of a venue or an artist are always looked up together with a start_time filter or sort
+    # (upcoming vs past shows), see migrations/check_query_plans.py for the queries relying on them.
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # keyset pagination order of the /shows listing
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    )
+
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+# how many formatted (datetime, format, locale) results format_datetime keeps
+DATETIME_FILTER_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=None)
+def datetimePattern(format, locale):
+    # parsing the babel pattern and the locale is most of the cost of a format, do it once per (format, locale)
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+
+@functools.lru_cache(maxsize=DATETIME_FILTER_CACHE_SIZE)
+def formatDatetimeCached(date, format, locale):
+    # pages repeat the same start times a lot (a venue's shows on every artist page...), so results are memoized too
+    pattern, locale = datetimePattern(format, locale)
+    return pattern.apply(date, locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    # the views pass datetimes, strings are still parsed for the callers that have one
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return formatDatetimeCached(value, format, locale)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+
+def searchTexts(name, city, state, genreNames):
+    # what the venue/artist search matches on, "city, state" lets a search for "San Francisco, CA" work too
+    return (name, '%s, %s' % (city, state)) + tuple(genreNames)
+
+
+def entitySearchTexts(entity):
+    return searchTexts(entity.name, entity.city, entity.state, [genre.name for genre in entity.genres])
+
+
+def loadSearchTexts(model, linkColumn):
+    # 2 queries, the genre names of every venue (or artist) and then the venues themselves
+    genreNamesById = {}
+    for id, genreName in db.session.query(linkColumn, Genre.name).select_from(linkColumn.table).join(
+            Genre, Genre.id == linkColumn.table.c.genre_id):
+        genreNamesById.setdefault(id, []).append(genreName)
+
+    rows = db.session.query(model.id, model.name, model.city, model.state)
+    return ((row.id, searchTexts(row.name, row.city, row.state, genreNamesById.get(row.id, ()))) for row in rows)
+
+
+# the rebuilds after SEARCH_INDEX_MAX_AGE run in a background thread, with an app context of their own
+venueSearchIndex = NgramIndex(lambda: loadSearchTexts(
+    Venue, venue_genres.c.venue_id), maxAge=app.config.get('SEARCH_INDEX_MAX_AGE'), context=app.app_context)
+artistSearchIndex = NgramIndex(lambda: loadSearchTexts(
+    Artist, artist_genres.c.artist_id), maxAge=app.config.get('SEARCH_INDEX_MAX_AGE'), context=app.app_context)
+
+# the search pages list the first SEARCH_PAGE_SIZE matches by id, their count is of all of them.
+# below the 999 bound parameters sqlite takes in one statement
+SEARCH_PAGE_SIZE = 100
+
+
+def searchByIndex(model, searchIndex, searchTerm):
+    # returns the number of venues or artists matching searchTerm and the (id, name, upcoming_shows_count)
+    # of the first SEARCH_PAGE_SIZE of them by id. the ids come from the search index, the rows from the db
+    # so ids deleted by another worker drop out
+    foundIds = searchIndex.search(searchTerm)
+    pageIds = heapq.nsmallest(SEARCH_PAGE_SIZE, foundIds)
+    found = db.session.query(model.id, model.name, model.upcoming_shows_count).filter(
+        model.id.in_(pageIds)).order_by(model.id).all() if pageIds else []
+
+    return len(foundIds), found
+
+#----------------------------------------------------------------------------#
+# Cache.
+#----------------------------------------------------------------------------#
+
+# data of the venue and artist pages, keyed by id. see cache.createCache for the CACHE_* config
+pageCache = createCache(app.config)
+
+
+def venueCacheKey(venueId):
+    return 'venue:%d' % int(venueId)
+
+
+def artistCacheKey(artistId):
+    return 'artist:%d' % int(artistId)
+
+
+def venuePageKeys(venueId):
+    # the venue's page and the pages of the artists with shows there, which list the venue's name and image
+    artistIds = db.session.query(Show.artist_id).filter(
+        Show.venue_id == venueId).distinct()
+    return [venueCacheKey(venueId)] + [artistCacheKey(id) for id, in artistIds if id is not None]
+
+
+def artistPageKeys(artistId):
+    venueIds = db.session.query(Show.venue_id).filter(
+        Show.artist_id == artistId).distinct()
+    return [artistCacheKey(artistId)] + [venueCacheKey(id) for id, in venueIds if id is not None]
+
+
+def pageCacheTtl(nextShowTime):
+    # a cached page splits its shows in upcoming and past at the time it was built,
+    # so it has to expire when its next upcoming show starts at the latest
+    ttl = app.config.get('CACHE_TTL', 300)
+    if nextShowTime is not None:
+        ttl = min(ttl, (nextShowTime - datetime.now()).total_seconds())
+    return max(ttl, 0)
+
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -122,11 +301,9 @@ def venues():
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-    # fetch all venues data from db and store in a list of objects
-    allVenues = Venue.query.all()
-
-    # group venues in an array of dictionaries grouped by cities
-    myData = groupByCity(allVenues)
+    # fetch all venues (of the ?genre= genre if given) with their upcoming shows count in one query
+    # and group them by cities
+    myData = groupByCity(genre=request.args.get('genre'))
 
     # data = [{
     #     "city": "San Francisco",
@@ -149,7 +326,7 @@ def venues():
     #         "num_upcoming_shows": 0,
     #     }]
     # }]
-    return render_template('pages/venues.html', areas=myData)
+    return render_template('pages/venues.html', areas=myData, genre=request.args.get('genre'))
 
 
 @ app.route('/venues/search', methods=['POST'])
@@ -157,20 +334,21 @@ def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    foundVenues = db.session.query(Venue.id, Venue.name).filter(
-        Venue.name.ilike('%' + request.form['search_term']+'%')).all()
+    # matches come from the search index (name, city and genres) instead of an ILIKE scan,
+    # upcoming shows come from the venue's own counter so the shows table isn't touched.
+    foundCount, foundVenues = searchByIndex(
+        Venue, venueSearchIndex, request.form['search_term'])
     data = []
 
-    # need to go in a loop to fill the num upcomingshows values as requested.
     for venue in foundVenues:
         data.append({
             "id": venue[0],
             "name": venue[1],
-            "num_upcoming_shows": countNumberOfUpcomingShows(id=venue[0], modelType='venue')
+            "num_upcoming_shows": venue[2]
         })
 
     response = {
-        "count": len(foundVenues),
+        "count": foundCount,
         "data": data
     }
     # response = {
@@ -188,43 +366,30 @@ def search_venues():
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
+    myData = pageCache.get(venueCacheKey(venue_id))
+    if myData is not None:
+        return render_template('pages/show_venue.html', venue=myData)
+
     myData = {}
 
-    venueShowsAndArtists = db.session.query(Venue, Artist.id, Artist.name, Artist.image_link, Show.start_time).outerjoin(
-        Venue.shows).outerjoin(Show.artist).filter(Venue.id == venue_id).all()
+    # the venue itself, then a page of its upcoming and of its past shows and the counts of both.
+    # the rest of the shows are behind the "more shows" links, see venue_shows
+    venueData = Venue.query.get(venue_id)
 
-    if len(venueShowsAndArtists) > 0:
+    if venueData is not None:
 
-        venueData = venueShowsAndArtists[0][0]
         currentTime = datetime.now()
-        upcoming_shows = []
-        past_shows = []
-
-        # if the venue will have or had any shows fill the 2 arrays
-        if venueShowsAndArtists[0][4] != None:
-
-            for venueShows in venueShowsAndArtists:
-                if venueShows.start_time > currentTime:
-
-                    upcoming_shows.append({
-                        "artist_id": venueShows[1],
-                        "artist_name": venueShows[2],
-                        "artist_image_link": venueShows[3],
-                        "start_time": venueShows[4].strftime("%Y-%m-%d %H:%M:%S")
-                    })
-
-                elif venueShows.start_time < currentTime:
-                    past_shows.append({
-                        "artist_id": venueShows[1],
-                        "artist_name": venueShows[2],
-                        "artist_image_link": venueShows[3],
-                        "start_time": venueShows[4].strftime("%Y-%m-%d %H:%M:%S")
-                    })
+        upcoming_shows, upcomingNext = entityShowsPage(
+            Show.venue_id, venue_id, 'upcoming', currentTime)
+        past_shows, pastNext = entityShowsPage(
+            Show.venue_id, venue_id, 'past', currentTime)
+        upcomingCount, pastCount = entityShowCounts(
+            Show.venue_id, venue_id, currentTime)
 
         myData = {
             "id": venueData.id,
             "name": venueData.name,
-            "genres": ListFromString(venueData.genres),
+            "genres": [genre.name for genre in venueData.genres],
             "address": venueData.address,
             "city": venueData.city,
             "state": venueData.state,
@@ -236,11 +401,18 @@ def show_venue(venue_id):
             "image_link": venueData.image_link,
             "past_shows": past_shows,
             "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
+            "past_shows_count": pastCount,
+            "upcoming_shows_count": upcomingCount,
+            "past_shows_next": pastNext and url_for('venue_shows', venue_id=venue_id, when='past', after=pastNext),
+            "upcoming_shows_next": upcomingNext and url_for('venue_shows', venue_id=venue_id, when='upcoming',
+                                                            after=upcomingNext),
 
         }
 
+        nextShowTime = upcoming_shows[0]["start_time"] if upcoming_shows else None
+        pageCache.set(venueCacheKey(venue_id), myData,
+                      ttl=pageCacheTtl(nextShowTime))
+
     # data1 = {
     #     "id": 1,
     #     "name": "The Musical Hop",
@@ -323,6 +495,21 @@ def show_venue(venue_id):
 
     return render_template('pages/show_venue.html', venue=myData)
 
+
+@ app.route('/venues/<int:venue_id>/shows/<any(upcoming, past):when>')
+def venue_shows(venue_id, when):
+    # the "more shows" pages of a venue page, chained by the same ?after=<cursor> as /shows
+    venue = Venue.query.get(venue_id)
+    if venue is None:
+        abort(404)
+
+    shows, nextCursor = entityShowsPage(Show.venue_id, venue_id, when, datetime.now(),
+                                        after=parseShowCursor(request.args.get('after')))
+    nextPage = nextCursor and url_for(
+        'venue_shows', venue_id=venue_id, when=when, after=nextCursor)
+    return render_template('pages/shows.html', shows=shows, next_page=nextPage,
+                           title='%s shows at %s' % (when.capitalize(), venue.name))
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -344,11 +531,12 @@ def create_venue_submission():
         venueData = {}
         try:
 
-            newVenue = Venue(name=request.form['name'], city=request.form['city'], state=request.form['state'], address=request.form['address'], phone=request.form['phone'], genres=','.join(
+            newVenue = Venue(name=request.form['name'], city=request.form['city'], state=request.form['state'], address=request.form['address'], phone=request.form['phone'], genres=genresFromNames(
                 request.form.getlist('genres')), facebook_link=request.form['facebook_link'], image_link=request.form['image_link'])
 
             db.session.add(newVenue)
             db.session.commit()
+            venueSearchIndex.add(newVenue.id, *entitySearchTexts(newVenue))
 
         # TODO: modify data to be the data object returned from db insertion
 
@@ -358,7 +546,7 @@ def create_venue_submission():
             venueData['state'] = newVenue.state
             venueData['address'] = newVenue.address
             venueData['phone'] = newVenue.phone
-            venueData['genres'] = ListFromString(newVenue.genres)
+            venueData['genres'] = [genre.name for genre in newVenue.genres]
             venueData['facebook_link'] = newVenue.facebook_link
             venueData['image_link'] = newVenue.image_link
 
@@ -392,8 +580,15 @@ def delete_venue(venue_id):
 
         #this way let the cascading rules apply, which deletes related shows too.
         venue = Venue.query.filter_by(id=venue_id).first()
+
+        # the cascade takes the shows away from their artists too, so their counters go down with them.
+        for show in venue.shows:
+            adjustShowCounters(Artist, show.artist_id, show.start_time, -1)
+        staleKeys = venuePageKeys(venue.id)
         db.session.delete(venue)
         db.session.commit()
+        venueSearchIndex.remove(int(venue_id))
+        pageCache.delete(*staleKeys)
 
         flash("Venue deleted!")
     except:
@@ -417,7 +612,13 @@ def delete_venue(venue_id):
 @ app.route('/artists')
 def artists():
     # TODO: replace with real data returned from querying the database
-    artistsList = Artist.query.all()
+    # ?genre= limits the list to the artists of that genre, through the artist_genres index
+    genre = request.args.get('genre')
+    artistsQuery = db.session.query(Artist.id, Artist.name)
+    if genre:
+        artistsQuery = artistsQuery.join(artist_genres, artist_genres.c.artist_id == Artist.id).join(
+            Genre, Genre.id == artist_genres.c.genre_id).filter(Genre.name == genre)
+    artistsList = artistsQuery.order_by(Artist.id).all()
     # data = [{
     #     "id": 4,
     #     "name": "Guns N Petals",
@@ -428,7 +629,7 @@ def artists():
     #     "id": 6,
     #     "name": "The Wild Sax Band",
     # }]
-    return render_template('pages/artists.html', artists=artistsList)
+    return render_template('pages/artists.html', artists=artistsList, genre=genre)
 
 
 @ app.route('/artists/search', methods=['POST'])
@@ -437,18 +638,18 @@ def search_artists():
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
-    foundArtists = db.session.query(Artist.id, Artist.name).filter(
-        Artist.name.ilike('%' + request.form['search_term']+'%')).all()
+    foundCount, foundArtists = searchByIndex(
+        Artist, artistSearchIndex, request.form['search_term'])
     data = []
     for artist in foundArtists:
         data.append({
             "id": artist[0],
             "name": artist[1],
-            "num_upcoming_shows": countNumberOfUpcomingShows(id=artist[0], modelType='artist')
+            "num_upcoming_shows": artist[2]
         })
 
     response = {
-        "count": len(foundArtists),
+        "count": foundCount,
         "data": data
     }
 
@@ -466,45 +667,28 @@ def search_artists():
 @ app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
     # shows the venue(artist?) page with the given venue_id(artist_id)
+    myData = pageCache.get(artistCacheKey(artist_id))
+    if myData is not None:
+        return render_template('pages/show_artist.html', artist=myData)
+
     myData = {}
     # TODO: replace with real venue(artist?) data from the venues table, using venue_id
-    ArtistShowsAndVenues = db.session.query(Artist, Venue.id, Venue.name, Venue.image_link, Show.start_time).outerjoin(
-        Artist.shows).outerjoin(Show.venue).filter(Artist.id == artist_id).all()
+    artistData = Artist.query.get(artist_id)
 
+    if artistData is not None:
 
-    if len(ArtistShowsAndVenues) > 0:
-
-
-        artistData = ArtistShowsAndVenues[0][0]
         currentTime = datetime.now()
-        upcoming_shows = []
-        past_shows = []
-
-        # if the venue will have or had any shows fill the 2 arrays otherwise they will be left empty
-        if ArtistShowsAndVenues[0][4] != None:
-
-            for artistShows in ArtistShowsAndVenues:
-                if artistShows.start_time > currentTime:
-
-                    upcoming_shows.append({
-                        "venue_id": artistShows[1],
-                        "venue_name": artistShows[2],
-                        "venue_image_link": artistShows[3],
-                        "start_time": artistShows[4].strftime("%Y-%m-%d %H:%M:%S")
-                    })
-
-                elif artistShows.start_time < currentTime:
-                    past_shows.append({
-                        "venue_id": artistShows[1],
-                        "venue_name": artistShows[2],
-                        "venue_image_link": artistShows[3],
-                        "start_time": artistShows[4].strftime("%Y-%m-%d %H:%M:%S")
-                    })
+        upcoming_shows, upcomingNext = entityShowsPage(
+            Show.artist_id, artist_id, 'upcoming', currentTime)
+        past_shows, pastNext = entityShowsPage(
+            Show.artist_id, artist_id, 'past', currentTime)
+        upcomingCount, pastCount = entityShowCounts(
+            Show.artist_id, artist_id, currentTime)
 
         myData = {
             "id": artistData.id,
             "name": artistData.name,
-            "genres": ListFromString(artistData.genres),
+            "genres": [genre.name for genre in artistData.genres],
             "city": artistData.city,
             "state": artistData.state,
             "phone": artistData.phone,
@@ -515,11 +699,18 @@ def show_artist(artist_id):
             "image_link": artistData.image_link,
             "past_shows": past_shows,
             "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
+            "past_shows_count": pastCount,
+            "upcoming_shows_count": upcomingCount,
+            "past_shows_next": pastNext and url_for('artist_shows', artist_id=artist_id, when='past', after=pastNext),
+            "upcoming_shows_next": upcomingNext and url_for('artist_shows', artist_id=artist_id, when='upcoming',
+                                                            after=upcomingNext),
 
         }
 
+        nextShowTime = upcoming_shows[0]["start_time"] if upcoming_shows else None
+        pageCache.set(artistCacheKey(artist_id), myData,
+                      ttl=pageCacheTtl(nextShowTime))
+
     # data1 = {
     #     "id": 4,
     #     "name": "Guns N Petals",
@@ -590,6 +781,21 @@ def show_artist(artist_id):
     #                    artist_id, [data1, data2, data3]))[0]
     return render_template('pages/show_artist.html', artist=myData)
 
+
+@ app.route('/artists/<int:artist_id>/shows/<any(upcoming, past):when>')
+def artist_shows(artist_id, when):
+    # the "more shows" pages of an artist page
+    artist = Artist.query.get(artist_id)
+    if artist is None:
+        abort(404)
+
+    shows, nextCursor = entityShowsPage(Show.artist_id, artist_id, when, datetime.now(),
+                                        after=parseShowCursor(request.args.get('after')))
+    nextPage = nextCursor and url_for(
+        'artist_shows', artist_id=artist_id, when=when, after=nextCursor)
+    return render_template('pages/shows.html', shows=shows, next_page=nextPage,
+                           title='%s shows of %s' % (when.capitalize(), artist.name))
+
 #  Update
 #  ----------------------------------------------------------------
 
@@ -599,7 +805,8 @@ def edit_artist(artist_id):
     artist = Artist.query.get(artist_id)
 
     # initialize default values for the select fields on the form
-    form = ArtistForm(state=artist.state, genres=ListFromString(artist.genres))
+    form = ArtistForm(state=artist.state, genres=[
+                      genre.name for genre in artist.genres])
     # artist = {
     #     "id": 4,
     #     "name": "Guns N Petals",
@@ -628,10 +835,12 @@ def edit_artist_submission(artist_id):
         artist.city = request.form['city']
         artist.state = request.form['state']
         artist.phone = request.form['phone']
-        artist.genres = ','.join(request.form.getlist('genres'))
+        artist.genres = genresFromNames(request.form.getlist('genres'))
         artist.facebook_link = request.form['facebook_link']
 
         db.session.commit()
+        artistSearchIndex.add(artist.id, *entitySearchTexts(artist))
+        pageCache.delete(*artistPageKeys(artist_id))
         flash('Edited!')
     except:
         db.session.rollback()
@@ -648,7 +857,8 @@ def edit_artist_submission(artist_id):
 def edit_venue(venue_id):
     venue = Venue.query.get(venue_id)
     # initialize default values
-    form = VenueForm(state=venue.state, genres=ListFromString(venue.genres))
+    form = VenueForm(state=venue.state, genres=[
+                     genre.name for genre in venue.genres])
     # venue = {
     #     "id": 1,
     #     "name": "The Musical Hop",
@@ -676,10 +886,12 @@ def edit_venue_submission(venue_id):
         venue.state = request.form['state']
         venue.address = request.form['address']
         venue.phone = request.form['phone']
-        venue.genres = ','.join(request.form.getlist('genres'))
+        venue.genres = genresFromNames(request.form.getlist('genres'))
         venue.facebook_link = request.form['facebook_link']
 
         db.session.commit()
+        venueSearchIndex.add(venue.id, *entitySearchTexts(venue))
+        pageCache.delete(*venuePageKeys(venue_id))
         flash('Edited!')
     except:
         db.session.rollback()
@@ -712,11 +924,12 @@ def create_artist_submission():
         artistData = {}
         try:
 
-            newArtist = Artist(name=request.form['name'], city=request.form['city'], state=request.form['state'], phone=request.form['phone'], genres=','.join(
+            newArtist = Artist(name=request.form['name'], city=request.form['city'], state=request.form['state'], phone=request.form['phone'], genres=genresFromNames(
                 request.form.getlist('genres')), facebook_link=request.form['facebook_link'], image_link=request.form['image_link'])
 
             db.session.add(newArtist)
             db.session.commit()
+            artistSearchIndex.add(newArtist.id, *entitySearchTexts(newArtist))
 
         #   for the response object
 
@@ -725,7 +938,7 @@ def create_artist_submission():
             artistData['city'] = newArtist.city
             artistData['state'] = newArtist.state
             artistData['phone'] = newArtist.phone
-            artistData['genres'] = ListFromString(newArtist.genres)
+            artistData['genres'] = [genre.name for genre in newArtist.genres]
             artistData['facebook_link'] = newArtist.facebook_link
             artistData['image_link'] = newArtist.image_link
 
@@ -753,22 +966,77 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 
+SHOWS_PAGE_SIZE = 30
+SHOWS_MAX_PAGE_SIZE = 100
+SHOWS_CURSOR_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+# shows per list on a venue/artist page and per page of its "more shows" pages
+ENTITY_SHOWS_PAGE_SIZE = 10
+
+
 @ app.route('/shows')
 def shows():
     # displays list of shows at /shows
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-    shows = Show.query.all()
+    # one page of shows ordered by (start_time, id), with the venue and artist columns the template needs
+    # joined in the same query. pages are chained by keyset (?after=<cursor of the last show of the
+    # previous page>) rather than OFFSET, so a page costs the same however deep it is.
+    # optional filters: start and end (start <= start_time < end), venue_id and artist_id.
+    # ?limit= is kept between 1 and SHOWS_MAX_PAGE_SIZE, 0 or a negative one would reach the LIMIT clause
+    limit = max(1, min(request.args.get('limit', SHOWS_PAGE_SIZE,
+                                        type=int), SHOWS_MAX_PAGE_SIZE))
+    showsQuery = db.session.query(Show.id, Show.start_time, Show.venue_id, Venue.name, Show.artist_id, Artist.name,
+                                  Artist.image_link).join(Venue, Venue.id == Show.venue_id).join(
+        Artist, Artist.id == Show.artist_id).filter(Show.start_time != None)
+
+    # the filters are kept as given so the next page link can carry them along
+    filters = {}
+    for name, column in (('venue_id', Show.venue_id), ('artist_id', Show.artist_id)):
+        value = request.args.get(name, type=int)
+        if value is not None:
+            filters[name] = value
+            showsQuery = showsQuery.filter(column == value)
+
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        if value:
+            try:
+                time = dateutil.parser.parse(value)
+            except (ValueError, OverflowError):
+                abort(400)
+            filters[name] = value
+            if name == 'start':
+                showsQuery = showsQuery.filter(Show.start_time >= time)
+            else:
+                showsQuery = showsQuery.filter(Show.start_time < time)
+
+    after = parseShowCursor(request.args.get('after'))
+    if after:
+        showsQuery = showsQuery.filter(
+            tuple_(Show.start_time, Show.id) > tuple_(*after))
+
+    # one extra row tells if there is a next page
+    shows = showsQuery.order_by(
+        Show.start_time, Show.id).limit(limit + 1).all()
+    nextPage = None
+    if len(shows) > limit:
+        shows = shows[:limit]
+        lastShow = shows[-1]
+        if 'limit' in request.args:
+            filters['limit'] = limit
+        nextPage = url_for('shows', after=showCursor(
+            lastShow.start_time, lastShow.id), **filters)
+
     myData = []
-    for show in shows:
+    for showId, startTime, venueId, venueName, artistId, artistName, artistImageLink in shows:
         myData.append({
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
+            "venue_id": venueId,
+            "venue_name": venueName,
+            "artist_id": artistId,
+            "artist_name": artistName,
+            "artist_image_link": artistImageLink,
+            "start_time": startTime
         })
 
     # data = [{
@@ -807,7 +1075,7 @@ def shows():
     #     "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
     #     "start_time": "2035-04-15T20:00:00.000Z"
     # }]
-    return render_template('pages/shows.html', shows=myData)
+    return render_template('pages/shows.html', shows=myData, next_page=nextPage)
 
 
 @ app.route('/shows/create')
@@ -822,10 +1090,17 @@ def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead
     try:
+        startTime = dateutil.parser.parse(request.form['start_time'])
         newShow = Show(artist_id=request.form['artist_id'],
-                       venue_id=request.form['venue_id'], start_time=request.form['start_time'])
+                       venue_id=request.form['venue_id'], start_time=startTime)
         db.session.add(newShow)
+
+        # the counters are updated in the same transaction as the insert
+        adjustShowCounters(Venue, request.form['venue_id'], startTime, 1)
+        adjustShowCounters(Artist, request.form['artist_id'], startTime, 1)
         db.session.commit()
+        pageCache.delete(venueCacheKey(
+            request.form['venue_id']), artistCacheKey(request.form['artist_id']))
         flash('Show successfully listed!')
 
     except:
@@ -839,6 +1114,18 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+@ app.route('/cache/stats')
+def cache_stats():
+    # hit/miss counters of the venue and artist page cache
+    return jsonify(pageCache.stats())
+
+
+@ app.route('/db/stats')
+def db_stats():
+    # connection pool counters of this process, a growing wait time means the pool is too small
+    return jsonify(pool_stats(db.engine))
+
+
 @ app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -849,79 +1136,224 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-def groupByCity(venues):
-    # create an empty list of dictionaries for the grouped data
-    groupedVenues = []
+def groupByCity(genre=None):
+    # one query for every venue and its upcoming shows counter, the shows table isn't touched at all.
+    # with a genre only its venues are listed, joined through the venue_genres (genre_id, venue_id) index.
+    venuesQuery = db.session.query(Venue.id, Venue.name, Venue.city,
+                                   Venue.state, Venue.upcoming_shows_count)
+    if genre:
+        venuesQuery = venuesQuery.join(venue_genres, venue_genres.c.venue_id == Venue.id).join(
+            Genre, Genre.id == venue_genres.c.genre_id).filter(Genre.name == genre)
+    venuesWithCounts = venuesQuery.order_by(
+        Venue.state, Venue.city, Venue.id).all()
+
+    # areas keyed by (state, city) so 2 cities with the same name but from different states don't count as the same
+    groupedVenues = {}
+    for venueId, name, city, state, upcomingCount in venuesWithCounts:
+        area = groupedVenues.get((state, city))
+        if area is None:
+            area = groupedVenues[(state, city)] = {
+                "city": city,
+                "state": state,
+                "venues": []
+            }
+
+        area["venues"].append({
+            "id": venueId,
+            "name": name,
+            "num_upcoming_shows": upcomingCount
+        })
 
-    # loop through the venues objects and check the state and city values.
-    for venue in venues:
+    return list(groupedVenues.values())
 
-        # if list is still fresh
-        if len(groupedVenues) == 0:
-            groupedVenues.append(buildNewVenueData(venue))
-            continue
 
-        stateExist = False
-        cityExist = False
+def showCursor(startTime, showId):
+    # keyset cursor of a show in a (start_time, id) ordered list
+    return '%s_%d' % (startTime.strftime(SHOWS_CURSOR_FORMAT), showId)
 
-        for groupedVenue in groupedVenues:
-            # if state and city already exist in the groupedList then add the new venue then break.
-            if groupedVenue["state"] == venue.state:
-                stateExist = True
 
-                if groupedVenue["city"] == venue.city:
-                    cityExist = True
-                    groupedVenue["venues"].append({
-                        "id": venue.id,
-                        "name": venue.name,
-                        "num_upcoming_shows": countNumberOfUpcomingShows(id=venue.id, modelType='artist')
-                    })
+def parseShowCursor(cursor):
+    # (start_time, id) of a showCursor, None without one. a malformed cursor is a bad request
+    if not cursor:
+        return None
+    try:
+        startTime, showId = cursor.rsplit('_', 1)
+        return datetime.strptime(startTime, SHOWS_CURSOR_FORMAT), int(showId)
+    except ValueError:
+        abort(400)
+
+
+def entityShowsPage(entityColumn, entityId, when, currentTime, after=None, limit=None):
+    # one page of the upcoming shows (soonest first) or past shows (latest first) of a venue
+    # (entityColumn = Show.venue_id) or an artist (Show.artist_id), after the (start_time, id) cursor after.
+    # both the venue and the artist columns are joined in, so the rows fit show_venue/show_artist and shows.html.
+    # returns the rows and the cursor of the next page, None if this is the last one
+    limit = limit or ENTITY_SHOWS_PAGE_SIZE
+    showsQuery = db.session.query(Show.id, Show.start_time, Show.venue_id, Venue.name, Venue.image_link,
+                                  Show.artist_id, Artist.name, Artist.image_link).join(
+        Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id).filter(entityColumn == entityId)
+
+    if when == 'upcoming':
+        showsQuery = showsQuery.filter(Show.start_time > currentTime)
+        if after:
+            showsQuery = showsQuery.filter(
+                tuple_(Show.start_time, Show.id) > tuple_(*after))
+        showsQuery = showsQuery.order_by(Show.start_time, Show.id)
+    else:
+        showsQuery = showsQuery.filter(Show.start_time <= currentTime)
+        if after:
+            showsQuery = showsQuery.filter(
+                tuple_(Show.start_time, Show.id) < tuple_(*after))
+        showsQuery = showsQuery.order_by(
+            Show.start_time.desc(), Show.id.desc())
+
+    # one extra row tells if there is a next page
+    shows = showsQuery.limit(limit + 1).all()
+    nextCursor = None
+    if len(shows) > limit:
+        shows = shows[:limit]
+        nextCursor = showCursor(shows[-1].start_time, shows[-1].id)
 
-                    break
+    myData = []
+    for showId, startTime, venueId, venueName, venueImageLink, artistId, artistName, artistImageLink in shows:
+        myData.append({
+            "venue_id": venueId,
+            "venue_name": venueName,
+            "venue_image_link": venueImageLink,
+            "artist_id": artistId,
+            "artist_name": artistName,
+            "artist_image_link": artistImageLink,
+            "start_time": startTime
+        })
+    return myData, nextCursor
 
-        # if state or city don't exist in the grouped dic then it gets added a new record
-        # this ensures if 2 cities have the same name but from different states they don't count as the same
-        if stateExist == False or cityExist == False:
-            groupedVenues.append(buildNewVenueData(venue))
 
-    return groupedVenues
+def entityShowCounts(entityColumn, entityId, currentTime):
+    # (upcoming, past) show counts of a venue or an artist, both counted on its (venue_id/artist_id, start_time) index
+    showsQuery = db.session.query(func.count(Show.id)).filter(
+        entityColumn == entityId)
+    return (showsQuery.filter(Show.start_time > currentTime).scalar(),
+            showsQuery.filter(Show.start_time <= currentTime).scalar())
 
 
-def countNumberOfUpcomingShows(id, modelType):
+def adjustShowCounters(model, id, startTime, delta):
 
-    # count show events that have a date in the future for venue or artist
+    # adds delta to the upcoming or the past shows counter of a venue or artist for a show starting at startTime.
+    # the update is done in sql (counter = counter + delta) so concurrent submissions don't overwrite each other,
+    # and the show counts as upcoming if it starts after the entity's last rollover, like rolloverShowCounters expects.
+    db.session.query(model).filter(model.id == id, model.show_counts_at < startTime).update(
+        {model.upcoming_shows_count: model.upcoming_shows_count + delta}, synchronize_session=False)
+    db.session.query(model).filter(model.id == id, model.show_counts_at >= startTime).update(
+        {model.past_shows_count: model.past_shows_count + delta}, synchronize_session=False)
 
-    currentTime = datetime.now()
-    count = 0
-    if modelType == 'venue':
-        count = Show.query.filter(
-            Show.venue_id == id, Show.start_time > currentTime).count()
-    else:
-        count = Show.query.filter(
-            Show.artist_id == id, Show.start_time > currentTime).count()
 
-    return count
+def rolloverShowCounters(currentTime=None):
 
+    # moves the shows that started since the last rollover from the upcoming to the past counters.
+    # meant to run periodically (flask rollover-show-counters from cron), listings lag behind by at most one period.
+    # returns the number of venues and artists whose counters changed.
+    if currentTime is None:
+        currentTime = datetime.now()
+
+    changed = 0
+    for model, idColumn in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        # the rows are locked before the shows get counted, venues before artists like a show submission takes
+        # them (and in id order against another rollover). a submission that got there first is committed by the
+        # time the count runs so its show is counted, one that comes after waits and counts its show as past.
+        db.session.query(model.id).filter(model.show_counts_at < currentTime).order_by(
+            model.id).with_for_update().all()
+        startedShows = db.session.query(idColumn, func.count(Show.id)).join(model, model.id == idColumn).filter(
+            Show.start_time > model.show_counts_at, Show.start_time <= currentTime).group_by(idColumn).all()
+
+        if len(startedShows) > 0:
+            table = model.__table__
+            db.session.execute(table.update().where(table.c.id == bindparam('entity_id')).values(
+                upcoming_shows_count=table.c.upcoming_shows_count - bindparam('started'),
+                past_shows_count=table.c.past_shows_count + bindparam('started')),
+                [{"entity_id": id, "started": count} for id, count in startedShows])
+
+        db.session.query(model).filter(model.show_counts_at < currentTime).update(
+            {model.show_counts_at: currentTime}, synchronize_session=False)
+        changed += len(startedShows)
+
+    db.session.commit()
+    return changed
+
+
+def checkShowCounters(fix=False):
+
+    # recounts the shows of every venue and artist and compares them with the counters.
+    # returns a list of (model name, id, (upcoming, past) stored, (upcoming, past) counted) for the mismatches,
+    # with fix=True the counters get overwritten with the counted values.
+    mismatches = []
+    for model, idColumn in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        countedShows = db.session.query(idColumn, func.count(Show.id)).join(model, model.id == idColumn).group_by(idColumn)
+        upcoming = dict(countedShows.filter(
+            Show.start_time > model.show_counts_at).all())
+        past = dict(countedShows.filter(
+            Show.start_time <= model.show_counts_at).all())
+
+        for id, storedUpcoming, storedPast in db.session.query(model.id, model.upcoming_shows_count, model.past_shows_count).all():
+            counted = (upcoming.get(id, 0), past.get(id, 0))
+            if (storedUpcoming, storedPast) != counted:
+                mismatches.append(
+                    (model.__name__, id, (storedUpcoming, storedPast), counted))
+                if fix:
+                    db.session.query(model).filter(model.id == id).update({
+                        model.upcoming_shows_count: counted[0],
+                        model.past_shows_count: counted[1]}, synchronize_session=False)
+
+    if fix:
+        db.session.commit()
+    return mismatches
 
-def buildNewVenueData(venue):
-    return {
-        "city": venue.city,
-        "state": venue.state,
-        "venues": [{
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": countNumberOfUpcomingShows(id=venue.id, modelType='venue')
-        }]
-    }
 
+def genresFromNames(genreNames):
+    # the Genre rows for a list of genre names (ex: picked in a form), genres that don't exist yet are created
+    genreNames = list(dict.fromkeys(genreNames))
+    if len(genreNames) == 0:
+        return []
+
+    existing = {genre.name: genre for genre in Genre.query.filter(
+        Genre.name.in_(genreNames)).all()}
+    for name in genreNames:
+        if name in existing:
+            continue
+        # another request can create the same genre meanwhile, then the unique name fails this insert
+        # (in a savepoint, the rest of the transaction goes on) and the genre is read back
+        try:
+            with db.session.begin_nested():
+                existing[name] = Genre(name=name)
+                db.session.add(existing[name])
+        except IntegrityError:
+            existing[name] = Genre.query.filter(Genre.name == name).one()
+    return [existing[name] for name in genreNames]
 
-def ListFromString(delimitedString):
-    generatedList = []
 
-    if delimitedString != None and len(delimitedString) > 0:
-        generatedList = delimitedString.split(',')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
 
-    return generatedList
+@app.cli.command('rollover-show-counters')
+def rollover_show_counters_command():
+    """Move shows that already started from the upcoming to the past counters."""
+    changed = rolloverShowCounters()
+    click.echo('%d venue/artist counters rolled over.' % changed)
+
+
+@app.cli.command('check-show-counters')
+@click.option('--fix', is_flag=True, help='Overwrite wrong counters with the recounted values.')
+def check_show_counters_command(fix):
+    """Compare the venue and artist show counters against the shows table."""
+    mismatches = checkShowCounters(fix=fix)
+    for modelName, id, stored, counted in mismatches:
+        click.echo('%s %d: stored upcoming/past %d/%d, counted %d/%d' %
+                   ((modelName, id) + stored + counted))
+
+    click.echo('%d mismatched counters%s.' %
+               (len(mismatches), ' fixed' if fix else ''))
+    if mismatches and not fix:
+        sys.exit(1)
 
 
 if not app.debug:
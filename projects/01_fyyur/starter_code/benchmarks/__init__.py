@@ -0,0 +1,2 @@
+# benchmarks for the fyyur app, they run against a seeded sqlite stand-in of the postgres database.
+# run them from the starter_code folder, ex: python -m benchmarks.bench_venues
@@ -0,0 +1,100 @@
+# micro-benchmark of the datetime jinja filter: the old strftime -> dateutil parse -> babel format round trip
+# against the current filter on native datetimes, alone and rendering the /shows template, ex:
+#   python -m benchmarks.bench_datetime_filter --rows 5000
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from benchmarks.seed import setup_app
+
+
+def legacyFormatDatetime(value, format='medium'):
+    # the filter as it was: the views passed strftime'd strings
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+def showRows(startTimes):
+    return [{
+        "venue_id": 1,
+        "venue_name": 'The Musical Hop',
+        "artist_id": 1,
+        "artist_name": 'Guns N Petals',
+        "artist_image_link": '',
+        "start_time": startTime
+    } for startTime in startTimes]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='cost of the datetime jinja filter, legacy vs cached')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--distinct', type=int, default=None,
+                        help='distinct start times among the rows (default: all distinct)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fyyur = setup_app()
+    distinct = args.distinct or args.rows
+    rng = random.Random(0)
+    base = datetime(2030, 1, 1, 20, 0)
+    times = [base + timedelta(minutes=30 * rng.randrange(distinct)) for _ in range(args.rows)]
+    strings = [t.strftime("%Y-%m-%d %H:%M:%S") for t in times]
+
+    for t, s in zip(times[:50], strings[:50]):
+        assert fyyur.format_datetime(t, 'full') == legacyFormatDatetime(s, 'full')
+
+    def cold():
+        fyyur.formatDatetimeCached.cache_clear()
+        for t in times:
+            fyyur.format_datetime(t, 'full')
+
+    def warm():
+        for t in times:
+            fyyur.format_datetime(t, 'full')
+
+    print('%d rows, %d distinct start times' % (args.rows, len(set(times))))
+    print('%-32s %10s' % ('filter', 'ms'))
+    print('%-32s %10.1f' % ('legacy (parse + babel)', best(
+        lambda: [legacyFormatDatetime(s, 'full') for s in strings], args.repeat)))
+    print('%-32s %10.1f' % ('cached pattern, cold memo', best(cold, args.repeat)))
+    print('%-32s %10.1f' % ('cached pattern, warm memo', best(warm, args.repeat)))
+
+    # the whole /shows template, with the filter swapped in and out of the jinja env
+    with fyyur.app.test_request_context('/shows'):
+        render = fyyur.render_template
+        filters = fyyur.app.jinja_env.filters
+        legacyRows, rows = showRows(strings), showRows(times)
+        render('pages/shows.html', shows=rows[:1])
+
+        filters['datetime'] = legacyFormatDatetime
+        try:
+            legacyMs = best(lambda: render('pages/shows.html', shows=legacyRows), args.repeat)
+        finally:
+            filters['datetime'] = fyyur.format_datetime
+        fyyur.formatDatetimeCached.cache_clear()
+        currentMs = best(lambda: render('pages/shows.html', shows=rows), args.repeat)
+
+    print('%-32s %10.1f' % ('shows.html render, legacy', legacyMs))
+    print('%-32s %10.1f' % ('shows.html render, current', currentMs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# compares the venue search through the n-gram index against the old ILIKE scan, ex:
+#   python -m benchmarks.bench_search --rows 100000
+import argparse
+import time
+
+from benchmarks.seed import setup_app, reset_db, seed, measure
+
+TERMS = ['Hop', 'music hall', 'Velvet Room', 'jazz', 'San Francisco, CA', 'Zz', 'nothing like this']
+
+
+def ilikeSearch(fyyur, term):
+    # the venue search as it was before the index: a case-insensitive LIKE on the name
+    Venue = fyyur.Venue
+    return fyyur.db.session.query(Venue.id, Venue.name, Venue.upcoming_shows_count).filter(
+        Venue.name.ilike('%' + term + '%')).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='latency of the venue search, ILIKE vs the n-gram index')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    fyyur = setup_app(args.database_url)
+    with fyyur.app.app_context():
+        reset_db(fyyur)
+        seed(fyyur, venues=args.rows, shows_per_venue=1)
+
+        start = time.perf_counter()
+        fyyur.venueSearchIndex.rebuild()
+        print('index of %d venues built in %.1f ms, %d distinct n-grams' % (
+            len(fyyur.venueSearchIndex), (time.perf_counter() - start) * 1000,
+            len(fyyur.venueSearchIndex.postings)))
+
+        # the index also matches city and genres, so it can find more than the name-only ILIKE
+        print('%-20s %10s %10s %12s %12s' %
+              ('term', 'ilike hits', 'index hits', 'ilike ms', 'index ms'))
+        for term in TERMS:
+            ilikeHits = len(ilikeSearch(fyyur, term))
+            indexHits, _ = fyyur.searchByIndex(
+                fyyur.Venue, fyyur.venueSearchIndex, term)
+            _, ilikeMs = measure(fyyur, lambda: ilikeSearch(
+                fyyur, term), args.repeat)
+            _, indexMs = measure(fyyur, lambda: fyyur.searchByIndex(
+                fyyur.Venue, fyyur.venueSearchIndex, term), args.repeat)
+            print('%-20s %10d %10d %12.1f %12.1f' %
+                  (term, ilikeHits, indexHits, ilikeMs, indexMs))
+
+
+if __name__ == '__main__':
+    main()
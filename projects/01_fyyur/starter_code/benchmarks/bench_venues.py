@@ -0,0 +1,64 @@
+# compares the grouped /venues listing against the old N+1 path, ex:
+#   python -m benchmarks.bench_venues --sizes 1000 10000 100000
+import argparse
+
+from benchmarks.seed import setup_app, reset_db, seed, measure
+
+
+def legacyGroupByCity(fyyur):
+    # the listing as it was before groupByCity got its aggregated query:
+    # Venue.query.all(), a linear scan over the groups and one COUNT query per venue.
+    Venue, Show = fyyur.Venue, fyyur.Show
+    now = fyyur.datetime.now()
+
+    def countUpcoming(venueId):
+        return Show.query.filter(Show.venue_id == venueId, Show.start_time > now).count()
+
+    groupedVenues = []
+    for venue in Venue.query.all():
+        for area in groupedVenues:
+            if area["state"] == venue.state and area["city"] == venue.city:
+                break
+        else:
+            area = {"city": venue.city, "state": venue.state, "venues": []}
+            groupedVenues.append(area)
+        area["venues"].append({
+            "id": venue.id,
+            "name": venue.name,
+            "num_upcoming_shows": countUpcoming(venue.id)
+        })
+    return groupedVenues
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='query count and latency of the /venues listing')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-limit', type=int, default=10000,
+                        help='skip the old N+1 path above this many venues')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    fyyur = setup_app(args.database_url)
+    client = fyyur.app.test_client()
+
+    print('%8s  %-16s %8s %12s' % ('venues', 'path', 'queries', 'best ms'))
+    with fyyur.app.app_context():
+        for size in args.sizes:
+            reset_db(fyyur)
+            seed(fyyur, venues=size)
+
+            rows = [('groupByCity', measure(fyyur, fyyur.groupByCity, args.repeat)),
+                    ('GET /venues', measure(fyyur, lambda: client.get('/venues'), args.repeat))]
+            if size <= args.legacy_limit:
+                rows.append(('legacy N+1', measure(
+                    fyyur, lambda: legacyGroupByCity(fyyur), 1)))
+
+            for path, (queries, ms) in rows:
+                print('%8d  %-16s %8d %12.1f' % (size, path, queries, ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# requests per second of the app under gunicorn with several workers, each with its own connection pool, ex:
+#   python -m benchmarks.load_test --workers 1 2 4 --threads 16 --database-url postgresql://localhost/fyyur_bench
+# the database is seeded first (a temporary sqlite file unless --database-url is given, postgres is what the
+# pool settings are for). gunicorn has to be installed, it isn't in requirements.txt.
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from benchmarks.seed import setup_app, reset_db, seed
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ['/venues', '/artists', '/shows', '/venues/1', '/artists/1']
+
+
+def freePort():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def startServer(workers, port, env):
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+                               '--bind', '127.0.0.1:%d' % port, '--log-level', 'warning', 'app:app'],
+                              cwd=APP_DIR, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urlopen('http://127.0.0.1:%d/db/stats' % port, timeout=1).read()
+            return server
+        except (URLError, ConnectionError, OSError):
+            if server.poll() is not None:
+                raise RuntimeError('gunicorn exited with %d' % server.returncode)
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+
+def run(baseUrl, paths, threads, seconds):
+    # every thread requests paths round robin until the time is up, returns (requests, errors, mean ms)
+    counts = []
+    stop = time.monotonic() + seconds
+
+    def client(offset):
+        requests = errors = 0
+        elapsed = 0.0
+        while time.monotonic() < stop:
+            path = paths[(offset + requests) % len(paths)]
+            start = time.perf_counter()
+            try:
+                urlopen(baseUrl + path, timeout=30).read()
+            except (URLError, OSError):
+                errors += 1
+            elapsed += time.perf_counter() - start
+            requests += 1
+        counts.append((requests, errors, elapsed))
+
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+
+    requests = sum(count[0] for count in counts)
+    errors = sum(count[1] for count in counts)
+    meanMs = sum(count[2] for count in counts) / requests * 1000 if requests else 0.0
+    return requests, errors, meanMs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='requests/s of the app under gunicorn, per number of workers')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=16,
+                        help='concurrent client connections')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--paths', nargs='+', default=PATHS)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    fyyur = setup_app(args.database_url)
+    with fyyur.app.app_context():
+        reset_db(fyyur)
+        seed(fyyur, venues=args.venues)
+        fyyur.db.engine.dispose()
+
+    # the workers read DATABASE_URL and the DB_POOL_* settings from the environment
+    env = dict(os.environ, DATABASE_URL=fyyur.app.config['SQLALCHEMY_DATABASE_URI'])
+    print('%8s %8s %10s %8s %10s  %s' % ('workers', 'threads', 'requests/s', 'errors', 'mean ms', 'pool of one worker'))
+    for workers in args.workers:
+        port = freePort()
+        server = startServer(workers, port, env)
+        try:
+            baseUrl = 'http://127.0.0.1:%d' % port
+            run(baseUrl, args.paths, args.threads, 1)
+            requests, errors, meanMs = run(baseUrl, args.paths, args.threads, args.seconds)
+            pool = json.loads(urlopen(baseUrl + '/db/stats').read())
+        finally:
+            server.terminate()
+            server.wait()
+
+        print('%8d %8d %10.0f %8d %10.1f  %s' % (workers, args.threads, requests / args.seconds, errors,
+                                                 meanMs, json.dumps(pool, sort_keys=True)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from fsnd_common.querystats import count_queries
+
+# a handful of (city, state) pairs, including same city names in different states
+AREAS = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('San Diego', 'CA'),
+    ('New York', 'NY'), ('Buffalo', 'NY'), ('Austin', 'TX'), ('Dallas', 'TX'),
+    ('Portland', 'OR'), ('Portland', 'ME'), ('Seattle', 'WA'), ('Chicago', 'IL'),
+    ('Springfield', 'IL'), ('Springfield', 'MA'), ('Boston', 'MA'), ('Denver', 'CO'),
+    ('Nashville', 'TN'), ('Memphis', 'TN'), ('Miami', 'FL'), ('Atlanta', 'GA'),
+    ('New Orleans', 'LA'),
+]
+
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+          'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+          'Rock n Roll', 'Soul', 'Other']
+
+WORDS = ['The', 'Musical', 'Hop', 'Dueling', 'Pianos', 'Bar', 'Park', 'Square', 'Live', 'Music', 'Coffee',
+         'Guns', 'Petals', 'Wild', 'Sax', 'Band', 'Blue', 'Note', 'Velvet', 'Room', 'Hall', 'Club', 'Lounge']
+
+
+def setup_app(database_url=None):
+    # config.py reads DATABASE_URL when app.py gets imported, so it has to be set first.
+    if database_url is None:
+        database_url = 'sqlite:///' + \
+            os.path.join(tempfile.mkdtemp(), 'fyyur_bench.db')
+    os.environ['DATABASE_URL'] = database_url
+
+    import app as fyyur
+    fyyur.app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    fyyur.configure_pool(fyyur.app)
+    fyyur.app.config['WTF_CSRF_ENABLED'] = False
+    return fyyur
+
+
+def reset_db(fyyur):
+    fyyur.db.session.remove()
+    fyyur.db.drop_all()
+    fyyur.db.create_all()
+
+
+def seed(fyyur, venues, artists=None, shows_per_venue=2, seed=0):
+    # bulk inserts through the core tables (executemany), the orm would take minutes for 100k rows.
+    rand = random.Random(seed)
+    if artists is None:
+        artists = max(1, venues // 10)
+
+    def name():
+        return ' '.join(rand.sample(WORDS, 3))
+
+    # about half of the shows are in the past and half are upcoming,
+    # they are generated first so the venue and artist show counters can be filled in with them
+    now = datetime.now()
+    showRows = []
+    for venueId in range(1, venues + 1):
+        for _ in range(shows_per_venue):
+            showRows.append({
+                "venue_id": venueId,
+                "artist_id": rand.randint(1, artists),
+                "start_time": now + timedelta(days=rand.randint(-365, 365), minutes=rand.randint(1, 1439)),
+            })
+
+    counters = {}
+    for show in showRows:
+        for key in (('venue', show["venue_id"]), ('artist', show["artist_id"])):
+            upcoming, past = counters.get(key, (0, 0))
+            if show["start_time"] > now:
+                counters[key] = (upcoming + 1, past)
+            else:
+                counters[key] = (upcoming, past + 1)
+
+    def showCounters(key):
+        upcoming, past = counters.get(key, (0, 0))
+        return {"upcoming_shows_count": upcoming, "past_shows_count": past, "show_counts_at": now}
+
+    venueRows = []
+    for venueId in range(1, venues + 1):
+        city, state = rand.choice(AREAS)
+        venueRows.append({
+            "id": venueId, "name": name(), "city": city, "state": state,
+            "address": '%d Main Street' % venueId, "phone": '123-123-1234',
+        })
+        venueRows[-1].update(showCounters(('venue', venueId)))
+
+    artistRows = []
+    for artistId in range(1, artists + 1):
+        city, state = rand.choice(AREAS)
+        artistRows.append({
+            "id": artistId, "name": name(), "city": city, "state": state,
+            "phone": '123-123-1234',
+            "image_link": 'https://example.com/%d.jpg' % artistId,
+        })
+        artistRows[-1].update(showCounters(('artist', artistId)))
+
+    # 2 genres for every venue and artist
+    genreRows = [{"id": genreId, "name": name}
+                 for genreId, name in enumerate(GENRES, 1)]
+    venueGenreRows = [{"venue_id": venueId, "genre_id": genreId}
+                      for venueId in range(1, venues + 1) for genreId in rand.sample(range(1, len(GENRES) + 1), 2)]
+    artistGenreRows = [{"artist_id": artistId, "genre_id": genreId}
+                       for artistId in range(1, artists + 1) for genreId in rand.sample(range(1, len(GENRES) + 1), 2)]
+
+    db = fyyur.db
+    for table, rows in ((fyyur.Venue.__table__, venueRows), (fyyur.Artist.__table__, artistRows),
+                        (fyyur.Show.__table__, showRows), (fyyur.Genre.__table__, genreRows),
+                        (fyyur.venue_genres, venueGenreRows), (fyyur.artist_genres, artistGenreRows)):
+        for start in range(0, len(rows), 10000):
+            db.session.execute(table.insert(), rows[start: start + 10000])
+    db.session.commit()
+    db.session.remove()
+
+
+def measure(fyyur, func, repeat=3):
+    # returns (queries of one call, best wall time in ms) for func
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        fyyur.db.session.remove()
+        with count_queries() as counter:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = counter.count
+    return queries, min(timings)
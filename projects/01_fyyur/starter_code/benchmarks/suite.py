@@ -0,0 +1,302 @@
+# latency percentiles, queries per request and memory of every route, through the flask test client and
+# through a concurrent http driver against gunicorn, saved as json to diff runs against each other, ex:
+#   python -m benchmarks.suite --venues 10000 --output benchmarks/results.json
+#   python -m benchmarks.suite --http --workers 4 --threads 16 --baseline benchmarks/results.json
+# the database is seeded first (a temporary sqlite file unless --database-url is given). the read routes run
+# before the create/edit ones, so they all see the seeded data. the exit code is 1 if a route had errors.
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+
+from benchmarks.seed import setup_app, reset_db, seed, GENRES
+from benchmarks.load_test import APP_DIR, freePort, startServer
+
+# the database time and query count of a response, see fsnd_common/querystats.py
+SERVER_TIMING = re.compile(r'db;dur=([0-9.]+);desc="([0-9]+) queries"')
+
+
+def venueForm(rand, n):
+    return {'name': 'Bench Venue %d' % n, 'city': 'San Francisco', 'state': 'CA',
+            'address': '%d Main Street' % n, 'phone': '123-123-1234', 'genres': rand.sample(GENRES, 2),
+            'facebook_link': 'https://www.facebook.com/bench%d' % n, 'image_link': 'https://example.com/%d.jpg' % n}
+
+
+def artistForm(rand, n):
+    form = venueForm(rand, n)
+    del form['address']
+    form['name'] = 'Bench Artist %d' % n
+    return form
+
+
+def benchRoutes(venues, artists):
+    # (name, method, request builder) of every route, the builder takes a random.Random and the request
+    # number and returns (path, form data or None)
+    def venueId(rand):
+        return rand.randint(1, venues)
+
+    def artistId(rand):
+        return rand.randint(1, artists)
+
+    return [
+        ('GET /', 'GET', lambda rand, n: ('/', None)),
+        ('GET /venues', 'GET', lambda rand, n: ('/venues', None)),
+        ('POST /venues/search', 'POST', lambda rand, n: (
+            '/venues/search', {'search_term': rand.choice(['music', 'hop', 'park', 'san francisco', 'jazz'])})),
+        ('GET /venues/<id>', 'GET', lambda rand, n: ('/venues/%d' % venueId(rand), None)),
+        ('GET /venues/<id>/shows/upcoming', 'GET',
+         lambda rand, n: ('/venues/%d/shows/upcoming' % venueId(rand), None)),
+        ('GET /artists', 'GET', lambda rand, n: ('/artists', None)),
+        ('POST /artists/search', 'POST', lambda rand, n: (
+            '/artists/search', {'search_term': rand.choice(['band', 'blue', 'sax', 'new york', 'rock'])})),
+        ('GET /artists/<id>', 'GET', lambda rand, n: ('/artists/%d' % artistId(rand), None)),
+        ('GET /artists/<id>/shows/past', 'GET',
+         lambda rand, n: ('/artists/%d/shows/past' % artistId(rand), None)),
+        ('GET /shows', 'GET', lambda rand, n: ('/shows', None)),
+        ('GET /venues/create', 'GET', lambda rand, n: ('/venues/create', None)),
+        ('GET /artists/create', 'GET', lambda rand, n: ('/artists/create', None)),
+        ('GET /shows/create', 'GET', lambda rand, n: ('/shows/create', None)),
+        ('GET /venues/<id>/edit', 'GET', lambda rand, n: ('/venues/%d/edit' % venueId(rand), None)),
+        ('GET /artists/<id>/edit', 'GET', lambda rand, n: ('/artists/%d/edit' % artistId(rand), None)),
+        ('POST /venues/create', 'POST', lambda rand, n: ('/venues/create', venueForm(rand, n))),
+        ('POST /artists/create', 'POST', lambda rand, n: ('/artists/create', artistForm(rand, n))),
+        ('POST /shows/create', 'POST', lambda rand, n: ('/shows/create', {
+            'venue_id': venueId(rand), 'artist_id': artistId(rand),
+            'start_time': (datetime.now() + timedelta(days=rand.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S')})),
+        ('POST /venues/<id>/edit', 'POST', lambda rand, n: ('/venues/%d/edit' % venueId(rand), venueForm(rand, n))),
+        ('POST /artists/<id>/edit', 'POST',
+         lambda rand, n: ('/artists/%d/edit' % artistId(rand), artistForm(rand, n))),
+    ]
+
+
+def percentile(sortedValues, p):
+    # nearest rank
+    if not sortedValues:
+        return None
+    return sortedValues[max(0, min(len(sortedValues) - 1, math.ceil(p / 100 * len(sortedValues)) - 1))]
+
+
+def summarize(samples, rssMb):
+    # samples are (ms, status, queries or None)
+    latencies = sorted(sample[0] for sample in samples)
+    queries = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample[1] >= 500),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        "rss_mb": rssMb,
+    }
+
+
+def queryCount(serverTiming):
+    match = SERVER_TIMING.search(serverTiming or '')
+    return int(match.group(2)) if match else None
+
+
+def rssMb(pids=None):
+    # resident memory of the given processes (this one by default) from /proc, the peak from getrusage
+    # where there is no /proc
+    total = 0
+    try:
+        for pid in pids or ['self']:
+            with open('/proc/%s/status' % pid) as status:
+                total += next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+    except (OSError, StopIteration):
+        if pids:
+            return None
+        total = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macos, kilobytes elsewhere
+        if sys.platform == 'darwin':
+            total //= 1024
+    return round(total / 1024, 1)
+
+
+def serverPids(server):
+    # the gunicorn master and its workers
+    try:
+        with open('/proc/%d/task/%d/children' % (server.pid, server.pid)) as children:
+            return [server.pid] + [int(pid) for pid in children.read().split()]
+    except OSError:
+        return [server.pid]
+
+
+def runTestClient(fyyur, routes, requests, rand):
+    client = fyyur.app.test_client()
+    results = {}
+    for name, method, build in routes:
+        samples = []
+        for n in range(requests):
+            path, data = build(rand, n)
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            samples.append(((time.perf_counter() - start) * 1000, response.status_code,
+                            queryCount(response.headers.get('Server-Timing'))))
+        results[name] = summarize(samples, rssMb())
+    return results
+
+
+class NoRedirect(HTTPRedirectHandler):
+    # the edit routes redirect to the page they edited, only the edit itself is measured
+    def redirect_request(self, *args):
+        return None
+
+
+def runHttp(baseUrl, routes, requests, threads, rand, server):
+    opener = build_opener(NoRedirect)
+
+    def send(path, data):
+        body = urlencode(data, doseq=True).encode() if data is not None else None
+        start = time.perf_counter()
+        try:
+            with opener.open(Request(baseUrl + path, data=body), timeout=60) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except HTTPError as error:
+            status, headers = error.code, error.headers
+        except (URLError, OSError):
+            status, headers = 599, {}
+        return (time.perf_counter() - start) * 1000, status, queryCount(headers.get('Server-Timing'))
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for name, method, build in routes:
+            requestsData = [build(rand, n) for n in range(requests)]
+            samples = list(pool.map(lambda request: send(*request), requestsData))
+            results[name] = summarize(samples, rssMb(serverPids(server)))
+    return results
+
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def printResults(results, baseline=None):
+    print('%-34s %8s %6s %9s %9s %9s %8s %8s' % (
+        'route', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'rss MB'))
+    for name, result in results.items():
+        line = '%-34s %8d %6d %9.2f %9.2f %9.2f %8s %8s' % (
+            name, result["requests"], result["errors"], result["p50_ms"], result["p95_ms"], result["p99_ms"],
+            result["queries_per_request"], result["rss_mb"])
+        previous = (baseline or {}).get(name)
+        if previous:
+            line += '   p95 %+.0f%%, queries %s -> %s' % (
+                (result["p95_ms"] / previous["p95_ms"] - 1) * 100 if previous["p95_ms"] else 0,
+                previous["queries_per_request"], result["queries_per_request"])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='latency, queries per request and memory of every route, saved as json')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=None,
+                        help='defaults to a tenth of the venues')
+    parser.add_argument('--shows-per-venue', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per route')
+    parser.add_argument('--http', action='store_true',
+                        help='run the app under gunicorn and send the requests over http')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='gunicorn workers, with --http')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='concurrent client connections, with --http')
+    parser.add_argument('--cache', default=None, choices=['lru', 'redis', 'null'],
+                        help='the page cache backend, defaults to the one of config.py')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--output', default=None,
+                        help='json file for the results')
+    parser.add_argument('--baseline', default=None,
+                        help='results json of an earlier run to compare against')
+    args = parser.parse_args()
+
+    if args.cache:
+        # config.py reads it when app.py gets imported
+        os.environ['CACHE_BACKEND'] = args.cache
+
+    fyyur = setup_app(args.database_url)
+    artists = args.artists or max(1, args.venues // 10)
+    with fyyur.app.app_context():
+        reset_db(fyyur)
+        seed(fyyur, venues=args.venues, artists=artists, shows_per_venue=args.shows_per_venue, seed=args.seed)
+        fyyur.db.engine.dispose()
+
+    routes = benchRoutes(args.venues, artists)
+    rand = random.Random(args.seed)
+    if args.http:
+        env = dict(os.environ, DATABASE_URL=fyyur.app.config['SQLALCHEMY_DATABASE_URI'],
+                   WTF_CSRF_ENABLED='false')
+        port = freePort()
+        server = startServer(args.workers, port, env)
+        try:
+            results = runHttp('http://127.0.0.1:%d' % port, routes,
+                              args.requests, args.threads, rand, server)
+        finally:
+            server.terminate()
+            server.wait()
+    else:
+        results = runTestClient(fyyur, routes, args.requests, rand)
+
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec='seconds'),
+            "git_commit": gitCommit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": fyyur.app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+            "cache": fyyur.app.config['CACHE_BACKEND'],
+            "driver": 'http' if args.http else 'test_client',
+            "workers": args.workers if args.http else None,
+            "threads": args.threads if args.http else 1,
+            "venues": args.venues,
+            "artists": artists,
+            "shows_per_venue": args.shows_per_venue,
+            "requests_per_route": args.requests,
+            "seed": args.seed,
+        },
+        "routes": results,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        differences = [key for key in ('driver', 'database', 'cache', 'workers', 'threads', 'venues', 'artists',
+                                       'shows_per_venue') if baseline["meta"].get(key) != report["meta"][key]]
+        if differences:
+            print('the baseline ran with other settings: %s' % ', '.join(
+                '%s %s -> %s' % (key, baseline["meta"].get(key), report["meta"][key]) for key in differences))
+        baseline = baseline["routes"]
+    printResults(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as outputFile:
+            json.dump(report, outputFile, indent=2)
+        print('saved to %s' % args.output)
+
+    if any(result["errors"] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    # in-process cache, least recently used entries get dropped past maxEntries and every entry expires
+    # after its ttl (seconds). it only sees the invalidations of its own process, use RedisCache with
+    # several workers.
+
+    def __init__(self, maxEntries=1024, ttl=300):
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            "backend": 'lru',
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "max_entries": self.maxEntries
+        }
+
+
+class RedisCache:
+    # same interface on a redis compatible server, shared by every worker so an invalidation is seen by all.
+    # values are pickled, only point it at a server the app trusts. hits/misses are counted per process.
+
+    def __init__(self, url, ttl=300, prefix='fyyur:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "CACHE_BACKEND = 'redis' needs the redis package: pip install redis")
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        # redis expiries are in whole milliseconds and have to be positive
+        self.client.set(self.prefix + key, pickle.dumps(value),
+                        px=max(1, int(ttl * 1000)))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        return {
+            "backend": 'redis',
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+class NullCache:
+    # caches nothing, every get is a miss
+
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {
+            "backend": 'null',
+            "hits": 0,
+            "misses": self.misses
+        }
+
+
+def createCache(config):
+    # builds the cache picked by config['CACHE_BACKEND']: 'lru' (default), 'redis' or 'null'
+    backend = config.get('CACHE_BACKEND', 'lru')
+    ttl = config.get('CACHE_TTL', 300)
+
+    if backend == 'lru':
+        return LRUCache(maxEntries=config.get('CACHE_MAX_ENTRIES', 1024), ttl=ttl)
+    if backend == 'redis':
+        return RedisCache(config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'), ttl=ttl)
+    if backend == 'null':
+        return NullCache()
+
+    raise ValueError('Unknown CACHE_BACKEND %r' % backend)
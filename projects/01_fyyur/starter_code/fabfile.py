@@ -7,7 +7,10 @@ from fabric.contrib.console import confirm
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m unittest test_app && "
+            "python migrations/check_query_plans.py && "
+            "python -m benchmarks.suite --venues 200 --requests 20 --output benchmarks/results.json",
+            capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -0,0 +1,124 @@
+# checks that the queries app.py runs against the shows table use the shows indexes.
+# it upgrades a throwaway sqlite database with these migrations, runs the hot code paths, captures
+# their SELECTs on shows and fails if EXPLAIN QUERY PLAN shows a plain table scan for any of them.
+# run it from the starter_code folder: python migrations/check_query_plans.py
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+SHOWS_INDEXES = ('ix_shows_venue_id_start_time', 'ix_shows_artist_id_start_time',
+                 'ix_shows_start_time_id')
+
+
+def setup_app():
+    # config.py reads DATABASE_URL when app.py gets imported, so it has to be set first
+    os.environ['DATABASE_URL'] = 'sqlite:///' + \
+        os.path.join(tempfile.mkdtemp(), 'fyyur_plans.db')
+    sys.path.insert(0, os.path.dirname(MIGRATIONS_DIR))
+
+    import app as fyyur
+    fyyur.app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
+    fyyur.configure_pool(fyyur.app)
+    return fyyur
+
+
+def seed(fyyur):
+    now = datetime.now()
+    db = fyyur.db
+    for id in (1, 2):
+        db.session.add(fyyur.Venue(id=id, name='Venue %d' % id, city='San Francisco', state='CA',
+                                   address='1015 Folsom Street', phone='123-123-1234'))
+        db.session.add(fyyur.Artist(id=id, name='Artist %d' % id, city='San Francisco', state='CA',
+                                    phone='123-123-1234'))
+    for days in (-30, -1, 1, 30):
+        db.session.add(fyyur.Show(venue_id=1, artist_id=1,
+                                  start_time=now + timedelta(days=days)))
+        db.session.add(fyyur.Show(venue_id=2, artist_id=2,
+                                  start_time=now + timedelta(days=days)))
+    db.session.commit()
+
+
+def hot_paths(fyyur):
+    # every code path of app.py that reads shows for one venue or artist at a time, and the /shows pages
+    client = fyyur.app.test_client()
+    return [
+        ('shows', lambda: client.get('/shows?limit=2')),
+        ('shows next page', lambda: client.get(
+            '/shows?limit=2&after=2000-01-01T00:00:00.000000_1')),
+        ('shows by venue', lambda: client.get('/shows?venue_id=1&start=2000-01-01')),
+        ('show_venue', lambda: client.get('/venues/1')),
+        ('show_artist', lambda: client.get('/artists/1')),
+        ('venue_shows', lambda: client.get(
+            '/venues/1/shows/past?after=2100-01-01T00:00:00.000000_1')),
+        ('artist_shows', lambda: client.get('/artists/1/shows/upcoming')),
+        ('rolloverShowCounters', fyyur.rolloverShowCounters),
+        ('delete_venue', lambda: client.delete('/venues/2')),
+    ]
+
+
+def capture_shows_selects(engine, func):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and re.search(r'\b(FROM|JOIN) shows\b', statement):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def explain(engine, statement, parameters):
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        # rows are (id, parent, notused, detail)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def main():
+    fyyur = setup_app()
+    import flask_migrate
+
+    failures = 0
+    with fyyur.app.app_context():
+        flask_migrate.upgrade(directory=MIGRATIONS_DIR)
+        seed(fyyur)
+        engine = fyyur.db.engine
+
+        for name, func in hot_paths(fyyur):
+            statements = capture_shows_selects(engine, func)
+            if len(statements) == 0:
+                print('FAIL %s: no query on shows was captured' % name)
+                failures += 1
+
+            for statement, parameters in statements:
+                plan = explain(engine, statement, parameters)
+                scansShows = any(re.match(r'SCAN (TABLE )?shows\b', step) and 'INDEX' not in step
+                                 for step in plan)
+                usesIndex = any(index in step for step in plan for index in SHOWS_INDEXES)
+                ok = usesIndex and not scansShows
+
+                print('%s %s: %s' % ('ok  ' if ok else 'FAIL', name, ' | '.join(plan)))
+                if not ok:
+                    print('     ' + ' '.join(statement.split()))
+                    failures += 1
+
+    if failures:
+        print('%d queries on shows are not using the shows indexes.' % failures)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
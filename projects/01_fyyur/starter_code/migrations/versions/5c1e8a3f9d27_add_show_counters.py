@@ -0,0 +1,47 @@
+"""Add denormalized show counters to venues and artists.
+
+Revision ID: 5c1e8a3f9d27
+Revises: 2f31a1b2a775
+Create Date: 2026-10-18 10:12:44.518203
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e8a3f9d27'
+down_revision = '2f31a1b2a775'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        # sqlite can't add a column with a non-constant default, it becomes NOT NULL after the backfill
+        op.add_column(table, sa.Column('show_counts_at', sa.DateTime(), nullable=True))
+
+    # fill the counters from the shows that already exist
+    now = datetime.now()
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            'UPDATE {table} SET '
+            'upcoming_shows_count = (SELECT count(*) FROM shows WHERE shows.{column} = {table}.id AND shows.start_time > :now), '
+            'past_shows_count = (SELECT count(*) FROM shows WHERE shows.{column} = {table}.id AND shows.start_time <= :now), '
+            'show_counts_at = :now'.format(table=table, column=column)), {"now": now})
+
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('show_counts_at', existing_type=sa.DateTime(),
+                                  server_default=sa.func.now(), nullable=False)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('show_counts_at')
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
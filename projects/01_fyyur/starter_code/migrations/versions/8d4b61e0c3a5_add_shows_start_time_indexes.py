@@ -0,0 +1,25 @@
+"""Add composite (venue_id, start_time) and (artist_id, start_time) indexes on shows.
+
+Revision ID: 8d4b61e0c3a5
+Revises: 5c1e8a3f9d27
+Create Date: 2026-10-18 14:37:02.164851
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b61e0c3a5'
+down_revision = '5c1e8a3f9d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
@@ -0,0 +1,23 @@
+"""Add a (start_time, id) index on shows for the keyset paginated /shows listing.
+
+Revision ID: b7f2d9e4a160
+Revises: 8d4b61e0c3a5
+Create Date: 2026-10-18 16:05:51.730410
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f2d9e4a160'
+down_revision = '8d4b61e0c3a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
@@ -0,0 +1,93 @@
+"""Move the comma-joined venues.genres/artists.genres into a genres table with link tables.
+
+Revision ID: c3a85f1e7d42
+Revises: b7f2d9e4a160
+Create Date: 2026-10-18 18:21:09.305517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a85f1e7d42'
+down_revision = 'b7f2d9e4a160'
+branch_labels = None
+depends_on = None
+
+# (entity table, link table, link column, type of the old genres column)
+GENRE_LINKS = (
+    ('venues', 'venue_genres', 'venue_id', sa.String()),
+    ('artists', 'artist_genres', 'artist_id', sa.String(length=120)),
+)
+
+
+def upgrade():
+    genres = op.create_table('genres',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, linkTable, linkColumn, _ in GENRE_LINKS:
+        op.create_table(linkTable,
+        sa.Column(linkColumn, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+        sa.ForeignKeyConstraint([linkColumn], [table + '.id'], ),
+        sa.PrimaryKeyConstraint(linkColumn, 'genre_id')
+        )
+        op.create_index('ix_%s_genre_id_%s' % (linkTable, linkColumn), linkTable, ['genre_id', linkColumn], unique=False)
+
+    # split the existing comma-joined genres into genres rows and links, the links keep the position
+    # of their genre in the joined column so the downgrade can put it back together in that order
+    bind = op.get_bind()
+    genreIds = {}
+    for table, linkTable, linkColumn, _ in GENRE_LINKS:
+        positions = {}
+        for id, joinedGenres in bind.execute(sa.text('SELECT id, genres FROM %s' % table)).fetchall():
+            for position, name in enumerate((joinedGenres or '').split(',')):
+                name = name.strip()
+                if not name:
+                    continue
+                if name not in genreIds:
+                    genreIds[name] = bind.execute(genres.insert().values(name=name)).inserted_primary_key[0]
+                positions.setdefault((id, genreIds[name]), position)
+
+        if positions:
+            op.bulk_insert(sa.table(linkTable, sa.column(linkColumn, sa.Integer()), sa.column('genre_id', sa.Integer()),
+                                    sa.column('position', sa.Integer())),
+                           [{linkColumn: id, 'genre_id': genreId, 'position': position}
+                            for (id, genreId), position in sorted(positions.items())])
+
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table, linkTable, linkColumn, columnType in GENRE_LINKS:
+        op.add_column(table, sa.Column('genres', columnType, nullable=True))
+
+        # in the order of the joined column the links came from, the links added by the app since
+        # have no position and come after those in name order
+        joinedGenres = {}
+        for id, name in bind.execute(sa.text(
+                'SELECT {link}.{column}, genres.name FROM {link} JOIN genres ON genres.id = {link}.genre_id '
+                'ORDER BY {link}.{column}, {link}.position IS NULL, {link}.position, genres.name'.format(
+                    link=linkTable, column=linkColumn))).fetchall():
+            joinedGenres.setdefault(id, []).append(name)
+        for id, names in joinedGenres.items():
+            bind.execute(sa.text('UPDATE %s SET genres = :genres WHERE id = :id' % table),
+                         {"genres": ','.join(names), "id": id})
+
+        op.drop_index('ix_%s_genre_id_%s' % (linkTable, linkColumn), table_name=linkTable)
+        op.drop_table(linkTable)
+
+    # artists.genres was NOT NULL before
+    bind.execute(sa.text("UPDATE artists SET genres = '' WHERE genres IS NULL"))
+    with op.batch_alter_table('artists') as batch_op:
+        batch_op.alter_column('genres', existing_type=sa.String(length=120), nullable=False)
+
+    op.drop_table('genres')
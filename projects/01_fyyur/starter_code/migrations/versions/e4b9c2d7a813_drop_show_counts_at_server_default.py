@@ -0,0 +1,33 @@
+"""Drop the now() server default of venues.show_counts_at and artists.show_counts_at.
+
+Revision ID: e4b9c2d7a813
+Revises: c3a85f1e7d42
+Create Date: 2026-10-18 21:12:37.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b9c2d7a813'
+down_revision = 'c3a85f1e7d42'
+branch_labels = None
+depends_on = None
+
+# the counters are compared with naive local datetime.now() times, while now() is UTC on sqlite and in the
+# session time zone on postgres. the app sets show_counts_at itself, a row inserted without it fails now
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('show_counts_at', existing_type=sa.DateTime(), existing_nullable=False,
+                                  server_default=None)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('show_counts_at', existing_type=sa.DateTime(), existing_nullable=False,
+                                  server_default=sa.func.now())
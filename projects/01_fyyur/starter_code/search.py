@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class NgramTable:
+    # the postings and texts of one build of an NgramIndex, a rebuild makes a new one and swaps it in
+
+    def __init__(self, n):
+        self.n = n
+        self.postings = {}
+        self.texts = {}
+
+    def ngrams(self, text):
+        return {text[i: i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, id, text):
+        self.texts[id] = text
+        for gram in self.ngrams(text):
+            self.postings.setdefault(gram, set()).add(id)
+
+    def remove(self, id):
+        text = self.texts.pop(id, None)
+        if text is None:
+            return
+
+        for gram in self.ngrams(text):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(id)
+                if len(posting) == 0:
+                    del self.postings[gram]
+
+
+class NgramIndex:
+    # in-process inverted index from character n-grams to ids, used for the partial and case-insensitive
+    # venue/artist search instead of ILIKE '%term%' (which has to scan the whole table).
+    #
+    # every id has a few texts (name, "city, state", genres), a search returns the ids with a text
+    # containing the search term: the posting sets of the term's n-grams are intersected, smallest first,
+    # and the candidates are then checked with a real substring test so there are no false positives.
+    # terms shorter than n can't be looked up by n-gram and are matched against the stored texts directly.
+    #
+    # the index is built from loader() on the first search, loader returns an iterable of (id, texts).
+    # add/remove keep it up to date afterwards, they are no-ops until it's built since loader sees the change anyway.
+    # the index only sees the writes of its own process, with several workers maxAge (seconds) makes
+    # it rebuild from loader() once it gets older than that. that rebuild runs in a background thread
+    # (inside context(), ex: app.app_context) while the searches keep using the current table, the new
+    # table is swapped in with one assignment once it's built, with the adds/removes made meanwhile replayed.
+
+    def __init__(self, loader, n=3, maxAge=None, context=None):
+        self.loader = loader
+        self.n = n
+        self.maxAge = maxAge
+        self.context = context
+        self.table = None
+        self.loadedAt = None
+        # guards the table's changes and the swap, never held while loader() runs
+        self.lock = threading.RLock()
+        # one build at a time
+        self.buildLock = threading.Lock()
+        self.backgroundRebuild = None
+        # (id, texts or None for a remove) made while a build runs, None when no build runs
+        self.pendingChanges = None
+
+    @property
+    def postings(self):
+        table = self.table
+        return table.postings if table is not None else {}
+
+    @property
+    def texts(self):
+        table = self.table
+        return table.texts if table is not None else {}
+
+    def normalize(self, texts):
+        # texts are joined with a separator that no search term contains, so no match spans 2 fields
+        return '\x00'.join(text.lower() for text in texts if text)
+
+    def isFresh(self):
+        return self.table is not None and (self.maxAge is None or time.monotonic() - self.loadedAt < self.maxAge)
+
+    def ensureLoaded(self):
+        if self.isFresh():
+            return
+
+        if self.table is None:
+            # nothing to answer with yet, the first search builds it in the foreground
+            with self.buildLock:
+                if self.table is None:
+                    self.build()
+            return
+
+        with self.lock:
+            if self.backgroundRebuild is not None or self.isFresh():
+                return
+            self.backgroundRebuild = threading.Thread(
+                target=self.rebuildInBackground, name='ngram-index-rebuild', daemon=True)
+        self.backgroundRebuild.start()
+
+    def rebuildInBackground(self):
+        try:
+            with self.buildLock:
+                if self.context is not None:
+                    with self.context():
+                        self.build()
+                else:
+                    self.build()
+        except Exception:
+            # the current table is kept, the next rebuild is due after maxAge again
+            logger.exception('rebuilding the search index failed')
+            self.loadedAt = time.monotonic()
+        finally:
+            self.backgroundRebuild = None
+
+    def build(self):
+        # runs with buildLock held. the changes made while loader() runs are kept aside and replayed
+        # on the new table, loader() may or may not have seen them, replaying is the same either way
+        with self.lock:
+            self.pendingChanges = []
+
+        try:
+            table = NgramTable(self.n)
+            for id, texts in self.loader():
+                table.add(id, self.normalize(texts))
+        except Exception:
+            with self.lock:
+                self.pendingChanges = None
+            raise
+
+        with self.lock:
+            for id, texts in self.pendingChanges:
+                table.remove(id)
+                if texts is not None:
+                    table.add(id, self.normalize(texts))
+            self.pendingChanges = None
+            self.table = table
+            self.loadedAt = time.monotonic()
+
+    def rebuild(self):
+        # builds the table again in the foreground, ex: after the database was recreated
+        with self.buildLock:
+            self.build()
+
+    def change(self, id, texts):
+        with self.lock:
+            if self.pendingChanges is not None:
+                self.pendingChanges.append((id, texts))
+            if self.table is not None:
+                self.table.remove(id)
+                if texts is not None:
+                    self.table.add(id, self.normalize(texts))
+
+    def add(self, id, *texts):
+        # adds or replaces the texts of id
+        self.change(id, texts)
+
+    def remove(self, id):
+        self.change(id, None)
+
+    def search(self, term):
+        # returns the set of ids with a text containing term, case-insensitive
+        self.ensureLoaded()
+        term = term.lower()
+
+        with self.lock:
+            table = self.table
+            if len(term) < self.n:
+                return {id for id, text in table.texts.items() if term in text}
+
+            postings = []
+            for gram in table.ngrams(term):
+                posting = table.postings.get(gram)
+                if posting is None:
+                    return set()
+                postings.append(posting)
+
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            return {id for id in candidates if term in table.texts[id]}
+
+    def __len__(self):
+        return len(self.texts)
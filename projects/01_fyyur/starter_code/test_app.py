@@ -0,0 +1,405 @@
+import os
+import re
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import babel.dates
+import dateutil.parser
+import flask_migrate
+from sqlalchemy import MetaData, event, text
+
+from benchmarks.seed import setup_app, reset_db, seed
+from fsnd_common.querystats import assert_max_queries
+from search import NgramIndex
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+class FyyurTestCase(unittest.TestCase):
+    """The fyyur routes against a throwaway sqlite database"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fyyur = setup_app()
+
+    def setUp(self):
+        self.client = self.fyyur.app.test_client
+        with self.fyyur.app.app_context():
+            reset_db(self.fyyur)
+            seed(self.fyyur, venues=5)
+            # the page cache and the search indexes outlive the database of the previous test
+            self.fyyur.pageCache.clear()
+            self.fyyur.venueSearchIndex.rebuild()
+            self.fyyur.artistSearchIndex.rebuild()
+
+    def tearDown(self):
+        with self.fyyur.app.app_context():
+            self.fyyur.db.session.remove()
+
+    def test_venues_are_grouped_by_city_and_state(self):
+        with self.fyyur.app.app_context():
+            Venue = self.fyyur.Venue
+            for ids, city, state in (([1, 4], 'Portland', 'OR'), ([2], 'Portland', 'ME'), ([3, 5], 'Austin', 'TX')):
+                Venue.query.filter(Venue.id.in_(ids)).update(
+                    {'city': city, 'state': state, 'upcoming_shows_count': 2}, synchronize_session=False)
+            self.fyyur.db.session.commit()
+
+            # the venues and their counters only, no query per area or venue
+            with assert_max_queries(1):
+                areas = self.fyyur.groupByCity()
+
+        self.assertEqual([(area['city'], area['state'], [venue['id'] for venue in area['venues']]) for area in areas],
+                         [('Portland', 'ME', [2]), ('Portland', 'OR', [1, 4]), ('Austin', 'TX', [3, 5])])
+        self.assertEqual({venue['num_upcoming_shows'] for area in areas for venue in area['venues']}, {2})
+        res = self.client().get('/venues')
+        self.assertEqual(res.data.count(b'<h3>Portland, '), 2)
+
+    def searchVenueIds(self, searchTerm):
+        res = self.client().post('/venues/search', data={'search_term': searchTerm})
+        return [id for id in range(1, 10) if b'href="/venues/%d"' % id in res.data]
+
+    def test_venue_search_follows_creates_edits_and_deletes(self):
+        self.assertEqual(self.searchVenueIds('zydeco'), [])
+
+        self.client().post('/venues/create', data={
+            'name': 'Zydeco Barn', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+            'phone': '123-123-1234', 'genres': ['Folk'], 'facebook_link': 'http://facebook.com/zydeco',
+            'image_link': ''})
+        # the index got the new venue without being rebuilt, case-insensitive and on any part of the name
+        self.assertEqual(self.searchVenueIds('zydeco'), [6])
+        self.assertEqual(self.searchVenueIds('CO BA'), [6])
+        self.assertIn(6, self.searchVenueIds('Folk'))
+
+        self.client().post('/venues/6/edit', data={
+            'name': 'Cajun Barn', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+            'phone': '123-123-1234', 'genres': ['Folk'], 'facebook_link': ''})
+        self.assertEqual(self.searchVenueIds('zydeco'), [])
+        self.assertEqual(self.searchVenueIds('cajun'), [6])
+
+        self.client().delete('/venues/6')
+        self.assertEqual(self.searchVenueIds('cajun'), [])
+        self.assertEqual(len(self.fyyur.venueSearchIndex), 5)
+
+    def addShows(self, venueId, artistId, startTimes):
+        # straight into the table, the counters aren't needed here
+        with self.fyyur.app.app_context():
+            self.fyyur.db.session.execute(self.fyyur.Show.__table__.insert(), [
+                {'venue_id': venueId, 'artist_id': artistId, 'start_time': startTime} for startTime in startTimes])
+            self.fyyur.db.session.commit()
+
+    def test_venue_and_artist_pages_query_count(self):
+        now = datetime.now()
+        self.addShows(1, 1, [now + timedelta(days=days) for days in range(-30, 30)])
+
+        # the venue (or artist), a page of upcoming and of past shows, both counts and the genres,
+        # however many shows there are
+        for url in ('/venues/1', '/artists/1'):
+            with assert_max_queries(6):
+                self.assertEqual(self.client().get(url).status_code, 200)
+            # then from the page cache
+            with assert_max_queries(0):
+                self.client().get(url)
+        with assert_max_queries(2):
+            self.client().get('/venues/1/shows/upcoming')
+        with assert_max_queries(2):
+            self.client().get('/artists/1/shows/past')
+
+    def test_datetime_filter_matches_babel(self):
+        patterns = {'full': "EEEE MMMM, d, y 'at' h:mma", 'medium': "EE MM, dd, y h:mma", 'y-MM-dd': 'y-MM-dd'}
+        for value in (datetime(2035, 4, 1, 20, 0), datetime(2019, 12, 31, 0, 5, 59), '2035-04-08T20:00:00.000Z'):
+            for format, pattern in patterns.items():
+                expected = babel.dates.format_datetime(
+                    value if isinstance(value, datetime) else dateutil.parser.parse(value), pattern, locale='en')
+                # twice, the second one comes from the memoized results
+                self.assertEqual(self.fyyur.format_datetime(value, format), expected)
+                self.assertEqual(self.fyyur.format_datetime(value, format), expected)
+
+        with self.fyyur.app.app_context():
+            show = self.fyyur.Show.query.filter_by(venue_id=1).first()
+            expected = babel.dates.format_datetime(show.start_time, patterns['full'], locale='en')
+        self.assertIn(expected.encode(), self.client().get('/venues/1').data)
+
+    def test_venue_page_splits_and_pages_the_shows(self):
+        with self.fyyur.app.app_context():
+            self.fyyur.Show.query.filter_by(venue_id=1).delete()
+            self.fyyur.db.session.commit()
+        now = datetime.now()
+        self.addShows(1, 1, [now + timedelta(hours=hours) for hours in range(1, 14)])
+        self.addShows(1, 1, [now - timedelta(hours=hours) for hours in range(1, 13)])
+
+        page = self.client().get('/venues/1').data.decode()
+
+        self.assertIn('13 Upcoming', page)
+        self.assertIn('12 Past', page)
+        self.assertEqual(page.count('tile-show'), 2 * self.fyyur.ENTITY_SHOWS_PAGE_SIZE)
+        # the rest of each list is on its "more shows" page, which has no next page after them
+        for when, remaining in (('upcoming', 3), ('past', 2)):
+            nextPage = re.search(r'href="(/venues/1/shows/%s\?after=[^"]+)"' % when, page).group(1)
+            res = self.client().get(nextPage)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data.count(b'tile-show'), remaining)
+            self.assertNotIn(b'More shows', res.data)
+
+    def test_search_fetches_one_page_of_the_matches(self):
+        with self.fyyur.app.app_context():
+            self.fyyur.Venue.query.update({'city': 'Austin', 'state': 'TX'})
+            self.fyyur.db.session.commit()
+            self.fyyur.venueSearchIndex.rebuild()
+
+            with mock.patch.object(self.fyyur, 'SEARCH_PAGE_SIZE', 2), assert_max_queries(1):
+                count, found = self.fyyur.searchByIndex(self.fyyur.Venue, self.fyyur.venueSearchIndex, 'austin')
+
+        self.assertEqual(count, 5)
+        self.assertEqual([row[0] for row in found], [1, 2])
+        with mock.patch.object(self.fyyur, 'SEARCH_PAGE_SIZE', 2):
+            res = self.client().post('/venues/search', data={'search_term': 'austin'})
+        self.assertIn(b'Number of search results for "austin": 5', res.data)
+        self.assertEqual(self.searchVenueIds('austin'), [1, 2, 3, 4, 5])
+
+    def test_stale_search_index_is_rebuilt_in_the_background(self):
+        index = self.fyyur.venueSearchIndex
+        with self.fyyur.app.app_context():
+            # a venue another worker added
+            self.fyyur.db.session.execute(self.fyyur.Venue.__table__.insert(), {
+                'id': 6, 'name': 'Zydeco Barn', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+                'phone': '123-123-1234', 'show_counts_at': datetime.now()})
+            self.fyyur.db.session.commit()
+        index.loadedAt -= index.maxAge
+
+        # answered from the current table until the new one is built, the rebuild waits on buildLock here
+        with index.buildLock:
+            self.assertEqual(self.searchVenueIds('zydeco'), [])
+            rebuild = index.backgroundRebuild
+        rebuild.join(5)
+
+        self.assertEqual(self.searchVenueIds('zydeco'), [6])
+
+    def test_changes_made_during_a_rebuild_are_kept(self):
+        released = threading.Event()
+        texts = {1: ('Blue Note',), 2: ('Velvet Room',)}
+
+        def loader():
+            released.wait(5)
+            return list(texts.items())
+
+        index = NgramIndex(loader, maxAge=60)
+        released.set()
+        self.assertEqual(index.search('note'), {1})
+
+        released.clear()
+        index.loadedAt -= 60
+        index.search('note')
+        # the rebuild waits in loader() while a venue is added and another one removed
+        index.add(3, 'Note Hall')
+        index.remove(2)
+        self.assertEqual(index.search('note'), {1, 3})
+        released.set()
+        index.backgroundRebuild.join(5)
+
+        self.assertTrue(index.isFresh())
+        self.assertEqual(index.search('note'), {1, 3})
+        self.assertEqual(index.search('velvet'), set())
+
+    def test_shows_limit_zero_shows_one(self):
+        res = self.client().get('/shows?limit=0')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data.count(b'tile-show'), 1)
+        self.assertIn(b'limit=1', res.data)
+
+    def test_shows_negative_limit_shows_one(self):
+        res = self.client().get('/shows?limit=-5')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data.count(b'tile-show'), 1)
+
+    def test_rollover_counts_a_show_submitted_since_the_last_one(self):
+        # a show that already started when it got submitted, after the last rollover
+        with self.fyyur.app.app_context():
+            self.fyyur.rolloverShowCounters()
+        startTime = datetime.now() - timedelta(seconds=1)
+
+        res = self.client().post('/shows/create', data={
+            'venue_id': 1, 'artist_id': 1, 'start_time': startTime.strftime('%Y-%m-%d %H:%M:%S.%f')})
+
+        with self.fyyur.app.app_context():
+            self.fyyur.rolloverShowCounters()
+            mismatches = self.fyyur.checkShowCounters()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(mismatches, [])
+
+    def venueArtistId(self, venueId):
+        with self.fyyur.app.app_context():
+            return self.fyyur.Show.query.filter_by(venue_id=venueId).first().artist_id
+
+    def test_cached_pages_change_with_a_new_show(self):
+        artistId = self.venueArtistId(1)
+        venuePage = self.client().get('/venues/1').data
+        artistPage = self.client().get('/artists/%d' % artistId).data
+        startTime = datetime.now() + timedelta(days=400)
+
+        self.client().post('/shows/create', data={
+            'venue_id': 1, 'artist_id': artistId, 'start_time': startTime.strftime('%Y-%m-%d %H:%M:%S')})
+
+        self.assertNotEqual(self.client().get('/venues/1').data, venuePage)
+        self.assertNotEqual(self.client().get('/artists/%d' % artistId).data, artistPage)
+
+    def test_cached_pages_change_with_a_venue_edit(self):
+        artistId = self.venueArtistId(1)
+        self.client().get('/venues/1')
+        self.client().get('/artists/%d' % artistId)
+
+        self.client().post('/venues/1/edit', data={
+            'name': 'Renamed Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+            'phone': '123-123-1234', 'genres': ['Jazz'], 'facebook_link': ''})
+
+        self.assertIn(b'Renamed Venue', self.client().get('/venues/1').data)
+        # the artist page lists the venue name of its shows
+        self.assertIn(b'Renamed Venue', self.client().get('/artists/%d' % artistId).data)
+
+    def test_cached_pages_change_with_an_artist_edit(self):
+        artistId = self.venueArtistId(1)
+        self.client().get('/venues/1')
+        self.client().get('/artists/%d' % artistId)
+
+        self.client().post('/artists/%d/edit' % artistId, data={
+            'name': 'Renamed Artist', 'city': 'Austin', 'state': 'TX', 'phone': '123-123-1234',
+            'genres': ['Jazz'], 'facebook_link': ''})
+
+        self.assertIn(b'Renamed Artist', self.client().get('/artists/%d' % artistId).data)
+        self.assertIn(b'Renamed Artist', self.client().get('/venues/1').data)
+
+    def test_cached_pages_change_with_a_venue_delete(self):
+        artistId = self.venueArtistId(1)
+        self.assertIn(b'href="/venues/1"', self.client().get('/artists/%d' % artistId).data)
+
+        self.client().delete('/venues/1')
+
+        self.assertNotIn(b'href="/venues/1"', self.client().get('/artists/%d' % artistId).data)
+
+    def test_cached_page_expires_when_its_next_show_starts(self):
+        with self.fyyur.app.app_context():
+            self.fyyur.Show.query.filter_by(venue_id=1).delete()
+            self.fyyur.db.session.commit()
+        startTime = datetime.now() + timedelta(seconds=60)
+        self.client().post('/shows/create', data={
+            'venue_id': 1, 'artist_id': 1, 'start_time': startTime.strftime('%Y-%m-%d %H:%M:%S.%f')})
+
+        self.client().get('/venues/1')
+        expiresAt, _ = self.fyyur.pageCache.entries[self.fyyur.venueCacheKey(1)]
+
+        self.assertLessEqual(expiresAt - time.monotonic(), 60)
+        with self.fyyur.app.app_context():
+            self.assertEqual(self.fyyur.pageCacheTtl(None), self.fyyur.app.config.get('CACHE_TTL', 300))
+            self.assertEqual(self.fyyur.pageCacheTtl(datetime.now() - timedelta(seconds=1)), 0)
+
+    def genreIds(self, linkTable, genreName):
+        with self.fyyur.app.app_context():
+            return sorted(id for id, in self.fyyur.db.session.query(linkTable.columns[0]).join(
+                self.fyyur.Genre, self.fyyur.Genre.id == linkTable.c.genre_id).filter(
+                self.fyyur.Genre.name == genreName))
+
+    def test_venues_genre_filter(self):
+        with self.fyyur.app.app_context():
+            genreName = self.fyyur.Venue.query.get(1).genres[0].name
+        venueIds = self.genreIds(self.fyyur.venue_genres, genreName)
+
+        res = self.client().get('/venues', query_string={'genre': genreName})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([id for id in range(1, 6) if b'href="/venues/%d"' % id in res.data], venueIds)
+
+    def test_artists_genre_filter(self):
+        with self.fyyur.app.app_context():
+            genreName = self.fyyur.Artist.query.get(1).genres[0].name
+
+        res = self.client().get('/artists', query_string={'genre': genreName})
+
+        self.assertIn(b'href="/artists/1"', res.data)
+        self.assertNotIn(b'href="/artists/1"', self.client().get('/artists', query_string={'genre': 'Made Up'}).data)
+
+    def test_genre_created_meanwhile_is_read_back(self):
+        # another request inserts and commits the same new genre right before this one does
+        engine = self.fyyur.db.engine
+        inserted = []
+
+        def insertFirst(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO genres') and not inserted:
+                inserted.append(True)
+                with engine.begin() as other:
+                    other.execute(text("INSERT INTO genres (name) VALUES ('Sea Shanty')"))
+
+        event.listen(engine, 'before_cursor_execute', insertFirst)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', insertFirst)
+        with self.fyyur.app.app_context():
+            genres = self.fyyur.genresFromNames(['Jazz', 'Sea Shanty'])
+            self.fyyur.db.session.commit()
+
+            self.assertEqual([genre.name for genre in genres], ['Jazz', 'Sea Shanty'])
+            self.assertIsNotNone(genres[1].id)
+            self.assertEqual(self.fyyur.Genre.query.filter_by(name='Sea Shanty').count(), 1)
+
+
+class GenreMigrationTestCase(unittest.TestCase):
+    """The genres migration (c3a85f1e7d42) up and down on a throwaway sqlite database"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fyyur = setup_app()
+
+    def setUp(self):
+        with self.fyyur.app.app_context():
+            self.dropAll()
+
+    def tearDown(self):
+        with self.fyyur.app.app_context():
+            self.dropAll()
+
+    def dropAll(self):
+        # the tables of whichever revision the database is at
+        self.fyyur.db.session.remove()
+        metadata = MetaData()
+        metadata.reflect(self.fyyur.db.engine)
+        metadata.drop_all(self.fyyur.db.engine)
+
+    def test_downgrade_keeps_the_order_of_the_genres(self):
+        db = self.fyyur.db
+        joinedGenres = {1: 'Rock n Roll,Jazz', 2: 'Jazz,Blues,Rock n Roll', 3: None}
+        with self.fyyur.app.app_context():
+            flask_migrate.upgrade(MIGRATIONS, 'b7f2d9e4a160')
+            for id, genres in joinedGenres.items():
+                db.session.execute(text(
+                    "INSERT INTO venues (id, name, city, state, address, phone, genres) "
+                    "VALUES (:id, 'Venue', 'Austin', 'TX', '1 Main Street', '123-123-1234', :genres)"),
+                    {'id': id, 'genres': genres})
+            db.session.execute(text(
+                "INSERT INTO artists (id, name, city, state, phone, genres) "
+                "VALUES (1, 'Artist', 'Austin', 'TX', '123-123-1234', 'Soul,Jazz')"))
+            db.session.commit()
+
+            flask_migrate.upgrade(MIGRATIONS, 'c3a85f1e7d42')
+            genres = dict(db.session.execute(text('SELECT name, id FROM genres')).fetchall())
+            venueLinks = db.session.execute(text('SELECT venue_id, genre_id FROM venue_genres')).fetchall()
+            db.session.remove()
+
+            self.assertEqual(sorted(genres), ['Blues', 'Jazz', 'Rock n Roll', 'Soul'])
+            self.assertEqual(sorted(venueLinks), sorted([
+                (1, genres['Rock n Roll']), (1, genres['Jazz']),
+                (2, genres['Jazz']), (2, genres['Blues']), (2, genres['Rock n Roll'])]))
+
+            flask_migrate.downgrade(MIGRATIONS, 'b7f2d9e4a160')
+            venues = dict(db.session.execute(text('SELECT id, genres FROM venues')).fetchall())
+            artists = db.session.execute(text('SELECT genres FROM artists')).fetchall()
+
+            self.assertEqual(venues, joinedGenres)
+            self.assertEqual(artists, [('Soul,Jazz',)])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1 @@
+# benchmarks of the trivia api hot paths, run them from the backend folder: python -m benchmarks.<name>
@@ -0,0 +1,55 @@
+# checks that a page of GET /questions costs the same however many questions there are, ex:
+#   python -m benchmarks.bench_questions --sizes 1000 10000 100000 1000000
+import argparse
+
+from benchmarks.seed import setup_app, reset_db, seed, measure
+
+
+def legacy_questions_page(page_num, questions_per_page=10):
+    # GET /questions as it was: every question loaded and formatted, then sliced
+    from models import Question
+
+    all_questions = Question.query.all()
+    start = (page_num - 1) * questions_per_page
+    formatted = [question.format() for question in all_questions]
+    return formatted[start: start + questions_per_page], len(all_questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='cost of a GET /questions page as the questions table grows')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-limit', type=int, default=100000,
+                        help='skip the legacy version above this many questions')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url)
+    from models import db, Question
+
+    client = app.test_client()
+    print('%10s %-26s %8s %10s' % ('questions', 'page', 'queries', 'ms'))
+    for size in args.sizes:
+        with app.app_context():
+            reset_db(db)
+            seed(db, size)
+            app.extensions['question_count'].invalidate()
+            last_page = (size + 9) // 10
+            deep_after = db.session.query(Question.id).order_by(
+                Question.id).offset(size - 11).limit(1).scalar()
+
+            if size <= args.legacy_limit:
+                queries, ms = measure(lambda: legacy_questions_page(1), args.repeat)
+                print('%10d %-26s %8d %10.2f' % (size, 'legacy, page 1', queries, ms))
+
+            for label, url in (('page 1', '/questions?page=1'),
+                               ('last page (offset)', '/questions?page=%d' % last_page),
+                               ('last page (keyset)', '/questions?after=%d' % deep_after)):
+                queries, ms = measure(lambda: client.get(url), args.repeat)
+                print('%10d %-26s %8d %10.2f' % (size, label, queries, ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# compares drawing a quiz question with ORDER BY random() against the QuestionSampler, ex:
+#   python -m benchmarks.bench_quizzes --questions 1000000
+import argparse
+import time
+
+from sqlalchemy import func
+
+from benchmarks.seed import setup_app, reset_db, seed, measure
+
+
+def legacy_quiz_question(category_id, previous_question_id):
+    # the /quizzes query as it was: sorts every (category) question by random() and excludes one previous id
+    from models import Question
+
+    query = Question.query.filter(Question.id != previous_question_id)
+    if category_id is not None:
+        query = query.filter(Question.category_id == category_id)
+    return query.order_by(func.random()).limit(1).first()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='latency of drawing a quiz question, ORDER BY random() vs the question sampler')
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url)
+    from models import db, Question
+
+    with app.app_context():
+        reset_db(db)
+        start = time.perf_counter()
+        seed(db, args.questions)
+        print('seeded %d questions in %.1f s' % (args.questions, time.perf_counter() - start))
+
+        sampler = app.extensions['question_sampler']
+        start = time.perf_counter()
+        sampler.reload()
+        print('sampler loaded %d ids in %.1f ms' % (sampler.count(), (time.perf_counter() - start) * 1000))
+
+        client = app.test_client()
+        print('%-34s %8s %10s' % ('draw', 'queries', 'ms'))
+        for category_id, label in ((None, 'all categories'), (1, 'category 1')):
+            previous = Question.query.with_entities(Question.id).limit(1).scalar()
+            queries, ms = measure(lambda: legacy_quiz_question(category_id, previous), args.repeat)
+            print('%-34s %8d %10.2f' % ('order by random(), ' + label, queries, ms))
+
+            for excluded in (0, 5, 50):
+                exclude = sampler.ids_of(category_id)[:excluded].tolist()
+                queries, ms = measure(lambda: sampler.sample(category_id, exclude), args.repeat)
+                print('%-34s %8d %10.4f' % ('sampler, %s, %d previous' % (label, excluded), queries, ms))
+
+            body = {"previous_questions": sampler.ids_of(category_id)[:5].tolist(),
+                    "quiz_category": {"type": 'click'} if category_id is None else
+                    {"id": category_id - 1, "type": 'whatever'}}
+            queries, ms = measure(lambda: client.post('/quizzes', json=body), args.repeat)
+            print('%-34s %8d %10.2f' % ('POST /quizzes, ' + label, queries, ms))
+
+
+if __name__ == '__main__':
+    main()
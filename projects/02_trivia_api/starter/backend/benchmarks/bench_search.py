@@ -0,0 +1,55 @@
+# compares the question search through the inverted index against the old ILIKE scan, ex:
+#   python -m benchmarks.bench_search --questions 100000
+import argparse
+import time
+
+from benchmarks.seed import setup_app, reset_db, seed, measure
+
+TERMS = ['river', 'capital city', 'paint', 'world cup', 'What', 'zz', 'nothing like this']
+
+
+def ilike_search(search_term):
+    # the search as it was: a case-insensitive LIKE on the question text, every match loaded and formatted
+    from models import Question
+
+    return [question.format() for question in Question.query.filter(
+        Question.question.ilike('%' + search_term + '%')).all()]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='latency of the question search, ILIKE vs the inverted index')
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url)
+    from models import db
+
+    with app.app_context():
+        reset_db(db)
+        seed(db, args.questions)
+
+        index = app.extensions['question_index']
+        start = time.perf_counter()
+        index.rebuild()
+        print('index of %d questions built in %.1f ms, %d distinct terms' % (
+            len(index), (time.perf_counter() - start) * 1000, len(index.terms)))
+
+        # the index matches words and word prefixes in the question and the answer, ILIKE any substring
+        # of the question, so the hit counts differ
+        client = app.test_client()
+        print('%-20s %10s %10s %10s %10s %12s' %
+              ('term', 'ilike hits', 'index hits', 'ilike ms', 'index ms', 'GET page ms'))
+        for term in TERMS:
+            _, ilike_ms = measure(lambda: ilike_search(term), args.repeat)
+            _, index_ms = measure(lambda: index.search(term), args.repeat)
+            _, page_ms = measure(lambda: client.get(
+                '/questions', query_string={'search': term}), args.repeat)
+            print('%-20s %10d %10d %10.2f %10.2f %12.2f' % (
+                term, len(ilike_search(term)), len(index.search(term)), ilike_ms, index_ms, page_ms))
+
+
+if __name__ == '__main__':
+    main()
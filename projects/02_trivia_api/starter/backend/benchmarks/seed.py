@@ -0,0 +1,75 @@
+import os
+import random
+import tempfile
+import time
+
+from fsnd_common.dbpool import configure_pool
+from fsnd_common.querystats import count_queries
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+WORDS = ['what', 'which', 'who', 'largest', 'first', 'country', 'river', 'painter', 'element', 'planet',
+         'team', 'movie', 'actor', 'century', 'capital', 'ocean', 'invented', 'famous', 'oldest', 'city',
+         'world', 'cup', 'album', 'band', 'discovered', 'mountain', 'language', 'novel', 'author', 'war']
+
+# rows per executemany, well under the bound parameter limits of sqlite and postgres
+CHUNK_SIZE = 10000
+
+
+def setup_app(database_url=None):
+    # create_app still needs the config module, only the database is swapped for a throwaway one
+    # (a temporary sqlite file unless database_url or DATABASE_URL is given)
+    from flaskr import create_app
+
+    if database_url is None:
+        database_url = os.environ.get('DATABASE_URL') or 'sqlite:///' + \
+            os.path.join(tempfile.mkdtemp(), 'trivia_bench.db')
+
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    configure_pool(app)
+    return app
+
+
+def reset_db(db):
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+
+def seed(db, questions, seed=0):
+    # bulk inserts through the core tables (executemany), the orm would take minutes for 1M rows
+    from models import Question, Category
+
+    rand = random.Random(seed)
+    db.session.execute(Category.__table__.insert(), [{"type": type} for type in CATEGORIES])
+
+    rows = []
+    for _ in range(questions):
+        rows.append({
+            "question": ' '.join(rand.sample(WORDS, 6)) + '?',
+            "answer": ' '.join(rand.sample(WORDS, 2)),
+            "difficulty": rand.randint(1, 5),
+            "category_id": rand.randint(1, len(CATEGORIES)),
+        })
+        if len(rows) == CHUNK_SIZE:
+            db.session.execute(Question.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(Question.__table__.insert(), rows)
+    db.session.commit()
+
+
+def measure(func, repeat):
+    # (queries of one call, best of repeat in ms)
+    with count_queries() as counter:
+        func()
+    queries = counter.count
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return queries, best
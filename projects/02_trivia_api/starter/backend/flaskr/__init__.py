@@ -1,11 +1,23 @@
 import os
-from flask import Flask, request, abort, jsonify, flash
+import io
+import hashlib
+import json
+from flask import Flask, request, abort, jsonify, flash, current_app, has_app_context, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
 from flask_cors import CORS
+import click
 import random
 import sys
 from models import setup_db, Question, Category, db
+from fsnd_common.dbpool import pool_metrics
+from fsnd_common.querystats import init_query_stats
+from fsnd_common.metrics import init_metrics
+from .quiz import QuestionSampler
+from .cache import CachedValue
+from .search import QuestionIndex
+from . import bulk
 
 
 def create_app(test_config=None):
@@ -13,9 +25,36 @@ def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object('config')
     setup_db(app)
+    # queries per request in the Server-Timing header, the slower than SLOW_QUERY_MS ones logged
+    init_query_stats(app)
+    # latency, status and db time per route at /metrics, in the prometheus text format
+    init_metrics(app, series=lambda: pool_metrics(db.engine))
 
     cors = CORS(app, resources={r"/*": {"origins": "*"}})
 
+    # question ids the quizzes draw from, reloaded in the background after QUIZ_SAMPLER_MAX_AGE seconds to pick
+    # up the questions other workers added or deleted (None keeps them until the process restarts, only for a
+    # single process). the reload needs the app context for the database session
+    question_sampler = QuestionSampler(
+        load_question_ids, max_age=app.config.get('QUIZ_SAMPLER_MAX_AGE', 60), context=app.app_context)
+    app.extensions['question_sampler'] = question_sampler
+
+    # total_questions of GET /questions, recounted after QUESTION_COUNT_TTL seconds or a question insert/delete
+    question_count = CachedValue(
+        count_questions, ttl=app.config.get('QUESTION_COUNT_TTL', 60))
+    app.extensions['question_count'] = question_count
+
+    # (category names, etag) of /categories and GET /questions. categories barely ever change, the cache is
+    # dropped when a Category is committed through the orm and after CATEGORIES_TTL seconds otherwise
+    app.extensions['category_names'] = CachedValue(
+        load_category_names, ttl=app.config.get('CATEGORIES_TTL', 300))
+
+    # the question search, see flaskr/search.py. rebuilt in the background after SEARCH_INDEX_MAX_AGE seconds
+    # for the same reason
+    question_index = QuestionIndex(
+        load_question_texts, max_age=app.config.get('SEARCH_INDEX_MAX_AGE', 60), context=app.app_context)
+    app.extensions['question_index'] = question_index
+
     # CORS Headers
 
     @app.after_request
@@ -31,15 +70,22 @@ def create_app(test_config=None):
     @app.route('/categories')
     def get_all_categories():
 
-        categories = get_categories_names_list()
+        categories, etag = current_app.extensions['category_names'].get()
 
         if len(categories) == 0:
 
             abort(404)
 
-        return jsonify({
-            "categories": categories
-        })
+        # clients send back the etag in If-None-Match and get an empty 304 while the categories didn't change
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify({
+                "categories": categories
+            })
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
 
     @app.route('/questions')
     def get_or_search_questions():
@@ -69,7 +115,11 @@ def create_app(test_config=None):
                 abort(404)
                 flash("Question doesn't exist!")
             else:
+                category_id = question.category_id
                 question.delete()
+                question_sampler.remove(question_id, category_id)
+                question_count.invalidate()
+                question_index.remove(question_id)
                 flash("Question deleted!")
         except:
 
@@ -98,6 +148,10 @@ def create_app(test_config=None):
 
             new_question.insert()
             id = new_question.id
+            question_sampler.add(id, category_id)
+            question_count.invalidate()
+            question_index.add(id, new_question.question,
+                               new_question.answer)
 
         except:
             abort(422)
@@ -110,62 +164,153 @@ def create_app(test_config=None):
         return {"success": True,
                 "id": new_question.id}
 
+    def questions_changed():
+        # after a bulk import every in-process question cache is out of date
+        question_count.invalidate()
+        question_sampler.invalidate()
+        question_index.invalidate()
+
+    @app.route('/questions/bulk', methods=['POST'])
+    def bulk_add_questions():
+
+        # imports questions from the request body, ndjson (one question object per line) or csv with a header row,
+        # picked by ?format= or the content type. the body is read as a stream, not loaded at once.
+        # returns the import report, see bulk.import_questions
+        format = request.args.get('format') or (
+            'csv' if request.mimetype == 'text/csv' else 'ndjson')
+        if format not in bulk.FORMATS:
+            abort(400)
+
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        try:
+            report = bulk.import_questions(lines, format)
+        except UnicodeDecodeError:
+            # the chunks before the undecodable line are committed already
+            questions_changed()
+            abort(400)
+        questions_changed()
+
+        return jsonify(dict(report, success=True))
+
+    @app.route('/questions/export')
+    def export_questions():
+
+        # every question as ndjson (default) or csv with ?format=csv, streamed
+        format = request.args.get('format', 'ndjson')
+        if format not in bulk.FORMATS:
+            abort(400)
+
+        mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(bulk.export_questions(format)), mimetype=mimetype)
+
+    @app.cli.command('import-questions')
+    @click.argument('file', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', type=click.Choice(bulk.FORMATS), default=None,
+                  help='defaults to csv for a .csv file and ndjson otherwise')
+    @click.option('--chunk-size', type=int, default=bulk.IMPORT_CHUNK_SIZE, show_default=True)
+    def import_questions_command(file, format, chunk_size):
+        """Import questions from an ndjson or csv file ('-' for stdin)."""
+        format = format or ('csv' if file.name.endswith('.csv') else 'ndjson')
+        report = bulk.import_questions(file, format, chunk_size)
+        questions_changed()
+
+        for error in report["errors"]:
+            click.echo('line %d: %s' % (error["line"], error["error"]), err=True)
+        click.echo('%d questions imported, %d rejected in %.1fs (%d rows/s)' % (
+            report["inserted"], report["rejected"], report["seconds"], report["rows_per_second"]))
+
+    @app.cli.command('export-questions')
+    @click.argument('file', type=click.File('w', encoding='utf-8'), default='-')
+    @click.option('--format', type=click.Choice(bulk.FORMATS), default='ndjson', show_default=True)
+    def export_questions_command(file, format):
+        """Export every question as ndjson or csv to a file (stdout by default)."""
+        for chunk in bulk.export_questions(format):
+            file.write(chunk)
+
     @app.route('/categories/<int:category_id>/questions')
     def get_questions_in_category(category_id):
 
         # on the frontend, categories is an array of strings of categories types and its index(id) starts at 0,
         # so i increment the id by one before fetching from my db to get the correct result.
 
-        current_category = Category.query.get(category_id+1)
+        category_id = category_id + 1
+        current_category = db.session.query(Category.type).filter(
+            Category.id == category_id).scalar()
 
         if current_category == None:
             abort(404)
 
-        questions_by_category = current_category.questions
+        total_questions = db.session.query(func.count(Question.id)).filter(
+            Question.category_id == category_id).scalar()
 
-        if questions_by_category == None or len(questions_by_category) == 0:
+        if total_questions == 0:
             abort(404)
 
-        # on the frontend pagination links reset sort, so i dont paginate results here for now.
-        formatted_questions = format_questions(questions_by_category)
+        # only the columns format() needs, not the Question objects and not the whole category.questions list
+        questions_query = db.session.query(*QUESTION_COLUMNS).filter(
+            Question.category_id == category_id)
+
+        # ?all=true streams every question of the category instead of one page, encoded row by row
+        if request.args.get('all') == 'true':
+            return Response(stream_with_context(stream_questions_json(
+                questions_query.order_by(Question.id), total_questions, current_category)),
+                mimetype='application/json')
+
+        # on the frontend pagination links reset sort, the first page is what it shows.
+        formatted_questions, next_after = paginate_questions(
+            request, questions_query, QUESTIONS_PER_PAGE, formatter=format_question_rows)
+
+        if formatted_questions == None:
+            abort(404)
 
         return jsonify({
             "questions": formatted_questions,
-            "totalQuestions": len(questions_by_category),
-            "currentCategory": current_category.type
+            "totalQuestions": total_questions,
+            "next_after": next_after,
+            "currentCategory": current_category
         })
 
     @app.route('/quizzes', methods=['POST'])
     def quizzes():
 
-        # a function that returns a random question that isn't equal to the prev one
-        # this could be done programatically, by first getting count() of all questions in a category, then generating a random question id that is <= to qs count and != the prev question id
-        # or can be done via sql with an ORDER_BY random() limit 1 statement.
+        # returns a random question of the selected category that isn't one of the previous questions,
+        # drawn from the question ids kept by question_sampler instead of an ORDER BY random() over the table.
+        # once every question of the category was asked the question is null, the frontend ends the quiz then.
 
-        previous_question_id = 0
-        previous_question = request.get_json().get('previous_questions')
-
-        if len(previous_question) > 0:
-            previous_question_id = previous_question[0]
+        try:
+            previous_questions = {int(id) for id in request.get_json().get(
+                'previous_questions') or []}
+        except (TypeError, ValueError):
+            abort(400)
 
         # if selected category type is 'clicked' that means all categories is chosen
         selected_category = request.get_json().get('quiz_category')
 
         if selected_category.get('type') == 'click':
-            question = Question.query.filter(Question.id != previous_question_id).order_by(
-                func.random()).limit(1).first()
-
+            selected_category_id = None
         else:
-
             selected_category_id = int(selected_category.get('id')) + 1
-            question = Question.query.filter(Question.id != previous_question_id, Question.category_id ==
-                                             selected_category_id).order_by(func.random()).limit(1).first()
 
-        if question == None:
+        if question_sampler.count(selected_category_id) == 0:
             abort(404)
 
+        question = None
+        # the sampled question can be gone if another worker deleted it, then it's dropped, another one is drawn
+        # and the ids are reloaded in the background for the other deletes of that worker
+        for attempt in range(2):
+            question_id = question_sampler.sample(
+                selected_category_id, exclude=previous_questions)
+            if question_id is None:
+                break
+
+            question = Question.query.get(question_id)
+            if question is not None:
+                break
+            question_sampler.remove(question_id)
+            question_sampler.invalidate()
+
         return jsonify({
-            "question": question.format()
+            "question": question.format() if question is not None else None
         })
 
     @app.errorhandler(400)
@@ -209,12 +354,24 @@ def create_app(test_config=None):
 ###############################
 
 
-def get_questions():
+def load_question_ids():
+    # (id, category id) of every question for the QuestionSampler, streamed so 1M questions don't sit in memory twice
+    return db.session.query(Question.id, Question.category_id).yield_per(10000)
+
+
+QUESTIONS_PER_PAGE = 10
+
 
-    all_questions = Question.query.all()
+def count_questions():
+    return db.session.query(func.count(Question.id)).scalar()
+
+
+def get_questions():
 
-    paginated_questions = paginate_questions(
-        request, all_questions, 10)
+    # ?page=n for the frontend's page links, or ?after=<id of the last question of the previous page>
+    # to walk the questions by keyset, which costs the same on every page however deep.
+    paginated_questions, next_after = paginate_questions(
+        request, Question.query, QUESTIONS_PER_PAGE)
 
     if paginated_questions == None:
 
@@ -222,25 +379,37 @@ def get_questions():
 
     return jsonify({
         "questions": paginated_questions,
-        "total_questions": len(all_questions),
+        "total_questions": current_app.extensions['question_count'].get(),
+        "next_after": next_after,
         "categories": get_categories_names_list(),
         "currentCategory": None
     })
 
 
-def search_questions(search_term):
+def load_question_texts():
+    # (id, question, answer) of every question for the QuestionIndex
+    return db.session.query(Question.id, Question.question, Question.answer).yield_per(10000)
 
-    search_results = Question.query.filter(
-        Question.question.ilike('%' + search_term + '%')).all()
 
-    if search_results == None:
-        # returning an empty results list instead of aborting
-        return jsonify({
-            "questions": []
-        })
+def search_questions(search_term):
 
-    # on the frontend pagination links reset search, so i dont paginate results here for now.
-    formatted_search_results = format_questions(search_results)
+    # questions containing every word of the search term (or words starting with them) in the question or
+    # the answer, best match first, QUESTIONS_PER_PAGE per ?page=
+    search_results = current_app.extensions['question_index'].search(
+        search_term)
+
+    page_num = request.args.get('page', 1, type=int)
+    start = (max(page_num, 1) - 1) * QUESTIONS_PER_PAGE
+    page_ids = search_results[start: start + QUESTIONS_PER_PAGE]
+
+    # returning an empty results list instead of aborting
+    formatted_search_results = []
+    if len(page_ids):
+        questions = {question.id: question for question in Question.query.filter(
+            Question.id.in_(page_ids))}
+        # in the ranking order, skipping questions another worker deleted since the index was built
+        formatted_search_results = format_questions(
+            [questions[id] for id in page_ids if id in questions])
 
     return jsonify({
         "questions": formatted_search_results,
@@ -250,17 +419,35 @@ def search_questions(search_term):
     })
 
 
-def paginate_questions(request, questions, questions_per_page):
+def paginate_questions(request, query, questions_per_page, formatter=None):
 
-    page_num = request.args.get('page', 1, type=int)
-    start = (page_num - 1) * questions_per_page
-    end = start + questions_per_page
+    # one page of the query's questions in id order, the LIMIT/OFFSET (or keyset filter) runs in sql
+    # and only that page gets loaded and formatted.
+    # formatter formats the page, format_questions by default (format_question_rows for a QUESTION_COLUMNS query).
+    # returns (formatted questions, id to pass as ?after= for the next page or None on the last page),
+    # (None, None) if the page is empty or out of range
+    query = query.order_by(Question.id)
 
-    # if questions is empty or the pagination page_num argument is out of index return none
-    if len(questions) == 0 or start >= len(questions):
-        return None
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(Question.id > after)
+    else:
+        page_num = request.args.get('page', 1, type=int)
+        if page_num < 1:
+            return None, None
+        query = query.offset((page_num - 1) * questions_per_page)
+
+    # one extra row tells if there is a next page
+    questions = query.limit(questions_per_page + 1).all()
+    if len(questions) == 0:
+        return None, None
 
-    return format_questions(questions)[start: end]
+    next_after = None
+    if len(questions) > questions_per_page:
+        questions = questions[:questions_per_page]
+        next_after = questions[-1].id
+
+    return (formatter or format_questions)(questions), next_after
 
 
 def format_questions(questions):
@@ -270,11 +457,73 @@ def format_questions(questions):
     return formatted_questions
 
 
+# the columns of Question.format(), for the queries that skip loading Question objects
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category_id, Question.difficulty)
+# rows encoded per chunk of a streamed response
+STREAM_CHUNK_SIZE = 1000
+
+
+def format_question_rows(rows):
+    # same dicts as Question.format() from QUESTION_COLUMNS rows
+    return [{
+        'id': id,
+        'question': question,
+        'answer': answer,
+        'category': category_id,
+        'difficulty': difficulty
+    } for id, question, answer, category_id, difficulty in rows]
+
+
+def stream_questions_json(questions_query, total_questions, current_category):
+    # the category questions response as json chunks, the rows are fetched STREAM_CHUNK_SIZE at a time
+    # so the whole category never sits in memory, neither as rows nor as one encoded string
+    yield '{"questions": ['
+    rows = []
+    first = True
+    for row in questions_query.yield_per(STREAM_CHUNK_SIZE):
+        rows.append(row)
+        if len(rows) == STREAM_CHUNK_SIZE:
+            yield ('' if first else ', ') + json.dumps(format_question_rows(rows))[1:-1]
+            rows = []
+            first = False
+    if rows:
+        yield ('' if first else ', ') + json.dumps(format_question_rows(rows))[1:-1]
+
+    yield '], "totalQuestions": %d, "currentCategory": %s}' % (total_questions, json.dumps(current_category))
+
+
 # apparently the frontend only wants an array of categories names which is fucking retarded
 def get_categories_names_list():
-    categories = Category.query.all()
-    if len(categories):
-        # list of strings of categories names
-        return [cat.type for cat in categories]
-    else:
-        return []
+    return current_app.extensions['category_names'].get()[0]
+
+
+def load_category_names():
+    # list of strings of categories names, in id order since the frontend uses the index as the id,
+    # and the etag of that list
+    categories = [type for type, in db.session.query(
+        Category.type).order_by(Category.id)]
+    etag = hashlib.sha1(json.dumps(categories).encode('utf-8')).hexdigest()
+    return categories, etag
+
+
+def mark_categories_changed(mapper, connection, target):
+    object_session(target).info['categories_changed'] = True
+
+
+for event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Category, event_name, mark_categories_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_category_names(session):
+    # only once the change is committed, a reload before that would cache the old categories again
+    if session.info.pop('categories_changed', False) and has_app_context():
+        category_names = current_app.extensions.get('category_names')
+        if category_names is not None:
+            category_names.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_categories_changed(session):
+    session.info.pop('categories_changed', None)
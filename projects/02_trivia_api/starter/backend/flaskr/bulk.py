@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import time
+
+from models import db, Question, Category
+
+# the fields of an imported or exported question, as Question.format() names them.
+# category is the category id (not the frontend's 0 based index), id is ignored on import.
+FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+FORMATS = ('ndjson', 'csv')
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+
+# rows per executemany insert, each chunk is committed on its own
+IMPORT_CHUNK_SIZE = 1000
+# rejected rows listed in an import report, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def read_rows(lines, format):
+    # (line number, row dict or None if the line can't be parsed) of an ndjson or csv stream of text lines
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_num, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_num, row if isinstance(row, dict) else None
+
+
+def validate_row(row, category_ids):
+    # the Question columns of a row, or the error message if it doesn't fit the Question schema
+    if row is None:
+        return None, 'not a json object'
+
+    values = {}
+    for field in ('question', 'answer'):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None, '%s is missing' % field
+        values[field] = value.strip()
+
+    try:
+        values['difficulty'] = int(row.get('difficulty'))
+        values['category_id'] = int(row.get('category'))
+    except (TypeError, ValueError):
+        return None, 'difficulty and category must be integers'
+
+    if not MIN_DIFFICULTY <= values['difficulty'] <= MAX_DIFFICULTY:
+        return None, 'difficulty must be between %d and %d' % (MIN_DIFFICULTY, MAX_DIFFICULTY)
+    if values['category_id'] not in category_ids:
+        return None, 'category %d does not exist' % values['category_id']
+
+    return values, None
+
+
+def import_questions(lines, format='ndjson', chunk_size=IMPORT_CHUNK_SIZE):
+    # inserts the valid rows of an ndjson or csv stream in chunks of chunk_size, one executemany and one
+    # transaction per chunk, so a failing chunk only loses its own rows. invalid rows are skipped.
+    # returns the report: inserted and rejected counts, the first errors, the time taken and the rows per second
+    category_ids = {id for id, in db.session.query(Category.id)}
+    insert = Question.__table__.insert()
+    report = {"inserted": 0, "rejected": 0, "errors": []}
+    start = time.perf_counter()
+
+    def reject(line_num, error):
+        report["rejected"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_num, "error": error})
+
+    def flush(chunk):
+        try:
+            db.session.execute(insert, [values for _, values in chunk])
+            db.session.commit()
+            report["inserted"] += len(chunk)
+        except Exception as error:
+            db.session.rollback()
+            for line_num, _ in chunk:
+                reject(line_num, 'chunk failed: %s' % error.__class__.__name__)
+
+    chunk = []
+    for line_num, row in read_rows(lines, format):
+        values, error = validate_row(row, category_ids)
+        if error is not None:
+            reject(line_num, error)
+            continue
+
+        chunk.append((line_num, values))
+        if len(chunk) == chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    report["rows_per_second"] = round(
+        report["inserted"] / report["seconds"]) if report["seconds"] else report["inserted"]
+    return report
+
+
+def export_questions(format='ndjson', chunk_size=IMPORT_CHUNK_SIZE):
+    # every question in id order as ndjson or csv text, one chunk of chunk_size rows at a time
+    columns = (Question.id, Question.question, Question.answer,
+               Question.category_id, Question.difficulty)
+    rows = db.session.query(*columns).order_by(Question.id).yield_per(chunk_size)
+
+    if format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if count % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(FIELDS, row))) + '\n')
+        if len(lines) == chunk_size:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
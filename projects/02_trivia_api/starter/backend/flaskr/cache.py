@@ -0,0 +1,30 @@
+import threading
+import time
+
+
+class CachedValue:
+    # a value computed by loader() once and then served from memory until invalidate() is called
+    # or it gets older than ttl (seconds, None to never expire).
+    # invalidate() only reaches this process, with several workers the ttl bounds how stale it gets.
+
+    def __init__(self, loader, ttl=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.value = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def is_fresh(self):
+        return self.loaded_at is not None and (self.ttl is None or time.monotonic() - self.loaded_at < self.ttl)
+
+    def get(self):
+        with self.lock:
+            if not self.is_fresh():
+                self.value = self.loader()
+                self.loaded_at = time.monotonic()
+            return self.value
+
+    def invalidate(self):
+        with self.lock:
+            self.value = None
+            self.loaded_at = None
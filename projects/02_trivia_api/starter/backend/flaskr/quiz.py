@@ -0,0 +1,197 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionIds:
+    # the sorted question ids of one load of a QuestionSampler, a reload makes a new one and swaps it in
+
+    def __init__(self):
+        self.all_ids = array('q')
+        self.category_ids = {}
+
+    def ids_of(self, category_id=None):
+        # category_id None means all the questions
+        if category_id is None:
+            return self.all_ids
+        return self.category_ids.get(category_id, array('q'))
+
+    def add(self, question_id, category_id):
+        for ids in (self.all_ids, self.category_ids.setdefault(category_id, array('q'))):
+            index = bisect.bisect_left(ids, question_id)
+            if index == len(ids) or ids[index] != question_id:
+                ids.insert(index, question_id)
+
+    def remove(self, question_id, category_id=None):
+        arrays = [self.all_ids]
+        arrays += [self.category_ids[category_id]] if category_id in self.category_ids \
+            else list(self.category_ids.values())
+        for ids in arrays:
+            index = bisect.bisect_left(ids, question_id)
+            if index < len(ids) and ids[index] == question_id:
+                del ids[index]
+
+
+class QuestionSampler:
+    # picks a random quiz question without ORDER BY random(), which sorts the whole questions table on every
+    # quiz step. the question ids are kept in memory, sorted, once for all questions and once per category
+    # (8 bytes per id per array), so a draw is a random index into an array.
+    #
+    # the ids come from loader() on the first draw, loader returns an iterable of (question id, category id).
+    # add/remove keep them up to date afterwards. they only see the writes of their own process, with several
+    # workers max_age (seconds) makes the sampler reload once it gets older than that. only the first load
+    # runs in the foreground, a reload runs in a background thread (inside context(), ex: app.app_context)
+    # while the draws keep using the current ids, the new ones are swapped in with one assignment once
+    # they're loaded, with the adds/removes made meanwhile replayed.
+
+    # give up on drawing random indexes and filter the ids instead once this many draws hit excluded ids
+    MAX_REJECTIONS = 16
+
+    def __init__(self, loader, max_age=None, context=None):
+        self.loader = loader
+        self.max_age = max_age
+        self.context = context
+        self.ids = None
+        self.loaded_at = None
+        # guards the ids' changes and the swap, never held while loader() runs
+        self.lock = threading.RLock()
+        # one load at a time
+        self.load_lock = threading.Lock()
+        self.background_reload = None
+        # (add or remove, question id, category id) made while a load runs, None when no load runs
+        self.pending_changes = None
+        # bumped by invalidate(), a load that started before it is stale as soon as it's swapped in
+        self.generation = 0
+        self.random = random.Random()
+
+    def is_fresh(self):
+        return self.ids is not None and self.loaded_at is not None and (
+            self.max_age is None or time.monotonic() - self.loaded_at < self.max_age)
+
+    def ensure_loaded(self):
+        if self.is_fresh():
+            return
+
+        if self.ids is None:
+            # nothing to draw from yet, the first draw loads the ids in the foreground
+            with self.load_lock:
+                if self.ids is None:
+                    self.load()
+            return
+
+        self.start_reload()
+
+    def start_reload(self):
+        with self.lock:
+            if self.ids is None or self.background_reload is not None or self.is_fresh():
+                return
+            self.background_reload = threading.Thread(
+                target=self.reload_in_background, name='question-sampler-reload', daemon=True)
+        self.background_reload.start()
+
+    def reload_in_background(self):
+        try:
+            with self.load_lock:
+                if self.context is not None:
+                    with self.context():
+                        self.load()
+                else:
+                    self.load()
+        except Exception:
+            # the current ids are kept, the next reload is due after max_age again
+            logger.exception('reloading the quiz question ids failed')
+            self.loaded_at = time.monotonic()
+        finally:
+            self.background_reload = None
+
+    def load(self):
+        # runs with load_lock held. the changes made while loader() runs are kept aside and replayed
+        # on the new ids, loader() may or may not have seen them, replaying is the same either way
+        with self.lock:
+            self.pending_changes = []
+            generation = self.generation
+
+        try:
+            all_ids = array('q')
+            category_ids = {}
+            for question_id, category_id in self.loader():
+                all_ids.append(question_id)
+                category_ids.setdefault(category_id, array('q')).append(question_id)
+
+            ids = QuestionIds()
+            ids.all_ids = array('q', sorted(all_ids))
+            ids.category_ids = {category_id: array('q', sorted(question_ids))
+                                for category_id, question_ids in category_ids.items()}
+        except Exception:
+            with self.lock:
+                self.pending_changes = None
+            raise
+
+        with self.lock:
+            for change, question_id, category_id in self.pending_changes:
+                getattr(ids, change)(question_id, category_id)
+            self.pending_changes = None
+            self.ids = ids
+            self.loaded_at = time.monotonic() if generation == self.generation else None
+
+    def reload(self):
+        # loads the ids again in the foreground, ex: after the database was recreated
+        with self.load_lock:
+            self.load()
+
+    def invalidate(self):
+        # the ids are out of date (ex: after a bulk import), they are reloaded in the background and
+        # the draws keep using the current ones until then
+        with self.lock:
+            self.generation += 1
+            self.loaded_at = None
+        self.start_reload()
+
+    def ids_of(self, category_id=None):
+        ids = self.ids
+        return ids.ids_of(category_id) if ids is not None else array('q')
+
+    def change(self, change, question_id, category_id):
+        with self.lock:
+            if self.pending_changes is not None:
+                self.pending_changes.append((change, question_id, category_id))
+            if self.ids is not None:
+                getattr(self.ids, change)(question_id, category_id)
+
+    def add(self, question_id, category_id):
+        # no-op until the ids are loaded, loader sees the new question anyway
+        self.change('add', question_id, category_id)
+
+    def remove(self, question_id, category_id=None):
+        self.change('remove', question_id, category_id)
+
+    def count(self, category_id=None):
+        self.ensure_loaded()
+        return len(self.ids_of(category_id))
+
+    def sample(self, category_id=None, exclude=()):
+        # a uniformly random question id of the category that isn't in exclude, None if there is none left.
+        # while exclude is a small part of the category a draw takes a few random indexes (O(1) expected),
+        # past MAX_REJECTIONS misses the remaining ids are filtered out and drawn from (O(n)).
+        self.ensure_loaded()
+        exclude = set(exclude)
+
+        with self.lock:
+            ids = self.ids_of(category_id)
+            if len(ids) == 0:
+                return None
+
+            for _ in range(self.MAX_REJECTIONS):
+                question_id = ids[self.random.randrange(len(ids))]
+                if question_id not in exclude:
+                    return question_id
+
+            remaining = [question_id for question_id in ids if question_id not in exclude]
+            if len(remaining) == 0:
+                return None
+            return self.random.choice(remaining)
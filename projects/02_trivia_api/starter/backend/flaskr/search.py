@@ -0,0 +1,264 @@
+import bisect
+import logging
+import math
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# a term in the question counts more than the same term in the answer
+QUESTION_WEIGHT = 2.0
+ANSWER_WEIGHT = 1.0
+# a term that only starts with the search word counts less than the word itself
+PREFIX_WEIGHT = 0.5
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+class IndexTable:
+    # the postings, documents and sorted terms of one build of a QuestionIndex, a rebuild makes a new one
+    # and swaps it in
+
+    def __init__(self):
+        # term -> {id: weight of the term in that question}
+        self.postings = {}
+        # id -> {term: weight}, to find the postings of a question again on remove
+        self.documents = {}
+        # the sorted vocabulary for the prefix lookups
+        self.terms = []
+
+    def _add(self, id, question, answer):
+        weights = {}
+        for text, weight in ((question, QUESTION_WEIGHT), (answer, ANSWER_WEIGHT)):
+            for term in tokenize(text):
+                weights[term] = weights.get(term, 0) + weight
+
+        self.documents[id] = weights
+        new_terms = []
+        for term, weight in weights.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                new_terms.append(term)
+            posting[id] = weight
+        return new_terms
+
+    def add(self, id, question, answer):
+        # adds or replaces the texts of id
+        self.remove(id)
+        for term in self._add(id, question, answer):
+            bisect.insort(self.terms, term)
+
+    def remove(self, id):
+        weights = self.documents.pop(id, None)
+        if weights is None:
+            return
+
+        for term in weights:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(id, None)
+            if len(posting) == 0:
+                del self.postings[term]
+                index = bisect.bisect_left(self.terms, term)
+                if index < len(self.terms) and self.terms[index] == term:
+                    del self.terms[index]
+
+    def expand(self, word):
+        # the indexed terms starting with word, word itself first if it's one of them
+        start = bisect.bisect_left(self.terms, word)
+        end = start
+        while end < len(self.terms) and self.terms[end].startswith(word):
+            end += 1
+        return self.terms[start:end]
+
+
+class QuestionIndex:
+    # in-process inverted index over the question and answer texts, used by the question search instead of
+    # ILIKE '%term%' (which scans the whole table and can't rank).
+    #
+    # a search matches the questions that contain every word of the search term, as a word or as the start
+    # of a word ("pain" finds "painter"). they are ranked by tf-idf, question words weighing more than answer
+    # words and whole words more than prefixes, best first and by id on ties.
+    #
+    # the index is built from loader() on the first search, loader returns an iterable of
+    # (id, question, answer). add/remove keep it up to date afterwards, they are no-ops until it's built.
+    # it only sees the writes of its own process, with several workers max_age (seconds) makes it rebuild
+    # from loader() once it gets older than that. that rebuild runs in a background thread (inside context(),
+    # ex: app.app_context) while the searches keep using the current table, the new table is swapped in with
+    # one assignment once it's built, with the adds/removes made meanwhile replayed.
+
+    def __init__(self, loader, max_age=None, context=None):
+        self.loader = loader
+        self.max_age = max_age
+        self.context = context
+        self.table = None
+        self.loaded_at = None
+        # guards the table's changes and the swap, never held while loader() runs
+        self.lock = threading.RLock()
+        # one build at a time
+        self.build_lock = threading.Lock()
+        self.background_rebuild = None
+        # (id, (question, answer) or None for a remove) made while a build runs, None when no build runs
+        self.pending_changes = None
+        # bumped by invalidate(), a build that started before it is stale as soon as it's swapped in
+        self.generation = 0
+
+    @property
+    def postings(self):
+        table = self.table
+        return table.postings if table is not None else {}
+
+    @property
+    def documents(self):
+        table = self.table
+        return table.documents if table is not None else {}
+
+    @property
+    def terms(self):
+        table = self.table
+        return table.terms if table is not None else []
+
+    def is_fresh(self):
+        return self.table is not None and self.loaded_at is not None and (
+            self.max_age is None or time.monotonic() - self.loaded_at < self.max_age)
+
+    def ensure_loaded(self):
+        if self.is_fresh():
+            return
+
+        if self.table is None:
+            # nothing to answer with yet, the first search builds it in the foreground
+            with self.build_lock:
+                if self.table is None:
+                    self.build()
+            return
+
+        self.start_rebuild()
+
+    def start_rebuild(self):
+        with self.lock:
+            if self.table is None or self.background_rebuild is not None or self.is_fresh():
+                return
+            self.background_rebuild = threading.Thread(
+                target=self.rebuild_in_background, name='question-index-rebuild', daemon=True)
+        self.background_rebuild.start()
+
+    def rebuild_in_background(self):
+        try:
+            with self.build_lock:
+                if self.context is not None:
+                    with self.context():
+                        self.build()
+                else:
+                    self.build()
+        except Exception:
+            # the current table is kept, the next rebuild is due after max_age again
+            logger.exception('rebuilding the question search index failed')
+            self.loaded_at = time.monotonic()
+        finally:
+            self.background_rebuild = None
+
+    def build(self):
+        # runs with build_lock held. the changes made while loader() runs are kept aside and replayed
+        # on the new table, loader() may or may not have seen them, replaying is the same either way
+        with self.lock:
+            self.pending_changes = []
+            generation = self.generation
+
+        try:
+            table = IndexTable()
+            for id, question, answer in self.loader():
+                table._add(id, question, answer)
+            table.terms = sorted(table.postings)
+        except Exception:
+            with self.lock:
+                self.pending_changes = None
+            raise
+
+        with self.lock:
+            for id, texts in self.pending_changes:
+                if texts is None:
+                    table.remove(id)
+                else:
+                    table.add(id, *texts)
+            self.pending_changes = None
+            self.table = table
+            self.loaded_at = time.monotonic() if generation == self.generation else None
+
+    def rebuild(self):
+        # builds the table again in the foreground, ex: after the database was recreated
+        with self.build_lock:
+            self.build()
+
+    def invalidate(self):
+        # the index is out of date (ex: after a bulk import), it's rebuilt in the background and
+        # the searches keep using the current table until then
+        with self.lock:
+            self.generation += 1
+            self.loaded_at = None
+        self.start_rebuild()
+
+    def change(self, id, texts):
+        with self.lock:
+            if self.pending_changes is not None:
+                self.pending_changes.append((id, texts))
+            if self.table is not None:
+                if texts is None:
+                    self.table.remove(id)
+                else:
+                    self.table.add(id, *texts)
+
+    def add(self, id, question, answer):
+        # adds or replaces the texts of id
+        self.change(id, (question, answer))
+
+    def remove(self, id):
+        self.change(id, None)
+
+    def search(self, search_term):
+        # returns the ids of the matching questions, best match first.
+        # a search term without any word matches every question, in id order
+        self.ensure_loaded()
+        words = list(dict.fromkeys(tokenize(search_term)))
+
+        with self.lock:
+            table = self.table
+            if len(words) == 0:
+                return sorted(table.documents)
+
+            total = len(table.documents)
+            scores = None
+            for word in words:
+                # score of every question matching this word, on its best matching term
+                word_scores = {}
+                for term in table.expand(word):
+                    posting = table.postings[term]
+                    idf = math.log(1 + total / len(posting))
+                    weight = idf if term == word else idf * PREFIX_WEIGHT
+                    for id, term_weight in posting.items():
+                        score = term_weight * weight
+                        if score > word_scores.get(id, 0):
+                            word_scores[id] = score
+
+                if scores is None:
+                    scores = word_scores
+                else:
+                    # every word has to match, smaller dict first
+                    if len(word_scores) < len(scores):
+                        scores, word_scores = word_scores, scores
+                    scores = {id: score + word_scores[id]
+                              for id, score in scores.items() if id in word_scores}
+                if len(scores) == 0:
+                    return []
+
+            return sorted(scores, key=lambda id: (-scores[id], id))
+
+    def __len__(self):
+        return len(self.documents)
@@ -1,6 +1,7 @@
 import os
 from sqlalchemy import Column, String, Integer, create_engine, ForeignKey
 from flask_sqlalchemy import SQLAlchemy
+from fsnd_common.dbpool import configure_pool
 from sqlalchemy.orm import relationship
 from flask_migrate import Migrate
 
@@ -11,7 +12,8 @@ db = SQLAlchemy()
 
 
 def setup_db(app):
-
+    # the connection pool is set up from the DB_POOL_* settings, see fsnd_common/dbpool.py
+    configure_pool(app)
     db.app = app
     db.init_app(app)
     Migrate(app, db)
@@ -20,6 +22,7 @@ def setup_db(app):
 def setup_test_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = "postgres://{}:{}@{}/{}".format(
         'postgres', 'root', 'localhost: 5432', 'trivia_test')
+    configure_pool(app)
     db.app = app
     db.init_app(app)
 
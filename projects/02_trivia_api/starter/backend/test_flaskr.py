@@ -1,10 +1,16 @@
 import os
 import unittest
 import json
+import tempfile
+import threading
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
-from models import setup_test_db, Question, Category
+from flaskr import create_app, bulk
+from flaskr.quiz import QuestionSampler
+from flaskr.search import QuestionIndex
+from models import setup_test_db, Question, Category, db
+from fsnd_common.querystats import assert_max_queries
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -50,6 +56,36 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(len(data.get('categories')))
 
+    def test_categories_not_modified(self):
+        etag = self.client().get('/categories').headers.get('ETag')
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertTrue(etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_categories_etag_changes_after_a_write(self):
+        etag = self.client().get('/categories').headers.get('ETag')
+
+        with self.app.app_context():
+            category = Category('Test category')
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+        self.addCleanup(self.delete_category, category_id)
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        data = load_response_data(res)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers.get('ETag'), etag)
+        self.assertEqual(data.get('categories')[-1], 'Test category')
+
+    def delete_category(self, category_id):
+        with self.app.app_context():
+            db.session.delete(Category.query.get(category_id))
+            db.session.commit()
+
     # def test_gets_404_when_categories_empty(self):
     #     res = self.client().get('/categories')
 
@@ -66,6 +102,14 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data.get('questions')), 10)
         self.assertTrue(data.get('questions')[0].get('category') != None)
 
+    def test_questions_page_query_count(self):
+        # the page itself, the total count and the categories, the last two are cached afterwards
+        with assert_max_queries(3):
+            res = self.client().get('/questions?page=1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Server-Timing', res.headers)
+
     def test_get_404_if_questions_not_found(self):
         res = self.client().get('/questions?page=404')
 
@@ -103,6 +147,71 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data.get('questions')))
         self.assertTrue("name" in data.get('questions')[0].get('question'))
 
+    def add_question(self, question, answer):
+        return json.loads(self.client().post("/questions", json={
+            'question': question, 'answer': answer, 'difficulty': 1, 'category': 0}).data).get('id')
+
+    def test_questions_search_ranking(self):
+        # the word in the question weighs more than in the answer, a prefix less than the whole word
+        self.addCleanup(self.delete_questions, 'search test')
+        prefix_id = self.add_question('Which animal lives on Rottnest?', 'search test quokkas')
+        answer_id = self.add_question('Which animal smiles?', 'search test quokka')
+        question_id = self.add_question('Where does the quokka live?', 'search test')
+
+        res = self.client().get("/questions?search=Quokka")
+        data = load_response_data(res)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([question.get('id') for question in data.get('questions')],
+                         [question_id, answer_id, prefix_id])
+
+    def test_questions_search_pages(self):
+        self.addCleanup(self.delete_questions, 'search test')
+        for i in range(12):
+            self.add_question('Which wombat is number %d?' % i, 'search test')
+
+        first_page = load_response_data(self.client().get("/questions?search=wombat"))
+        second_page = load_response_data(self.client().get("/questions?search=wombat&page=2"))
+
+        self.assertEqual(first_page.get('total_questions'), 12)
+        self.assertEqual(len(first_page.get('questions')), 10)
+        self.assertEqual(len(second_page.get('questions')), 2)
+        self.assertFalse({question.get('id') for question in first_page.get('questions')} &
+                         {question.get('id') for question in second_page.get('questions')})
+
+    def test_search_index_rebuilds_in_the_background(self):
+        rows = [(1, 'Who painted the Mona Lisa?', 'Leonardo'), (2, 'Who painted Guernica?', 'Picasso')]
+        building = threading.Event()
+        released = threading.Event()
+
+        def loader():
+            if index.table is not None:
+                building.set()
+                released.wait(5)
+            return list(rows)
+
+        index = QuestionIndex(loader, max_age=60)
+        self.assertEqual(index.search('painted'), [1, 2])
+        # a question another worker added, then the index gets older than max_age
+        rows.append((3, 'Who painted the Starry Night?', 'Van Gogh'))
+        index.loaded_at -= 60
+
+        # the search starts the rebuild and is answered from the current table
+        self.assertEqual(index.search('painted'), [1, 2])
+        building.wait(5)
+        # the changes this process makes while the rebuild runs are kept by the new table as well
+        index.remove(1)
+        index.add(4, 'Who painted the Scream?', 'Munch')
+        self.assertEqual(index.search('painted'), [2, 4])
+        rebuild = index.background_rebuild
+        released.set()
+        rebuild.join(5)
+
+        self.assertEqual(index.search('painted'), [2, 3, 4])
+        self.assertEqual(index.search('munch'), [4])
+        self.assertEqual(index.search('leonardo'), [])
+        self.assertTrue(index.is_fresh())
+
     def test_sorting_by_category(self):
         # in the route function i increment the id.
         res = self.client().get("/categories/0/questions")
@@ -112,6 +221,21 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data.get('questions')))
         self.assertEqual(data.get('questions')[0].get('category'), 1)
 
+    def test_category_questions_all_streamed(self):
+        # two rows per chunk so the chunks have to be joined up into one json document
+        with mock.patch('flaskr.STREAM_CHUNK_SIZE', 2):
+            res = self.client().get("/categories/0/questions?all=true")
+            data = load_response_data(res)
+
+        self.assertEqual(res.status_code, 200)
+        # a streamed response has no length, jsonify's has one
+        self.assertNotIn('Content-Length', res.headers)
+        self.assertEqual(len(data.get('questions')), data.get('totalQuestions'))
+        self.assertEqual({question.get('category') for question in data.get('questions')}, {1})
+        self.assertEqual([question.get('id') for question in data.get('questions')],
+                         sorted(self.science_question_ids()))
+        self.assertEqual(data.get('currentCategory'), 'Science')
+
     def test_404_if_category_not_found(self):
         res = self.client().get("/categories/300/questions")
 
@@ -139,12 +263,201 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data.get('question')))
 
 
+    def science_question_ids(self):
+        # the frontend's category 0 is the category with id 1
+        with self.app.app_context():
+            return [id for id, in db.session.query(Question.id).filter(Question.category_id == 1)]
+
+    def test_quizz_skips_every_previous_question(self):
+        question_ids = self.science_question_ids()
+        res = self.client().post(
+            "/quizzes", json={"previous_questions": question_ids[1:], "quiz_category": {"id": "0", "type": "Science"}})
+
+        data = load_response_data(res)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data.get('question').get('id'), question_ids[0])
+
+    def test_quizz_ends_with_null_question(self):
+        res = self.client().post(
+            "/quizzes", json={"previous_questions": self.science_question_ids(),
+                              "quiz_category": {"id": "0", "type": "Science"}})
+
+        data = load_response_data(res)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(data.get('question'))
+
     def test_quizz_not_found(self):
         res = self.client().post(
             "/quizzes", json={"previous_questions": [2], "quiz_category": {"id": "2222"}})
 
         self.assertEqual(res.status_code, 404)
 
+    def test_quizz_drops_a_question_deleted_by_another_worker(self):
+        question_ids = self.science_question_ids()
+        sampler = self.app.extensions['question_sampler']
+        self.client().post("/quizzes", json={"previous_questions": [], "quiz_category": {"id": "0", "type": "Science"}})
+        # a question another worker deleted, it's the only one left to draw
+        sampler.add(999999, 1)
+
+        res = self.client().post(
+            "/quizzes", json={"previous_questions": question_ids, "quiz_category": {"id": "0", "type": "Science"}})
+        reload = sampler.background_reload
+        if reload is not None:
+            reload.join(5)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(load_response_data(res).get('question'))
+        self.assertEqual(list(sampler.ids_of(1)), sorted(question_ids))
+
+    def test_sampler_reloads_in_the_background(self):
+        rows = [(1, 1), (2, 1)]
+        loading = threading.Event()
+        released = threading.Event()
+
+        def loader():
+            if sampler.ids is not None:
+                loading.set()
+                released.wait(5)
+            return list(rows)
+
+        sampler = QuestionSampler(loader, max_age=60)
+        self.assertEqual(sampler.count(), 2)
+        # a question another worker added, then the ids get older than max_age
+        rows.append((3, 2))
+        sampler.loaded_at -= 60
+
+        # the draw starts the reload and is answered from the current ids
+        self.assertEqual(sampler.count(), 2)
+        loading.wait(5)
+        # a question this process adds while the reload runs is kept by the new ids as well
+        sampler.add(4, 2)
+        self.assertEqual(list(sampler.ids_of()), [1, 2, 4])
+        reload = sampler.background_reload
+        released.set()
+        reload.join(5)
+
+        self.assertEqual(list(sampler.ids_of()), [1, 2, 3, 4])
+        self.assertEqual(list(sampler.ids_of(2)), [3, 4])
+        self.assertTrue(sampler.is_fresh())
+
+    def delete_questions(self, answer):
+        # removes the questions a test added, they are told apart by the start of their answer
+        with self.app.app_context():
+            Question.query.filter(Question.answer.startswith(answer)).delete(
+                synchronize_session=False)
+            db.session.commit()
+
+    def test_bulk_import_reports_invalid_rows(self):
+        self.addCleanup(self.delete_questions, 'bulk answer')
+        body = '\n'.join([
+            json.dumps({'question': 'bulk question?', 'answer': 'bulk answer', 'difficulty': 2, 'category': 1}),
+            json.dumps({'question': 'no answer?', 'difficulty': 2, 'category': 1}),
+            json.dumps({'question': 'too hard?', 'answer': 'bulk answer', 'difficulty': 9, 'category': 1}),
+            json.dumps({'question': 'no category?', 'answer': 'bulk answer', 'difficulty': 2, 'category': 999}),
+            'not json',
+        ])
+        res = self.client().post('/questions/bulk', data=body, content_type='application/x-ndjson')
+        data = load_response_data(res)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data.get('inserted'), 1)
+        self.assertEqual(data.get('rejected'), 4)
+        self.assertEqual([error['line'] for error in data.get('errors')], [2, 3, 4, 5])
+        self.assertEqual(data.get('errors')[0]['error'], 'answer is missing')
+        self.assertEqual(data.get('errors')[3]['error'], 'not a json object')
+
+    def test_bulk_import_csv(self):
+        self.addCleanup(self.delete_questions, 'bulk answer')
+        body = 'question,answer,difficulty,category\nbulk question?,bulk answer,2,1\n'
+        res = self.client().post('/questions/bulk', data=body, content_type='text/csv')
+        data = load_response_data(res)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data.get('inserted'), 1)
+        self.assertEqual(data.get('rejected'), 0)
+
+    def test_bulk_import_unknown_format_is_400(self):
+        res = self.client().post('/questions/bulk?format=xml', data='<questions/>')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_bulk_import_rolls_back_only_the_failing_chunk(self):
+        # the second chunk has a row the database rejects though it passed validation,
+        # the first and the third chunk still get committed
+        self.addCleanup(self.delete_questions, 'bulk answer')
+        rows = [{'question': 'bulk question %d?' % i, 'answer': 'bulk answer', 'difficulty': 2, 'category': 1}
+                for i in range(5)]
+        lines = [json.dumps(row) + '\n' for row in rows]
+        validate_row = bulk.validate_row
+
+        def validate_row_letting_a_null_through(row, category_ids):
+            values, error = validate_row(row, category_ids)
+            if values is not None and values['question'] == 'bulk question 3?':
+                values['question'] = None
+            return values, error
+
+        with self.app.app_context(), mock.patch.object(bulk, 'validate_row', validate_row_letting_a_null_through):
+            report = bulk.import_questions(lines, 'ndjson', chunk_size=2)
+
+            questions = [question for question, in db.session.query(Question.question).filter(
+                Question.answer == 'bulk answer').order_by(Question.id)]
+
+        self.assertEqual(report['inserted'], 3)
+        self.assertEqual(report['rejected'], 2)
+        self.assertEqual([error['line'] for error in report['errors']], [3, 4])
+        self.assertTrue(report['errors'][0]['error'].startswith('chunk failed'))
+        self.assertEqual(questions, ['bulk question 0?', 'bulk question 1?', 'bulk question 4?'])
+
+    def test_export_questions(self):
+        res = self.client().get('/questions/export')
+        lines = res.data.decode('utf-8').splitlines()
+
+        with self.app.app_context():
+            total_questions = Question.query.count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), total_questions)
+        self.assertEqual(list(json.loads(lines[0])), list(bulk.FIELDS))
+
+    def test_export_questions_csv(self):
+        res = self.client().get('/questions/export?format=csv')
+        lines = res.data.decode('utf-8').splitlines()
+
+        with self.app.app_context():
+            total_questions = Question.query.count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertEqual(lines[0], ','.join(bulk.FIELDS))
+        self.assertEqual(len(lines), total_questions + 1)
+
+    def test_import_questions_command(self):
+        self.addCleanup(self.delete_questions, 'bulk answer')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('question,answer,difficulty,category\n'
+                       'bulk question?,bulk answer,2,1\n'
+                       'too hard?,bulk answer,9,1\n')
+        self.addCleanup(os.remove, file.name)
+
+        result = self.app.test_cli_runner().invoke(args=['import-questions', file.name])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('1 questions imported, 1 rejected', result.output)
+        self.assertIn('line 3: difficulty must be between 1 and 5', result.output)
+
+    def test_export_questions_command(self):
+        result = self.app.test_cli_runner().invoke(args=['export-questions', '--format', 'csv'])
+
+        with self.app.app_context():
+            total_questions = Question.query.count()
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output.splitlines()[0], ','.join(bulk.FIELDS))
+        self.assertEqual(len(result.output.splitlines()), total_questions + 1)
+
 def load_response_data(res):
     return json.loads(res.data)
 
@@ -0,0 +1 @@
+# benchmarks of the coffee shop backend, run them from the backend folder: python -m benchmarks.<name>
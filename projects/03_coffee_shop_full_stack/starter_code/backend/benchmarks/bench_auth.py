@@ -0,0 +1,63 @@
+# requests per second through @requires_auth with and without the verified-token cache, ex:
+#   python -m benchmarks.bench_auth --requests 2000
+import argparse
+import time
+
+from flask import Flask, jsonify
+
+from benchmarks.tokens import setup_auth
+
+
+def create_bench_app(auth):
+    app = Flask(__name__)
+
+    @app.route('/drinks-detail')
+    @auth.requires_auth('get:drinks-detail')
+    def drinks_detail(payload):
+        return jsonify({'success': True})
+
+    @app.errorhandler(auth.AuthError)
+    def auth_error(error):
+        return jsonify(error.error), error.status_code
+
+    return app
+
+
+def requests_per_second(client, headers, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get('/drinks-detail', headers=headers)
+        assert response.status_code == 200, response.data
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='requests/s of a @requires_auth route, with and without the verified-token cache')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--tokens', type=int, default=10,
+                        help='distinct bearer tokens the requests rotate through')
+    args = parser.parse_args()
+
+    issuer, auth = setup_auth()
+    client = create_bench_app(auth).test_client()
+    headers = [{'Authorization': 'Bearer ' + issuer.token(
+        auth.AUTH0_DOMAIN, auth.API_AUDIENCE, ['get:drinks-detail'], subject='user-%d' % i)}
+        for i in range(args.tokens)]
+
+    def run():
+        per_token = max(1, args.requests // len(headers))
+        rates = [requests_per_second(client, header, per_token) for header in headers]
+        return len(rates) / sum(1 / rate for rate in rates)
+
+    print('%-28s %12s' % ('token cache', 'requests/s'))
+    cache = auth.token_cache
+    auth.token_cache = auth.VerifiedTokenCache(max_entries=0)
+    print('%-28s %12.0f' % ('off (RS256 every request)', run()))
+    auth.token_cache = cache
+    print('%-28s %12.0f' % ('on', run()))
+    print('hits %d, misses %d' % (cache.hits, cache.misses))
+
+
+if __name__ == '__main__':
+    main()
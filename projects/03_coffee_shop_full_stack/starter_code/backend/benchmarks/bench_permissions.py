@@ -0,0 +1,55 @@
+# auth check overhead per request: @requires_auth around a no-op view with a token already in the
+# verified-token cache, against the bare view, ex:
+#   python -m benchmarks.bench_permissions --calls 100000
+import argparse
+import time
+
+from flask import Flask
+
+from benchmarks.tokens import setup_auth
+
+
+def microseconds_per_call(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='microseconds @requires_auth adds to a request once the token is cached')
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--permissions', type=int, default=50,
+                        help='permissions in the token, the checked one last')
+    args = parser.parse_args()
+
+    issuer, auth = setup_auth()
+    permissions = ['bench:%d' % i for i in range(args.permissions - 1)] + ['post:drinks']
+    token = issuer.token(auth.AUTH0_DOMAIN, auth.API_AUDIENCE, permissions)
+    payload, permission_set = auth.verify_token(token)
+
+    def view(payload=None):
+        return payload
+
+    guarded = auth.requires_auth('post:drinks')(view)
+    app = Flask(__name__)
+
+    with app.test_request_context(headers={'Authorization': 'Bearer ' + token}):
+        results = [
+            ('bare view', microseconds_per_call(view, args.calls)),
+            ('@requires_auth', microseconds_per_call(guarded, args.calls)),
+            ('permission in permissions list', microseconds_per_call(
+                lambda: 'post:drinks' in payload['permissions'], args.calls)),
+            ('check_permissions, frozenset', microseconds_per_call(
+                lambda: auth.check_permissions('post:drinks', payload, permission_set), args.calls)),
+        ]
+
+    print('%-32s %10s' % ('', 'us/call'))
+    for name, microseconds in results:
+        print('%-32s %10.2f' % (name, microseconds))
+    print('%-32s %10.2f' % ('auth overhead per request', results[1][1] - results[0][1]))
+
+
+if __name__ == '__main__':
+    main()
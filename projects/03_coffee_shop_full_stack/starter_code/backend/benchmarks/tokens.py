@@ -0,0 +1,40 @@
+import base64
+import json
+import os
+import tempfile
+import time
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+KID = 'bench-key'
+
+
+def b64_int(value):
+    return base64.urlsafe_b64encode(value.to_bytes((value.bit_length() + 7) // 8, 'big')).rstrip(b'=').decode()
+
+
+class TokenIssuer:
+    # a local stand-in for the Auth0 tenant: an RSA key, its jwks.json in a temporary file and RS256 tokens
+    def __init__(self):
+        self.key = RSA.generate(2048)
+        self.pem = self.key.exportKey('PEM').decode()
+        self.jwks_path = os.path.join(tempfile.mkdtemp(), 'jwks.json')
+        with open(self.jwks_path, 'w') as jwks_file:
+            json.dump({'keys': [{'kty': 'RSA', 'kid': KID, 'use': 'sig', 'alg': 'RS256',
+                                 'n': b64_int(self.key.n), 'e': b64_int(self.key.e)}]}, jwks_file)
+
+    def token(self, domain, audience, permissions=(), expires_in=3600, subject='bench-user'):
+        now = int(time.time())
+        payload = {'iss': 'https://%s/' % domain, 'aud': audience, 'sub': subject, 'iat': now,
+                   'exp': now + expires_in, 'permissions': list(permissions)}
+        return jwt.encode(payload, self.pem, algorithm='RS256', headers={'kid': KID})
+
+
+def setup_auth():
+    # jwks_url is read when src.auth.auth gets imported, so it has to point at the local keys first
+    issuer = TokenIssuer()
+    os.environ['JWKS_URL'] = issuer.jwks_path
+
+    from src.auth import auth
+    return issuer, auth
@@ -1,16 +1,22 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, Response
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from fsnd_common.dbpool import pool_stats
+
+from .database.models import db_drop_and_create_all, setup_db, db, Drink, drinks_json, table_etag
+from .auth.auth import AuthError, requires_auth, validate_route_permissions
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
 
+# seconds a shared cache (a reverse proxy in front of the app) may serve GET /drinks without asking again,
+# after that it revalidates with If-None-Match and usually gets a 304
+DRINKS_SHARED_MAX_AGE = int(os.environ.get('DRINKS_SHARED_MAX_AGE', 5))
+
 '''
 @TODO uncomment the following line to initialize the datbase
 !! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
@@ -20,59 +26,152 @@ CORS(app)
 
 ## ROUTES
 '''
-@TODO implement endpoint
-    GET /drinks
-        it should be a public endpoint
-        it should contain only the drink.short() data representation
-    returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
-        or appropriate status code indicating reason for failure
+drinks_response(form)
+    {"success": True, "drinks": drinks} with the drinks in 'short' or 'long' form, put together from
+    the pre-encoded drink fragments instead of encoding the whole list again.
+    the etag comes from the drinks table version, a request with a matching If-None-Match gets a 304
+    instead of the drinks query, usually without a query at all (see table_etag). the version is read
+    before the drinks so a write in between can only make the etag older than the body, never newer
+'''
+def drinks_response(form):
+    etag = table_etag('drinks', form)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(b'{"success": true, "drinks": ' + drinks_json(form) + b'}',
+                            mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+'''
+GET /drinks
+    it is a public endpoint
+    it contains only the drink.short() data representation
+returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
+    or appropriate status code indicating reason for failure
+'''
+@app.route('/drinks')
+def get_drinks():
+    response = drinks_response('short')
+    response.cache_control.public = True
+    response.cache_control.max_age = 0
+    response.cache_control.s_maxage = DRINKS_SHARED_MAX_AGE
+    return response
+
+
+'''
+GET /drinks-detail
+    it requires the 'get:drinks-detail' permission
+    it contains the drink.long() data representation
+returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
+    or appropriate status code indicating reason for failure
+'''
+@app.route('/drinks-detail')
+@requires_auth('get:drinks-detail')
+def get_drinks_detail(payload):
+    # only for authorized users, so no shared cache may keep it. browsers revalidate with the etag
+    response = drinks_response('long')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+'''
+recipe_from_request(recipe)
+    the recipe blob of a request recipe, a list of ingredients or a single ingredient object
 '''
+def recipe_from_request(recipe):
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if not isinstance(recipe, list) or not all(isinstance(r, dict) for r in recipe):
+        abort(422)
+    return json.dumps(recipe)
 
 
 '''
-@TODO implement endpoint
-    GET /drinks-detail
-        it should require the 'get:drinks-detail' permission
-        it should contain the drink.long() data representation
-    returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
-        or appropriate status code indicating reason for failure
+POST /drinks
+    it creates a new row in the drinks table
+    it requires the 'post:drinks' permission
+    it contains the drink.long() data representation
+returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink
+    or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks', methods=['POST'])
+@requires_auth('post:drinks')
+def create_drink(payload):
+    body = request.get_json(silent=True) or {}
+    if not body.get('title') or 'recipe' not in body:
+        abort(422)
+
+    drink = Drink(title=body['title'], recipe=recipe_from_request(body['recipe']))
+    try:
+        drink.insert()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
+
+    return jsonify({"success": True, "drinks": [drink.long()]})
 
 
 '''
-@TODO implement endpoint
-    POST /drinks
-        it should create a new row in the drinks table
-        it should require the 'post:drinks' permission
-        it should contain the drink.long() data representation
-    returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink
-        or appropriate status code indicating reason for failure
+PATCH /drinks/<id>
+    where <id> is the existing model id
+    it responds with a 404 error if <id> is not found
+    it updates the corresponding row for <id>
+    it requires the 'patch:drinks' permission
+    it contains the drink.long() data representation
+returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
+    or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks/<int:id>', methods=['PATCH'])
+@requires_auth('patch:drinks')
+def update_drink(payload, id):
+    drink = Drink.query.filter(Drink.id == id).one_or_none()
+    if drink is None:
+        abort(404)
+
+    body = request.get_json(silent=True) or {}
+    if body.get('title'):
+        drink.title = body['title']
+    if 'recipe' in body:
+        drink.recipe = recipe_from_request(body['recipe'])
+    try:
+        drink.update()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
+
+    return jsonify({"success": True, "drinks": [drink.long()]})
 
 
 '''
-@TODO implement endpoint
-    PATCH /drinks/<id>
-        where <id> is the existing model id
-        it should respond with a 404 error if <id> is not found
-        it should update the corresponding row for <id>
-        it should require the 'patch:drinks' permission
-        it should contain the drink.long() data representation
-    returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
-        or appropriate status code indicating reason for failure
+DELETE /drinks/<id>
+    where <id> is the existing model id
+    it responds with a 404 error if <id> is not found
+    it deletes the corresponding row for <id>
+    it requires the 'delete:drinks' permission
+returns status code 200 and json {"success": True, "delete": id} where id is the id of the deleted record
+    or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks/<int:id>', methods=['DELETE'])
+@requires_auth('delete:drinks')
+def delete_drink(payload, id):
+    drink = Drink.query.filter(Drink.id == id).one_or_none()
+    if drink is None:
+        abort(404)
+
+    drink.delete()
+    return jsonify({"success": True, "delete": id})
 
 
 '''
-@TODO implement endpoint
-    DELETE /drinks/<id>
-        where <id> is the existing model id
-        it should respond with a 404 error if <id> is not found
-        it should delete the corresponding row for <id>
-        it should require the 'delete:drinks' permission
-    returns status code 200 and json {"success": True, "delete": id} where id is the id of the deleted record
-        or appropriate status code indicating reason for failure
+GET /db/stats
+    the connection pool counters of this process (only the pool class on sqlite)
 '''
+@app.route('/db/stats')
+def db_stats():
+    return jsonify(pool_stats(db.engine))
 
 
 ## Error Handling
@@ -99,12 +198,31 @@ def unprocessable(error):
 '''
 
 '''
-@TODO implement error handler for 404
-    error handler should conform to general task above 
+error handler for 404
+    conforms to the general task above
 '''
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({
+                    "success": False,
+                    "error": 404,
+                    "message": "resource not found"
+                    }), 404
 
 
 '''
-@TODO implement error handler for AuthError
-    error handler should conform to general task above 
+error handler for AuthError
+    conforms to the general task above
 '''
+@app.errorhandler(AuthError)
+def auth_error(error):
+    return jsonify({
+                    "success": False,
+                    "error": error.status_code,
+                    "message": error.error['description']
+                    }), error.status_code
+
+
+# every write route has to be guarded by a permission, checked once here instead of per request.
+# {(method, rule): permission}, auth.ROUTE_PERMISSIONS is the same keyed by view function name
+ENDPOINT_PERMISSIONS = validate_route_permissions(app)
@@ -1,14 +1,35 @@
-import json
-from flask import request, _request_ctx_stack
+import os
+from flask import request
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from fsnd_common.jwks import JWKSCache, jwks_source
+from fsnd_common.tokens import VerifiedTokenCache
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
 
+# where the signing keys come from, JWKS_URL can point at a local file or a stub server for the tests
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+jwks_cache = JWKSCache(jwks_source(JWKS_URL))
+# verified tokens, so the same bearer token isn't RS256 verified again on every request
+token_cache = VerifiedTokenCache(
+    max_entries=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+
+# the permissions of the coffee shop API in Auth0, @requires_auth refuses anything else when the routes get defined
+PERMISSIONS = frozenset([
+    'get:drinks-detail',
+    'post:drinks',
+    'patch:drinks',
+    'delete:drinks',
+])
+# the permission of every @requires_auth view function by name, filled at import time
+ROUTE_PERMISSIONS = {}
+# the methods a route can't serve without a permission
+WRITE_METHODS = frozenset(['POST', 'PUT', 'PATCH', 'DELETE'])
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -23,64 +44,201 @@ class AuthError(Exception):
 ## Auth Header
 
 '''
-@TODO implement get_token_auth_header() method
-    it should attempt to get the header from the request
-        it should raise an AuthError if no header is present
-    it should attempt to split bearer and the token
-        it should raise an AuthError if the header is malformed
+get_token_auth_header() method
+    it attempts to get the header from the request
+        it raises an AuthError if no header is present
+    it attempts to split bearer and the token
+        it raises an AuthError if the header is malformed
     return the token part of the header
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
 
 '''
-@TODO implement check_permissions(permission, payload) method
+check_permissions(permission, payload, permissions=None) method
     @INPUTS
         permission: string permission (i.e. 'post:drink')
         payload: decoded jwt payload
+        permissions: the payload permissions as a frozenset, as cached by token_cache,
+            built from the payload if not given
 
-    it should raise an AuthError if permissions are not included in the payload
+    it raises an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
-    it should raise an AuthError if the requested permission string is not in the payload permissions array
+    it raises an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
 '''
-def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+def check_permissions(permission, payload, permissions=None):
+    if permissions is None:
+        if not isinstance(payload.get('permissions'), list):
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Permissions not included in JWT.'
+            }, 400)
+        permissions = frozenset(payload['permissions'])
+
+    if permission not in permissions:
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+
+    return True
 
 '''
-@TODO implement verify_decode_jwt(token) method
+verify_decode_jwt(token) method
     @INPUTS
         token: a json web token (string)
 
     it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
-    it should decode the payload from the token
-    it should validate the claims
+    it verifies the token with the key of that kid from jwks_cache (Auth0 /.well-known/jwks.json,
+    fetched once and refreshed in the background, see fsnd_common/jwks.py)
+    it decodes the payload from the token and validates the claims
     return the decoded payload
 
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+
+    rsa_key = jwks_cache.get_key(unverified_header['kid'])
+    if rsa_key is None:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+
+    try:
+        return jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/'
+        )
+
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+
+'''
+verify_token(token) method
+    the (payload, permissions frozenset) of a token, from token_cache if it was verified before,
+    verify_decode_jwt otherwise
+'''
+def verify_token(token):
+    verified = token_cache.get(token)
+    if verified is None:
+        verified = token_cache.set(token, verify_decode_jwt(token))
+    return verified
 
 '''
-@TODO implement @requires_auth(permission) decorator method
+@requires_auth(permission) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'), '' to only require a valid token
 
-    it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
-    it should use the check_permissions method validate claims and check the requested permission
+    it raises a ValueError when the route is defined if permission isn't one of PERMISSIONS,
+    or if a view function of the same name was registered with another permission
+    it registers the permission of the decorated method in ROUTE_PERMISSIONS
+    it uses the get_token_auth_header method to get the token
+    it uses the verify_token method to decode the jwt (or get it from the verified tokens)
+    it uses the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
 def requires_auth(permission=''):
+    if permission and permission not in PERMISSIONS:
+        raise ValueError('unknown permission %r, expected one of %s' % (
+            permission, ', '.join(sorted(PERMISSIONS))))
+
     def requires_auth_decorator(f):
+        if ROUTE_PERMISSIONS.get(f.__name__, permission) != permission:
+            raise ValueError('%s is already registered with the permission %r' % (
+                f.__name__, ROUTE_PERMISSIONS[f.__name__]))
+        ROUTE_PERMISSIONS[f.__name__] = permission
+
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload, permissions = verify_token(token)
+            if permission:
+                check_permissions(permission, payload, permissions)
             return f(payload, *args, **kwargs)
 
+        wrapper.required_permission = permission
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
+
+'''
+validate_route_permissions(app) method
+    @INPUTS
+        app: the flask app, once all its routes are defined
+
+    it raises a ValueError at startup if a route serving POST/PUT/PATCH/DELETE isn't
+    decorated with @requires_auth and a permission
+    return the {(method, rule): permission} table of the guarded routes
+'''
+def validate_route_permissions(app):
+    table = {}
+    unguarded = []
+    for rule in app.url_map.iter_rules():
+        permission = getattr(app.view_functions[rule.endpoint], 'required_permission', None)
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if permission:
+                table[(method, rule.rule)] = permission
+            elif method in WRITE_METHODS:
+                unguarded.append('%s %s' % (method, rule.rule))
+
+    if unguarded:
+        raise ValueError('routes without a permission: ' + ', '.join(unguarded))
+    return table
\ No newline at end of file
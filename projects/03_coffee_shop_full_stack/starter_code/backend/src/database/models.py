@@ -1,14 +1,26 @@
 import os
+import time
+import uuid
+from functools import lru_cache
 from sqlalchemy import Column, String, Integer
 from flask_sqlalchemy import SQLAlchemy
+from fsnd_common.dbpool import configure_pool
 import json
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+# DATABASE_URL can point the app at another database, ex: the throwaway sqlite file of the tests
+database_path = os.environ.get('DATABASE_URL') or "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
 
+# seconds a process answers with the table version tag it read last instead of reading it again, a write
+# in this process replaces the tag at once, one in another worker process is seen after at most this long
+TABLE_VERSION_TTL = float(os.environ.get('TABLE_VERSION_TTL', 1))
+
+# {name: (tag, time.monotonic() it was read or written at)}, the table version tags of this process
+table_versions = {}
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -16,8 +28,13 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # the connection pool is set up from the DB_POOL_* settings, see fsnd_common/dbpool.py
+    configure_pool(app)
     db.app = app
     db.init_app(app)
+    # the coffee shop has no migrations, its tables come from create_all (see db_drop_and_create_all).
+    # a database from before the table versions gets the table, the other tables are left alone
+    TableVersion.__table__.create(db.engine, checkfirst=True)
 
 '''
 db_drop_and_create_all()
@@ -28,6 +45,7 @@ db_drop_and_create_all()
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    commit_table_write('drinks')
 
 '''
 Drink
@@ -42,17 +60,27 @@ class Drink(db.Model):
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe =  Column(String(180), nullable=False)
 
+    '''
+    parsed_recipe()
+        the recipe blob parsed, kept on the instance and parsed again only once recipe is set
+        to another string (or reloaded with a different one)
+    '''
+    def parsed_recipe(self):
+        recipe = self.recipe
+        if getattr(self, '_parsed_recipe_source', None) is not recipe:
+            self._parsed_recipe = json.loads(recipe)
+            self._parsed_recipe_source = recipe
+        return self._parsed_recipe
+
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': short_recipe(self.parsed_recipe())
         }
 
     '''
@@ -63,7 +91,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.parsed_recipe()
         }
 
     '''
@@ -77,7 +105,7 @@ class Drink(db.Model):
     '''
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit_table_write('drinks')
 
     '''
     delete()
@@ -89,7 +117,7 @@ class Drink(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit_table_write('drinks')
 
     '''
     update()
@@ -101,7 +129,92 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
-        db.session.commit()
+        commit_table_write('drinks')
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+
+'''
+TableVersion
+    a random tag replaced on every write to a table, the etags of the responses built from that table.
+    it is kept in the database and replaced in the transaction of the write, so every worker process
+    sees the same tag, and a tag from before the database was recreated never matches again.
+    each process keeps the tag it read for TABLE_VERSION_TTL seconds, see table_etag
+'''
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+
+    name = Column(String(80), primary_key=True)
+    tag = Column(String(32), nullable=False)
+
+
+'''
+bump_table_version(name)
+    replaces the tag of the table name in the current transaction, committed along with the write.
+    returns the new tag
+'''
+def bump_table_version(name):
+    tag = uuid.uuid4().hex
+    updated = db.session.query(TableVersion).filter(TableVersion.name == name).update(
+        {TableVersion.tag: tag}, synchronize_session=False)
+    if not updated:
+        db.session.add(TableVersion(name=name, tag=tag))
+    return tag
+
+
+'''
+commit_table_write(name)
+    commits the pending write to the table name along with a new tag, which this process
+    answers with from then on
+'''
+def commit_table_write(name):
+    tag = bump_table_version(name)
+    db.session.commit()
+    table_versions[name] = (tag, time.monotonic())
+
+
+'''
+table_etag(name, form)
+    the etag of the 'short' or 'long' form of the responses built from the table name.
+    the tag is read from the database (one primary key lookup) at most once per TABLE_VERSION_TTL,
+    so a revalidation usually gets its 304 without touching the database
+'''
+def table_etag(name, form):
+    now = time.monotonic()
+    cached = table_versions.get(name)
+    if cached is None or now - cached[1] >= TABLE_VERSION_TTL:
+        tag = db.session.query(TableVersion.tag).filter(TableVersion.name == name).scalar() or 'initial'
+        # a write of this process committed while the tag was read is newer, keep that one
+        if table_versions.get(name, cached) is cached:
+            table_versions[name] = (tag, now)
+        cached = (tag, now)
+    return '%s-%s' % (form, cached[0])
+
+
+def short_recipe(recipe):
+    return [{'color': r['color'], 'parts': r['parts']} for r in recipe]
+
+
+'''
+drink_json(form, id, title, recipe)
+    the 'short' or 'long' json representation of a drink row as bytes.
+    the encoded fragments are kept by their row values, so a drink is parsed and encoded once
+    and again only after it changed, and a listing is only a concatenation of cached fragments
+'''
+@lru_cache(maxsize=4096)
+def drink_json(form, id, title, recipe):
+    recipe = json.loads(recipe)
+    if form == 'short':
+        recipe = short_recipe(recipe)
+    return json.dumps({'id': id, 'title': title, 'recipe': recipe}).encode('utf-8')
+
+
+'''
+drinks_json(form)
+    every drink in its 'short' or 'long' json representation as a json array (bytes), from the
+    drink columns only, without loading Drink objects
+'''
+def drinks_json(form):
+    rows = db.session.query(Drink.id, Drink.title, Drink.recipe).order_by(Drink.id)
+    return b'[' + b', '.join(drink_json(form, id, title, recipe) for id, title, recipe in rows) + b']'
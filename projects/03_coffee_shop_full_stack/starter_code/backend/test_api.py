@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+# the app runs on a throwaway sqlite file and verifies the tokens with the local signing key of
+# benchmarks/tokens.py, both have to be set up before src.api is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'coffee_test.db')
+
+from benchmarks.tokens import setup_auth
+
+issuer, auth = setup_auth()
+
+from fsnd_common.querystats import assert_max_queries
+from src import api
+from src.database import models
+from src.database.models import db, db_drop_and_create_all
+
+
+class CoffeeShopTestCase(unittest.TestCase):
+    """The coffee shop api, with tokens signed by a local key"""
+
+    def setUp(self):
+        self.client = api.app.test_client
+        with api.app.app_context():
+            db_drop_and_create_all()
+        auth.token_cache.clear()
+
+    def headers(self, *permissions, audience=auth.API_AUDIENCE):
+        token = issuer.token(auth.AUTH0_DOMAIN, audience, permissions)
+        return {'Authorization': 'Bearer ' + token}
+
+    def test_cached_token_still_needs_the_permission(self):
+        headers = self.headers('get:drinks-detail')
+
+        self.assertEqual(self.client().get('/drinks-detail', headers=headers).status_code, 200)
+        # the token is answered from the cache now, with its own permissions
+        res = self.client().post('/drinks', headers=headers, json={
+            'title': 'Water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]})
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(auth.token_cache.hits, 1)
+
+    def test_token_for_another_audience_is_refused(self):
+        self.assertEqual(self.client().get(
+            '/drinks-detail', headers=self.headers('get:drinks-detail')).status_code, 200)
+
+        res = self.client().get('/drinks-detail', headers=self.headers(
+            'get:drinks-detail', audience='another-api'))
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.get_json()['message'], 'Incorrect claims. Please, check the audience and issuer.')
+
+    def test_drinks_etag_changes_with_a_write(self):
+        res = self.client().get('/drinks')
+        etag = res.headers['ETag']
+
+        self.assertEqual(res.status_code, 200)
+        # the revalidation is answered from the tag of this process
+        with assert_max_queries(0):
+            res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        self.client().post('/drinks', headers=self.headers('post:drinks'), json={
+            'title': 'Water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]})
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual([drink['title'] for drink in res.get_json()['drinks']], ['Water'])
+        self.assertEqual(self.client().get(
+            '/drinks', headers={'If-None-Match': res.headers['ETag']}).status_code, 304)
+
+    def test_write_of_another_process_shows_after_the_ttl(self):
+        etag = self.client().get('/drinks').headers['ETag']
+        with api.app.app_context():
+            # what another worker process leaves behind, a new tag in the database only
+            models.bump_table_version('drinks')
+            db.session.commit()
+
+        self.assertEqual(self.client().get('/drinks', headers={'If-None-Match': etag}).status_code, 304)
+        tag, read_at = models.table_versions['drinks']
+        models.table_versions['drinks'] = (tag, read_at - models.TABLE_VERSION_TTL)
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_patched_recipe_is_returned(self):
+        recipe = [{'name': 'water', 'color': 'blue', 'parts': 1}]
+        drink = self.client().post('/drinks', headers=self.headers('post:drinks'), json={
+            'title': 'Water', 'recipe': recipe}).get_json()['drinks'][0]
+        # the encoded drink is cached now
+        self.client().get('/drinks-detail', headers=self.headers('get:drinks-detail'))
+
+        new_recipe = [{'name': 'sparkling water', 'color': 'white', 'parts': 2}]
+        res = self.client().patch('/drinks/%d' % drink['id'], headers=self.headers('patch:drinks'),
+                                  json={'recipe': new_recipe})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['drinks'][0]['recipe'], new_recipe)
+        drinks = self.client().get('/drinks-detail', headers=self.headers('get:drinks-detail')).get_json()['drinks']
+        self.assertEqual(drinks, [{'id': drink['id'], 'title': 'Water', 'recipe': new_recipe}])
+        drinks = self.client().get('/drinks').get_json()['drinks']
+        self.assertEqual(drinks[0]['recipe'], [{'color': 'white', 'parts': 2}])
+
+    def test_unknown_permission_is_refused_when_the_route_is_defined(self):
+        with self.assertRaisesRegex(ValueError, "unknown permission 'post:drink'"):
+            auth.requires_auth('post:drink')
+
+    def test_unguarded_write_route_is_refused_at_startup(self):
+        app = Flask('unguarded')
+
+        @app.route('/drinks', methods=['GET', 'POST'])
+        def drinks():
+            return ''
+
+        with self.assertRaisesRegex(ValueError, 'routes without a permission: POST /drinks'):
+            auth.validate_route_permissions(app)
+
+    def test_endpoint_permissions(self):
+        self.assertEqual(api.ENDPOINT_PERMISSIONS, {
+            ('GET', '/drinks-detail'): 'get:drinks-detail',
+            ('POST', '/drinks'): 'post:drinks',
+            ('PATCH', '/drinks/<int:id>'): 'patch:drinks',
+            ('DELETE', '/drinks/<int:id>'): 'delete:drinks',
+        })
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import os
-from flask import Flask
-from models import setup_db
+from flask import Flask, jsonify
+from fsnd_common.dbpool import pool_stats
+from models import setup_db, db
 
 def create_app(test_config=None):
 
@@ -19,6 +20,11 @@ def create_app(test_config=None):
     def be_cool():
         return "Be cool, man, be coooool! You're almost a FSND grad!"
 
+    # connection pool counters of this process, a growing wait time means the pool is too small
+    @app.route('/db/stats')
+    def db_stats():
+        return jsonify(pool_stats(db.engine))
+
     return app
 
 app = create_app()
@@ -1,5 +1,6 @@
 from sqlalchemy import Column, String, create_engine
 from flask_sqlalchemy import SQLAlchemy
+from fsnd_common.dbpool import configure_pool
 import json
 
 database_path = os.environ['DATABASE_URL']
@@ -13,6 +14,9 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # the connection pool is set up from the DB_POOL_* environment variables, see fsnd_common/dbpool.py
+    # in projects/common (pip install -e projects/common)
+    configure_pool(app)
     db.app = app
     db.init_app(app)
     db.create_all()
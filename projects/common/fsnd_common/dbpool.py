@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+# connection pool settings: app config key, type, default (the SQLAlchemy defaults, except recycle).
+# each one can also come from the environment variable of the same name, the app config wins.
+POOL_SETTINGS = {
+    # connections kept open per process
+    'pool_size': ('DB_POOL_SIZE', int, 5),
+    # connections opened on top of pool_size under load, closed again when they are returned
+    'max_overflow': ('DB_MAX_OVERFLOW', int, 10),
+    # seconds a request waits for a connection before giving up with a TimeoutError
+    'pool_timeout': ('DB_POOL_TIMEOUT', float, 30),
+    # seconds after which a connection is replaced, below the server's (or a proxy's) idle timeout
+    'pool_recycle': ('DB_POOL_RECYCLE', int, 1800),
+    # test each connection with a round trip when it's checked out, only needed if connections get
+    # dropped behind the app's back faster than pool_recycle
+    'pool_pre_ping': ('DB_POOL_PRE_PING', bool, False),
+}
+
+
+def setting(config, key, type, default):
+    value = config.get(key, os.environ.get(key))
+    if value is None or value == '':
+        return default
+    if type is bool and isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return type(value)
+
+
+def pool_options(config):
+    # the create_engine pool options for the SQLALCHEMY_DATABASE_URI of config. sqlite keeps the pool of its
+    # dialect: its connections can't move between threads, which a QueuePool would do
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).drivername.startswith('sqlite'):
+        return {}
+
+    options = {name: setting(config, key, type, default)
+               for name, (key, type, default) in POOL_SETTINGS.items()}
+    options['poolclass'] = TimedQueuePool
+    return options
+
+
+def configure_pool(app):
+    # puts the pool options in SQLALCHEMY_ENGINE_OPTIONS, before SQLAlchemy.init_app. flask_sqlalchemy 2 reads
+    # them when it creates the engine, so call it again after changing SQLALCHEMY_DATABASE_URI
+    options = {name: value for name, value in (app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}).items()
+               if name not in POOL_SETTINGS and name != 'poolclass'}
+    options.update(pool_options(app.config))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+# the /metrics series of the pool_stats counters: key -> (prometheus type, help). the counters only go up
+# from the start of the process, the gauges are the state of the pool when it's scraped
+POOL_METRICS = {
+    'pool_size': ('gauge', 'Connections the pool keeps open.'),
+    'checked_out': ('gauge', 'Connections in use.'),
+    'overflow': ('gauge', 'Connections open on top of the pool size.'),
+    'checkouts': ('counter', 'Connection checkouts.'),
+    'timeouts': ('counter', 'Checkouts that gave up waiting for a free connection.'),
+    'wait_seconds_total': ('counter', 'Time spent checking out connections, waiting for a free one included.'),
+    'wait_seconds_max': ('gauge', 'Longest connection checkout.'),
+    'wait_seconds_avg': ('gauge', 'Average connection checkout time.'),
+}
+
+
+class TimedQueuePool(QueuePool):
+    # a QueuePool counting its checkouts and the time they took, waiting for a free connection included,
+    # so a pool that is too small for the number of threads shows up as wait time instead of slow queries
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "pool_size": self.size(),
+                "checked_out": self.checkedout(),
+                "overflow": max(0, self.overflow()),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "wait_seconds_max": round(self.max_wait_seconds, 6),
+                "wait_seconds_avg": round(self.wait_seconds / self.checkouts, 6) if self.checkouts else 0.0,
+            }
+
+
+def pool_stats(engine):
+    # the pool counters of this process, only the pool class for pools that don't keep them (sqlite)
+    pool = engine.pool
+    stats = {"pool": pool.__class__.__name__}
+    if isinstance(pool, TimedQueuePool):
+        stats.update(pool.stats())
+    return stats
+
+
+def pool_metrics(engine, prefix='db_'):
+    # the pool counters as the (name, type, help, value) series of init_metrics, none for sqlite.
+    # the names of the counters end in _total, as prometheus expects
+    stats = pool_stats(engine)
+    series = []
+    for key, (type, help) in POOL_METRICS.items():
+        if key in stats:
+            name = prefix + key
+            if type == 'counter' and not name.endswith('_total'):
+                name += '_total'
+            series.append((name, type, help, stats[key]))
+    return series
@@ -0,0 +1,118 @@
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+# the key fields jwt.decode needs
+KEY_FIELDS = ('kty', 'kid', 'use', 'n', 'e')
+
+
+'''
+JWKS sources
+    a source is any callable returning the parsed jwks.json document ({'keys': [...]}),
+    url_source for the Auth0 endpoint (or a local stub server), file_source for a file on disk
+'''
+def url_source(url, timeout=5):
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    return fetch
+
+
+def file_source(path):
+    def fetch():
+        with open(path) as jwks_file:
+            return json.load(jwks_file)
+    return fetch
+
+
+def jwks_source(location):
+    # file:// urls and plain paths are read from disk, anything else is fetched over http(s)
+    parsed = urlparse(location)
+    if parsed.scheme == 'file':
+        return file_source(parsed.path)
+    if parsed.scheme in ('http', 'https'):
+        return url_source(location)
+    return file_source(location)
+
+
+'''
+JWKSCache
+    the signing keys of a jwks source by kid, so verifying a token doesn't fetch jwks.json every time.
+
+    the keys are fetched on the first lookup and kept for ttl seconds. a lookup in the last refresh_ahead
+    seconds of that starts a refresh in a background thread and keeps answering from the current keys,
+    a lookup after it refreshes in the foreground. an unknown kid (the keys were rotated) refetches at most
+    once per min_refetch_interval seconds, so tokens with made up kids can't hammer the source.
+    concurrent refreshes are single flight: the threads that wait on a running fetch use its result.
+    a failed fetch keeps the previous keys and isn't retried for min_refetch_interval seconds either.
+'''
+class JWKSCache:
+    def __init__(self, source, ttl=600, refresh_ahead=60, min_refetch_interval=10):
+        self.source = source
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.min_refetch_interval = min_refetch_interval
+        self.keys = {}
+        self.fetched_at = None
+        self.generation = 0
+        self.failed_at = None
+        self.fetch_lock = threading.Lock()
+        self.background_refresh = None
+
+    def age(self):
+        return None if self.fetched_at is None else time.monotonic() - self.fetched_at
+
+    def refresh(self, seen_generation=None):
+        # fetches the keys unless another thread fetched them while this one waited for the lock,
+        # returns False if the fetch failed
+        if seen_generation is None:
+            seen_generation = self.generation
+
+        with self.fetch_lock:
+            if self.generation != seen_generation:
+                return True
+            if self.failed_at is not None and time.monotonic() - self.failed_at < self.min_refetch_interval:
+                return False
+
+            try:
+                jwks = self.source()
+                keys = {key['kid']: {field: key.get(field) for field in KEY_FIELDS}
+                        for key in jwks['keys'] if 'kid' in key}
+            except Exception:
+                logger.exception('could not fetch the jwks keys')
+                self.failed_at = time.monotonic()
+                return False
+
+            self.failed_at = None
+            self.keys = keys
+            self.fetched_at = time.monotonic()
+            self.generation += 1
+            return True
+
+    def refresh_in_background(self):
+        if self.background_refresh is not None and self.background_refresh.is_alive():
+            return
+        self.background_refresh = threading.Thread(
+            target=self.refresh, args=(self.generation,), daemon=True)
+        self.background_refresh.start()
+
+    def get_key(self, kid):
+        # the key fields of kid, None if the source doesn't have it
+        generation = self.generation
+        age = self.age()
+
+        if age is None or age >= self.ttl:
+            self.refresh(generation)
+        elif age >= self.ttl - self.refresh_ahead:
+            self.refresh_in_background()
+
+        key = self.keys.get(kid)
+        if key is None and (self.age() is None or self.age() >= self.min_refetch_interval):
+            self.refresh(self.generation)
+            key = self.keys.get(kid)
+        return key
@@ -0,0 +1,212 @@
+import bisect
+import threading
+import time
+import weakref
+
+from flask import Response, g, has_app_context, request
+
+# upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the route label of the requests that didn't match any route, so random urls don't each get their own series
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class Shard:
+    # the metrics of one thread, only that thread writes them so the requests don't take any lock.
+    # /metrics sums the shards of all the threads, when a thread exits its shard goes to the next new one
+    def __init__(self):
+        self.in_flight = 0
+        # (route, method, status) -> requests
+        self.requests = {}
+        # (route, method) -> [requests per bucket..., requests over the last bucket, latency sum]
+        self.latency = {}
+        # (route, method) -> seconds
+        self.db_seconds = {}
+        self.template_seconds = {}
+
+    def observe(self, route, method, status, seconds, db_seconds, template_seconds):
+        key = (route, method, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+        key = (route, method)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+        self.db_seconds[key] = self.db_seconds.get(key, 0.0) + db_seconds
+        self.template_seconds[key] = self.template_seconds.get(key, 0.0) + template_seconds
+
+
+class ShardOwner:
+    # held only by the thread local of the thread writing the shard
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+def labels(**values):
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in values.items()) + '}'
+
+
+class Metrics:
+    # per route latency histograms, status counters, db and template time and in-flight requests of this
+    # process, in the prometheus text format at /metrics. with several worker processes each one has its own,
+    # prometheus adds them up when it scrapes every worker (or the counters of one worker are a sample).
+    #
+    # the db time comes from the querystats counter of the request, series() returns the
+    # (name, type, help, value) of any other series to export, ex: dbpool.pool_metrics
+
+    def __init__(self, series=None):
+        self.series = series
+        self.local = threading.local()
+        # werkzeug's dev server starts a thread per connection, so the shards of the threads that exited are
+        # reused rather than adding one per thread, there are only as many as the most threads alive at once.
+        # list append and pop are atomic, so neither takes a lock
+        self.shards = []
+        self.free_shards = []
+
+    def shard(self):
+        try:
+            return self.local.owner.shard
+        except AttributeError:
+            pass
+        try:
+            shard = self.free_shards.pop()
+        except IndexError:
+            shard = Shard()
+            self.shards.append(shard)
+        # the thread's locals are dropped when it exits, which hands its shard back
+        owner = self.local.owner = ShardOwner(shard)
+        weakref.finalize(owner, self.free_shards.append, shard)
+        return shard
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+
+        # the time spent rendering templates, render_template calls Template.render once per page
+        base_template = app.jinja_env.template_class
+
+        class TimedTemplate(base_template):
+            def render(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return super().render(*args, **kwargs)
+                finally:
+                    # a template can be rendered outside of a request, ex: from a cli command
+                    if has_app_context():
+                        context = g._get_current_object()
+                        context.template_seconds = context.get('template_seconds', 0.0) + time.perf_counter() - start
+
+        app.jinja_env.template_class = TimedTemplate
+
+        # the request state is a single [start time, recorded] list in g, the context locals are slow to
+        # look up compared to the rest of the bookkeeping
+        @app.before_request
+        def start_request_metrics():
+            g.request_metrics = [time.perf_counter(), False]
+            self.shard().in_flight += 1
+
+        @app.after_request
+        def record_request_metrics(response):
+            self.record(g._get_current_object(), response.status_code)
+            return response
+
+        @app.teardown_request
+        def end_request_metrics(error=None):
+            context = g._get_current_object()
+            state = context.get('request_metrics')
+            if state is None:
+                return
+            # after_request doesn't run when a view raises an exception no error handler takes
+            if not state[1]:
+                self.record(context, 500)
+            self.shard().in_flight -= 1
+
+        @app.route('/metrics')
+        def metrics():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def record(self, context, status):
+        state = context.get('request_metrics')
+        if state is None:
+            return
+        state[1] = True
+        seconds = time.perf_counter() - state[0]
+        counter = context.get('query_counter')
+        current_request = request._get_current_object()
+        url_rule = current_request.url_rule
+        self.shard().observe(url_rule.rule if url_rule is not None else UNMATCHED_ROUTE, current_request.method, status,
+                             seconds, counter.seconds if counter is not None else 0.0,
+                             context.get('template_seconds', 0.0))
+
+    def collect(self):
+        # the shards summed up, copying a dict doesn't let the thread owning it in between
+        requests, latency, db_seconds, template_seconds = {}, {}, {}, {}
+        in_flight = 0
+        for shard in list(self.shards):
+            in_flight += shard.in_flight
+            for key, count in dict(shard.requests).items():
+                requests[key] = requests.get(key, 0) + count
+            for key, histogram in dict(shard.latency).items():
+                histogram = list(histogram)
+                total = latency.get(key)
+                latency[key] = histogram if total is None else [a + b for a, b in zip(total, histogram)]
+            for totals, seconds in ((db_seconds, shard.db_seconds), (template_seconds, shard.template_seconds)):
+                for key, value in dict(seconds).items():
+                    totals[key] = totals.get(key, 0.0) + value
+        return requests, latency, db_seconds, template_seconds, in_flight
+
+    def render(self):
+        requests, latency, db_seconds, template_seconds, in_flight = self.collect()
+        lines = [
+            '# HELP http_requests_total Requests by route, method and status code.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append('http_requests_total%s %d' % (labels(route=route, method=method, status=status), count))
+
+        lines += [
+            '# HELP http_request_duration_seconds Request latency by route and method.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (route, method), histogram in sorted(latency.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram):
+                cumulative += count
+                lines.append('http_request_duration_seconds_bucket%s %d' % (
+                    labels(route=route, method=method, le=bound), cumulative))
+            lines.append('http_request_duration_seconds_sum%s %.6f' % (
+                labels(route=route, method=method), histogram[-1]))
+            lines.append('http_request_duration_seconds_count%s %d' % (
+                labels(route=route, method=method), cumulative))
+
+        for name, help, totals in (
+                ('http_request_db_seconds_total', 'Time spent in database queries by route and method.', db_seconds),
+                ('http_request_template_seconds_total', 'Time spent rendering templates by route and method.',
+                 template_seconds)):
+            lines += ['# HELP %s %s' % (name, help), '# TYPE %s counter' % name]
+            for (route, method), seconds in sorted(totals.items()):
+                lines.append('%s%s %.6f' % (name, labels(route=route, method=method), seconds))
+
+        lines += [
+            '# HELP http_requests_in_flight Requests being handled.',
+            '# TYPE http_requests_in_flight gauge',
+            'http_requests_in_flight %d' % in_flight,
+        ]
+
+        if self.series is not None:
+            for name, type, help, value in self.series():
+                lines += ['# HELP %s %s' % (name, help), '# TYPE %s %s' % (name, type), '%s %s' % (name, value)]
+
+        return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app, series=None):
+    metrics = Metrics(series)
+    metrics.init_app(app)
+    return metrics
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# queries slower than this many milliseconds are logged with their call site, SLOW_QUERY_MS in the app config
+SLOW_QUERY_MS = 200
+
+# the frames of the standard library and of this module are skipped when looking for the line that ran a
+# slow query, as are those of the installed packages
+SKIPPED_PATHS = (os.path.dirname(os.path.dirname(logging.__file__)) + os.sep, os.path.abspath(__file__))
+
+# the counters of the assert_max_queries blocks running in this thread
+local = threading.local()
+
+
+class QueryCounter:
+    # the statements sent to the database and the time they took
+    def __init__(self, keep_statements=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = [] if keep_statements else None
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+def active_counters():
+    # the counter of the current request (in flask.g) and those of the assert_max_queries blocks
+    counters = list(getattr(local, 'counters', ()))
+    if has_request_context():
+        counter = g.get('query_counter')
+        if counter is not None:
+            counters.append(counter)
+    return counters
+
+
+def call_site():
+    # "file:line in function" of the innermost frame outside sqlalchemy, flask and the standard library
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if frame.filename.startswith(SKIPPED_PATHS) or 'site-packages' in frame.filename \
+                or 'dist-packages' in frame.filename:
+            continue
+        return '%s:%d in %s' % (frame.filename, frame.lineno, frame.name)
+    return 'unknown'
+
+
+# the listeners are on the Engine class, so they see every engine, including those created after a
+# SQLALCHEMY_DATABASE_URI change
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+    if context is not None:
+        context.query_timed = True
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    seconds = time.perf_counter() - start_times.pop()
+
+    for counter in active_counters():
+        counter.record(statement, seconds)
+
+    threshold = current_app.config.get('SLOW_QUERY_MS', SLOW_QUERY_MS) if has_app_context() else SLOW_QUERY_MS
+    if threshold is not None and seconds * 1000 >= threshold:
+        (current_app.logger if has_app_context() else logger).warning(
+            'slow query (%.1f ms) at %s: %s', seconds * 1000, call_site(), ' '.join(statement.split()))
+
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(exception_context):
+    # a failed statement never gets to after_cursor_execute, its start time has to go here or it would be
+    # taken for the start of the next statement on that (pooled) connection
+    connection = exception_context.connection
+    context = exception_context.execution_context
+    if connection is not None and getattr(context, 'query_timed', False):
+        start_times = connection.info.get('query_start_time')
+        if start_times:
+            start_times.pop()
+
+
+def init_query_stats(app):
+    # counts the queries of every request and reports them in a Server-Timing header, ex:
+    #   Server-Timing: db;dur=12.3;desc="4 queries"
+    # (the browser devtools show it in the request timing). queries run while a streamed response is
+    # being sent come after the header and aren't in it
+    @app.before_request
+    def start_query_counter():
+        g.query_counter = QueryCounter()
+
+    @app.after_request
+    def add_server_timing(response):
+        counter = g.get('query_counter')
+        if counter is not None:
+            response.headers.add('Server-Timing', 'db;dur=%.1f;desc="%d queries"' % (
+                counter.seconds * 1000, counter.count))
+        return response
+
+
+@contextmanager
+def count_queries(keep_statements=False):
+    # the QueryCounter of the queries the block sends to the database from this thread, ex:
+    #   with count_queries() as counter:
+    #       client.get('/questions')
+    #   counter.count, counter.seconds
+    counter = QueryCounter(keep_statements)
+    counters = local.__dict__.setdefault('counters', [])
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+@contextmanager
+def assert_max_queries(n):
+    # fails with the statements that ran if the block sends more than n queries to the database, ex:
+    #   with assert_max_queries(3):
+    #       client.get('/questions')
+    with count_queries(keep_statements=True) as counter:
+        yield counter
+
+    if counter.count > n:
+        raise AssertionError('%d queries, expected at most %d:\n%s' % (
+            counter.count, n, '\n'.join(counter.statements)))
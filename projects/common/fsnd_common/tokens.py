@@ -0,0 +1,66 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+VerifiedTokenCache
+    the decoded payloads of the tokens that passed verify_decode_jwt, so a client sending the same bearer
+    token again skips the RS256 signature check. the entries are keyed by the sha256 of the token (the
+    tokens themselves aren't kept) and hold the payload and its permissions as a frozenset, or None if the
+    token has no permissions claim.
+
+    an entry is dropped when the token expires (its exp claim) or max_age seconds after it was verified,
+    whichever comes first, max_age bounds how long a token signed by a since removed key is still accepted.
+    past max_entries the least recently used entry is dropped, max_entries 0 turns the cache off.
+'''
+class VerifiedTokenCache:
+    def __init__(self, max_entries=1024, max_age=300):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        # (payload, permissions) of a verified token still valid, None otherwise
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, token, payload):
+        # caches the payload of a token that was just verified, returns its (payload, permissions)
+        permissions = frozenset(payload['permissions']) if isinstance(
+            payload.get('permissions'), list) else None
+        expires_at = time.time() + self.max_age
+        if 'exp' in payload:
+            expires_at = min(expires_at, payload['exp'])
+
+        if self.max_entries > 0:
+            with self.lock:
+                key = self.key(token)
+                self.entries[key] = (expires_at, payload, permissions)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+        return payload, permissions
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
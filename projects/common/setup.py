@@ -0,0 +1,10 @@
+from setuptools import setup
+
+# the database, query, metrics and auth helpers the apps share, installed into each app's
+# virtualenv with "pip install -e" (their requirements.txt point here). flask and flask_sqlalchemy come
+# from the app's own requirements
+setup(
+    name='fsnd-common',
+    version='0.1.0',
+    packages=['fsnd_common'],
+)
@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from fsnd_common.jwks import JWKSCache, file_source, jwks_source
+
+
+def jwks(*kids):
+    return {'keys': [{'kty': 'RSA', 'kid': kid, 'use': 'sig', 'alg': 'RS256', 'n': 'n-' + kid, 'e': 'AQAB'}
+                     for kid in kids]}
+
+
+class StubSource:
+    """a jwks source returning the documents it's given in turn (the last one again once they run out),
+    counting the fetches. a document can be an exception to raise, fetches wait while `released` is clear"""
+
+    def __init__(self, *documents):
+        self.documents = list(documents)
+        self.fetches = 0
+        self.released = threading.Event()
+        self.released.set()
+
+    def __call__(self):
+        self.released.wait(5)
+        self.fetches += 1
+        document = self.documents[min(self.fetches, len(self.documents)) - 1]
+        if isinstance(document, Exception):
+            raise document
+        return document
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """The jwks signing key cache"""
+
+    def test_file_source(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'jwks.json')
+        with open(path, 'w') as jwks_file:
+            json.dump(jwks('a'), jwks_file)
+
+        cache = JWKSCache(file_source(path))
+
+        self.assertEqual(cache.get_key('a'), {'kty': 'RSA', 'kid': 'a', 'use': 'sig', 'n': 'n-a', 'e': 'AQAB'})
+        self.assertEqual(JWKSCache(jwks_source('file://' + path)).get_key('a')['n'], 'n-a')
+        self.assertEqual(JWKSCache(jwks_source(path)).get_key('a')['n'], 'n-a')
+
+    def test_keys_are_fetched_once(self):
+        source = StubSource(jwks('a'))
+        cache = JWKSCache(source)
+
+        for _ in range(10):
+            self.assertIsNotNone(cache.get_key('a'))
+
+        self.assertEqual(source.fetches, 1)
+
+    def test_unknown_kid_refetches_the_rotated_keys(self):
+        source = StubSource(jwks('a'), jwks('a', 'b'))
+        cache = JWKSCache(source, min_refetch_interval=0)
+
+        cache.get_key('a')
+        key = cache.get_key('b')
+
+        self.assertEqual(key['kid'], 'b')
+        self.assertEqual(source.fetches, 2)
+
+    def test_unknown_kid_refetches_at_most_once_per_interval(self):
+        source = StubSource(jwks('a'))
+        cache = JWKSCache(source, min_refetch_interval=60)
+
+        cache.get_key('a')
+        for kid in ('made-up-1', 'made-up-2', 'made-up-3'):
+            self.assertIsNone(cache.get_key(kid))
+
+        self.assertEqual(source.fetches, 1)
+
+    def test_concurrent_fetches_are_single_flight(self):
+        source = StubSource(jwks('a'))
+        source.released.clear()
+        cache = JWKSCache(source)
+        keys = []
+
+        threads = [threading.Thread(target=lambda: keys.append(cache.get_key('a'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        # every thread is either fetching or waiting on the fetch by now
+        time.sleep(0.1)
+        source.released.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(source.fetches, 1)
+        self.assertEqual([key['kid'] for key in keys], ['a'] * 8)
+
+    def test_refresh_ahead_runs_in_the_background(self):
+        # every lookup is within refresh_ahead of the ttl, so the second one starts a background refresh
+        source = StubSource(jwks('a'), jwks('a', 'b'))
+        cache = JWKSCache(source, ttl=60, refresh_ahead=60)
+        cache.get_key('a')
+
+        source.released.clear()
+        # answered from the current keys while the refresh waits on the source
+        self.assertEqual(cache.get_key('a')['kid'], 'a')
+        self.assertIsNone(cache.keys.get('b'))
+
+        source.released.set()
+        cache.background_refresh.join(5)
+
+        self.assertEqual(source.fetches, 2)
+        self.assertEqual(cache.get_key('b')['kid'], 'b')
+
+    def test_failed_fetch_keeps_the_keys_and_backs_off(self):
+        source = StubSource(jwks('a'), ValueError('jwks endpoint down'))
+        cache = JWKSCache(source, ttl=0, min_refetch_interval=60)
+        cache.get_key('a')
+
+        # the keys are expired on every lookup, the failed refetch leaves the previous ones in place
+        with self.assertLogs('fsnd_common.jwks', 'ERROR'):
+            self.assertEqual(cache.get_key('a')['kid'], 'a')
+        self.assertEqual(cache.get_key('a')['kid'], 'a')
+        self.assertEqual(source.fetches, 2)
+
+        # once min_refetch_interval went by the source is tried again
+        cache.failed_at -= 60
+        with self.assertLogs('fsnd_common.jwks', 'ERROR'):
+            cache.get_key('a')
+        self.assertEqual(source.fetches, 3)
+
+    def test_failed_first_fetch(self):
+        source = StubSource(ValueError('jwks endpoint down'), jwks('a'))
+        cache = JWKSCache(source, min_refetch_interval=60)
+
+        with self.assertLogs('fsnd_common.jwks', 'ERROR'):
+            self.assertIsNone(cache.get_key('a'))
+        self.assertIsNone(cache.get_key('a'))
+        self.assertEqual(source.fetches, 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
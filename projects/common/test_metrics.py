@@ -0,0 +1,53 @@
+import re
+import unittest
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from fsnd_common.dbpool import TimedQueuePool, pool_metrics
+from fsnd_common.metrics import init_metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    """The /metrics page, with the series of a connection pool"""
+
+    def setUp(self):
+        # an in-memory database per connection, only the pool counters matter here
+        self.engine = create_engine('sqlite://', poolclass=TimedQueuePool)
+        app = Flask(__name__)
+        init_metrics(app, series=lambda: pool_metrics(self.engine))
+
+        @app.route('/ping')
+        def ping():
+            with self.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return 'pong'
+
+        self.client = app.test_client
+
+    def test_pool_counters_are_exported_as_counters(self):
+        self.client().get('/ping')
+        self.client().get('/ping')
+
+        page = self.client().get('/metrics').data.decode()
+
+        self.assertIn('# TYPE db_checkouts_total counter\ndb_checkouts_total 2\n', page)
+        self.assertIn('# TYPE db_timeouts_total counter\ndb_timeouts_total 0\n', page)
+        self.assertIn('# TYPE db_wait_seconds_total counter\n', page)
+        self.assertIn('# TYPE db_checked_out gauge\ndb_checked_out 0\n', page)
+        self.assertIn('http_requests_total{route="/ping",method="GET",status="200"} 2\n', page)
+
+    def test_every_series_has_help_and_type(self):
+        page = self.client().get('/metrics').data.decode()
+
+        helps = re.findall(r'^# HELP (\S+) \S', page, re.M)
+        self.assertEqual(re.findall(r'^# TYPE (\S+) ', page, re.M), helps)
+        self.assertIn('db_wait_seconds_max', helps)
+
+    def test_sqlite_default_pool_has_no_series(self):
+        self.assertEqual(pool_metrics(create_engine('sqlite://')), [])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import time
+import unittest
+from unittest import mock
+
+from fsnd_common.tokens import VerifiedTokenCache
+
+
+def payload(audience='dev', permissions=('get:drinks-detail',), expires_in=3600):
+    return {'aud': audience, 'sub': 'user', 'exp': int(time.time()) + expires_in, 'permissions': list(permissions)}
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    """The cache of the verified bearer tokens"""
+
+    def test_cached_token(self):
+        cache = VerifiedTokenCache()
+        verified = cache.set('token', payload())
+
+        self.assertEqual(cache.get('token'), verified)
+        self.assertEqual(verified[1], frozenset(['get:drinks-detail']))
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_token_without_permissions_claim(self):
+        cache = VerifiedTokenCache()
+        cache.set('token', {'aud': 'dev', 'exp': int(time.time()) + 3600})
+
+        self.assertIsNone(cache.get('token')[1])
+
+    def test_expires_with_exp(self):
+        cache = VerifiedTokenCache(max_age=300)
+        cache.set('token', payload(expires_in=10))
+
+        with mock.patch('time.time', return_value=time.time() + 11):
+            self.assertIsNone(cache.get('token'))
+        # the expired entry is gone, not only skipped
+        self.assertEqual(len(cache.entries), 0)
+
+    def test_expires_after_max_age(self):
+        cache = VerifiedTokenCache(max_age=60)
+        cache.set('token', payload(expires_in=3600))
+
+        with mock.patch('time.time', return_value=time.time() + 30):
+            self.assertIsNotNone(cache.get('token'))
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get('token'))
+
+    def test_least_recently_used_token_is_dropped(self):
+        cache = VerifiedTokenCache(max_entries=2)
+        cache.set('a', payload())
+        cache.set('b', payload())
+        cache.get('a')
+        cache.set('c', payload())
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_max_entries_0_turns_the_cache_off(self):
+        cache = VerifiedTokenCache(max_entries=0)
+        verified = cache.set('token', payload())
+
+        self.assertEqual(verified[1], frozenset(['get:drinks-detail']))
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(len(cache.entries), 0)
+
+    def test_tokens_are_cached_apart(self):
+        # another token of the same user, for another audience or with other permissions, is never
+        # answered from the entry of the first one
+        cache = VerifiedTokenCache()
+        cache.set('token for dev', payload(audience='dev', permissions=['get:drinks-detail']))
+
+        self.assertIsNone(cache.get('token for prod'))
+        self.assertIsNone(cache.get('token with post:drinks'))
+        self.assertEqual(cache.get('token for dev')[0]['aud'], 'dev')
+        self.assertEqual(cache.get('token for dev')[1], frozenset(['get:drinks-detail']))
+
+    def test_tokens_are_kept_hashed(self):
+        cache = VerifiedTokenCache()
+        cache.set('secret token', payload())
+
+        self.assertNotIn('secret token', [key for key in cache.entries])
+        self.assertEqual(list(cache.entries), [VerifiedTokenCache.key('secret token')])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()